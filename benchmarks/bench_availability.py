@@ -0,0 +1,61 @@
+""" Search of the available slots of a restaurant over a month (every 15 minutes)
+
+Compares available_slots (one remote call, one query and a sweep for each table)
+with asking get_a_table for each slot, as the front end did with POST /bookings.
+The restaurant microservice is mocked, so only the work of this service is measured.
+
+    $ PYTHONPATH=. python benchmarks/bench_availability.py [--days D] [--bookings N] [--repeat R]
+"""
+
+import argparse
+import datetime
+import random
+import time
+
+from bookings.app import create_app
+from bookings.utils import available_slots, get_a_table, add_bookings
+
+def best_of(repeat, function):
+    """ Return the best time (in ms) of repeat calls and the last result """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        elapsed = (time.perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--days", type=int, default=30, help="length of the period")
+    parser.add_argument("--bookings", type=int, default=1000, help="bookings of the restaurant in the period")
+    parser.add_argument("--repeat", type=int, default=5, help="runs for each implementation (the best is reported)")
+    args = parser.parse_args()
+
+    app = create_app("BENCHMARK").app
+    app.config["USE_MOCKS"] = True # restaurant 3: 3 tables, open 0-23, occupation time 2 hours
+    begin = datetime.datetime.now().replace(hour=0,minute=0,second=0,microsecond=0) + datetime.timedelta(days=1)
+    end = begin + datetime.timedelta(days=args.days)
+    step = datetime.timedelta(minutes=15)
+
+    random.seed(42)
+    with app.app_context():
+        add_bookings([
+            (1, 3, 2, begin + datetime.timedelta(minutes=15*random.randint(0, args.days*96)), random.choice([4,5,6]))
+            for _ in range(args.bookings)
+        ])
+
+        slots = int((end - begin) / step) + 1
+        results = {}
+        results["available_slots"] = best_of(args.repeat, lambda: available_slots(3, 2, begin, end, step))
+        results["get_a_table for each slot"] = best_of(1, lambda: [begin + i*step for i in range(slots) if get_a_table(3, 2, begin + i*step) > 0])
+
+    assert results["available_slots"][1] == results["get_a_table for each slot"][1], "the slots are different"
+
+    print("%d days, %d slots, %d bookings, %d available" % (args.days, slots, args.bookings, len(results["available_slots"][1])))
+    baseline = results["get_a_table for each slot"][0]
+    for name, (elapsed, _) in results.items():
+        print("%-28s %9.1f ms  (x%.1f)" % (name, elapsed, baseline / elapsed))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+""" Contact tracing of random positive users on a large database of random bookings
+
+Compares find_contacts (a query for the visits and one for the entrances around them at each hop,
+then a sweep in memory) with the way the health authority did it through the API:
+GET /bookings?user= and then GET /bookings?rest=&begin_entrance=&end_entrance= for each visit
+(here the same queries are run in process, so the HTTP round trips are not even counted).
+The restaurant microservice is mocked with the random restaurants of the bookings.
+
+    $ PYTHONPATH=. python benchmarks/bench_contacts.py [--rows N] [--restaurants N] [--users N] [--positives N] [--depth D]
+"""
+
+import argparse
+import datetime
+import random
+import time
+
+from bookings.app import create_app
+from bookings.orm import db, Booking
+from bookings.contacts import find_contacts
+from bookings.fake_data import fake_restaurants, put_fake_bookings
+from bookings.utils import get_restaurant
+
+def naive_contacts(user_id, begin, end, depth):
+    """ The contacts found with a query for the bookings of each user and one for the entrances around each visit """
+    found = {user_id: (0, begin)}
+    frontier = {user_id: begin}
+    for hop in range(1, depth+1):
+        met = {}
+        for user, since in frontier.items():
+            for visit in db.session.query(Booking).filter(Booking.user_id == user).all(): # GET /bookings?user=
+                if visit.entrance_datetime is None or not since <= visit.entrance_datetime <= end:
+                    continue
+                occupation = datetime.timedelta(hours=int(get_restaurant(visit.restaurant_id)["occupation_time"]))
+                for b in db.session.query(Booking).filter( # GET /bookings?rest=&begin_entrance=&end_entrance=
+                        Booking.restaurant_id == visit.restaurant_id,
+                        Booking.entrance_datetime >= visit.entrance_datetime - occupation,
+                        Booking.entrance_datetime <= visit.entrance_datetime + occupation).all():
+                    if b.user_id in found or abs(b.entrance_datetime - visit.entrance_datetime) >= occupation:
+                        continue
+                    contact = max(b.entrance_datetime, visit.entrance_datetime)
+                    if b.user_id not in met or contact < met[b.user_id]:
+                        met[b.user_id] = contact
+        for user, contact in met.items():
+            found[user] = (hop, contact)
+        frontier = met
+    del found[user_id]
+    return found
+
+def timed(function, *args):
+    """ Return the time (in ms) of a call and its result """
+    start = time.perf_counter()
+    result = function(*args)
+    return (time.perf_counter() - start) * 1000, result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=2000000, help="random bookings in the database")
+    parser.add_argument("--restaurants", type=int, default=1000, help="random restaurants of the bookings")
+    parser.add_argument("--users", type=int, default=100000, help="users making the bookings")
+    parser.add_argument("--positives", type=int, default=20, help="random positive users traced")
+    parser.add_argument("--depth", type=int, default=2, help="hops followed")
+    parser.add_argument("--days", type=int, default=14, help="days of the period traced (before today)")
+    args = parser.parse_args()
+
+    app = create_app("BENCHMARK").app
+    app.config["USE_MOCKS"] = True
+    app.extensions["fake_world"] = world = fake_restaurants(args.restaurants)
+    end = datetime.datetime.now()
+    begin = end - datetime.timedelta(days=args.days)
+
+    with app.app_context():
+        db.session.query(Booking).delete()
+        db.session.commit()
+        start = time.perf_counter()
+        put_fake_bookings(args.rows, users=args.users, world=world)
+        print("%d bookings inserted in %.1f s" % (args.rows, time.perf_counter() - start))
+
+        random.seed(42)
+        positives = random.sample(range(1, args.users+1), args.positives)
+        for depth in range(1, args.depth+1):
+            totals = {"find_contacts": 0, "a query for each visit": 0}
+            contacts = 0
+            for user in positives:
+                elapsed, result = timed(find_contacts, user, begin, end, depth)
+                totals["find_contacts"] += elapsed
+                naive_elapsed, naive_result = timed(naive_contacts, user, begin, end, depth)
+                totals["a query for each visit"] += naive_elapsed
+                assert result == naive_result, "the contacts of %d are different" % user
+                contacts += len(result)
+            print("depth %d: %.1f contacts on average" % (depth, contacts / len(positives)))
+            baseline = totals["a query for each visit"]
+            for name, elapsed in totals.items():
+                print("    %-24s %9.1f ms per user  (x%.1f)" % (name, elapsed / len(positives), baseline / elapsed))
+
+if __name__ == "__main__":
+    main()
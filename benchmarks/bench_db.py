@@ -0,0 +1,83 @@
+""" Throughput of concurrent inserts and reads of bookings on a database
+
+Some threads insert bookings (one commit each) while others list the bookings of a restaurant,
+with the SQLite write-ahead log on and off (or on the database given with --uri).
+
+    $ PYTHONPATH=. python benchmarks/bench_db.py [--threads N] [--seconds S] [--uri URL]
+"""
+
+import argparse
+import datetime
+import os
+import random
+import threading
+import time
+
+from bookings.app import create_app
+from bookings.orm import db, Booking
+
+def worker(app, write, stop, counts):
+    """ Insert (write) or read bookings until stop is set, counting the operations and the errors """
+    with app.app_context():
+        while not stop.is_set():
+            restaurant_id = random.randint(1, 50)
+            try:
+                if write:
+                    db.session.add(Booking(
+                        user_id=random.randint(1, 1000),
+                        restaurant_id=restaurant_id,
+                        table_id=random.randint(1, 20),
+                        number_of_people=2,
+                        booking_datetime=datetime.datetime(2020, 11, 10) + datetime.timedelta(minutes=random.randint(0, 100000)),
+                        entrance_datetime=None,
+                    ))
+                    db.session.commit()
+                else:
+                    db.session.query(Booking.id, Booking.table_id).filter(Booking.restaurant_id == restaurant_id).all()
+                    db.session.rollback()
+                counts["writes" if write else "reads"] += 1
+            except Exception:
+                db.session.rollback()
+                counts["errors"] += 1
+        db.session.remove()
+
+def run(config, threads, seconds):
+    """ Return the operations per second (writes, reads) and the errors with a configuration """
+    app = create_app("BENCHMARK").app
+    app.config.update(config)
+    with app.app_context():
+        db.engine.dispose() # new connections with the pragmas of this run
+    counts = {"writes": 0, "reads": 0, "errors": 0}
+    stop = threading.Event()
+    pool = [threading.Thread(target=worker, args=(app, i % 2 == 0, stop, counts)) for i in range(threads)]
+    for t in pool:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in pool:
+        t.join()
+    return counts["writes"] / seconds, counts["reads"] / seconds, counts["errors"]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--threads", type=int, default=8, help="threads, half writing and half reading")
+    parser.add_argument("--seconds", type=float, default=5, help="duration of each run")
+    parser.add_argument("--uri", default=None, help="a SQLAlchemy url (the SQLite file of the BENCHMARK configuration by default)")
+    args = parser.parse_args()
+
+    if args.uri is not None:
+        os.environ["DATABASE_URI"] = args.uri
+        runs = {args.uri: {}}
+    else:
+        runs = {
+            "sqlite (rollback journal)": {"SQLITE_WAL": False},
+            "sqlite (wal)": {"SQLITE_WAL": True},
+        }
+
+    print("%d threads, %.1f s each" % (args.threads, args.seconds))
+    for name, config in runs.items():
+        writes, reads, errors = run(config, args.threads, args.seconds)
+        print("%-28s writes %8.1f/s   reads %8.1f/s   errors %d" % (name, writes, reads, errors))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+""" Latency of get_a_table against a local stub of the restaurant microservice
+
+Compares the sequential lookup (restaurant profile, then tables, then occupied tables)
+with get_a_table, that asks for the tables while the restaurant profile is requested.
+The restaurants' cache is disabled, so every lookup goes to the (slow) stub.
+
+    $ PYTHONPATH=. python benchmarks/bench_get_a_table.py [--delay SECONDS] [--runs N]
+"""
+
+import argparse
+import datetime
+import statistics
+import time
+
+from bookings.app import create_app
+from bookings.orm import db, Booking
+from bookings.utils import get_a_table, get_tables, restaurant_is_open
+from bookings.tests.stub_restaurants import StubRestaurantService
+
+def sequential_get_a_table(restaurant_id, number_of_people, booking_datetime, excluded=-1):
+    """ get_a_table with one remote call after the other (the previous implementation) """
+    is_open, rest = restaurant_is_open(restaurant_id, booking_datetime)
+    if is_open is None:
+        return None
+    if not is_open:
+        return -2
+    tables = get_tables(restaurant_id)
+    if tables is None:
+        return None
+    if tables == []:
+        return -1
+    delta = int(rest["occupation_time"])
+    occupied = db.session.query(Booking.table_id).select_from(Booking)\
+        .filter(Booking.restaurant_id == restaurant_id)\
+        .filter(booking_datetime - datetime.timedelta(hours=delta) < Booking.booking_datetime)\
+        .filter(Booking.booking_datetime < booking_datetime + datetime.timedelta(hours=delta))\
+        .filter(Booking.id != excluded)\
+        .all()
+    free_tables = [t for t in tables if ((t["id"],) not in occupied) and t["capacity"] >= number_of_people]
+    free_tables.sort(key=lambda x:x["capacity"])
+    if free_tables == []:
+        return -1
+    return free_tables[0]["id"]
+
+def measure(function, runs, *args):
+    """ Return the latencies (in ms) of runs calls of function(*args) """
+    latencies = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        function(*args)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--delay", type=float, default=0.02, help="latency of the stub restaurant service (seconds)")
+    parser.add_argument("--runs", type=int, default=50, help="lookups for each implementation")
+    args = parser.parse_args()
+
+    stub = StubRestaurantService(delay=args.delay)
+    url = stub.start()
+    app = create_app("BENCHMARK").app
+    app.config["REST_SERVICE_URL"] = url
+    booking = datetime.datetime.now().replace(hour=13) + datetime.timedelta(days=1)
+
+    try:
+        with app.app_context():
+            get_a_table(3, 1, booking) # warm up (connections and threads)
+            results = {
+                "sequential": measure(sequential_get_a_table, args.runs, 3, 1, booking),
+                "concurrent": measure(get_a_table, args.runs, 3, 1, booking),
+            }
+    finally:
+        stub.stop()
+
+    print("stub delay: %.1f ms, %d runs" % (args.delay * 1000, args.runs))
+    for name, latencies in results.items():
+        latencies.sort()
+        print("%-11s p50 %7.2f ms   p95 %7.2f ms   mean %7.2f ms" % (
+            name,
+            statistics.median(latencies),
+            latencies[int(len(latencies) * 0.95) - 1],
+            statistics.mean(latencies)
+        ))
+
+if __name__ == "__main__":
+    main()
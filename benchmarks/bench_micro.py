@@ -0,0 +1,59 @@
+""" Micro-benchmarks of the hot functions (pytest-benchmark)
+
+get_a_table (with and without the occupancy index), restaurant_is_open and Booking.dump,
+on a database with 10000 random bookings and the mocks of the restaurants.
+
+    $ PYTHONPATH=. pytest benchmarks/bench_micro.py --benchmark-autosave
+    $ PYTHONPATH=. pytest benchmarks/bench_micro.py --benchmark-compare # with the last saved run
+"""
+
+import datetime
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+from bookings.app import create_app
+from bookings.orm import db, Booking
+from bookings.utils import get_a_table, restaurant_is_open
+from bookings.fake_data import put_fake_bookings
+
+ROWS = 10000
+
+@pytest.fixture(scope="module")
+def app():
+    """ The app with the mocks of the restaurants and ROWS random bookings """
+    app = create_app("TEST").app
+    with app.app_context():
+        put_fake_bookings(ROWS)
+        yield app
+
+@pytest.fixture
+def tomorrow():
+    return datetime.datetime.now().replace(hour=13, minute=0, second=0, microsecond=0) + datetime.timedelta(days=1)
+
+def test_get_a_table(benchmark, app, tomorrow):
+    table = benchmark(get_a_table, 3, 2, tomorrow)
+    assert table is not None
+
+def test_get_a_table_locked(benchmark, app, tomorrow):
+    def locked():
+        table = get_a_table(3, 2, tomorrow, lock=True)
+        db.session.rollback() # release the lock
+        return table
+    assert benchmark(locked) is not None
+
+def test_get_a_table_without_index(benchmark, app, tomorrow):
+    index = app.extensions.pop("occupancy")
+    try:
+        assert benchmark(get_a_table, 3, 2, tomorrow) is not None
+    finally:
+        app.extensions["occupancy"] = index
+
+def test_restaurant_is_open(benchmark, app, tomorrow):
+    is_open, _ = benchmark(restaurant_is_open, 4, tomorrow)
+    assert is_open is False
+
+def test_booking_dump(benchmark, app):
+    booking = db.session.query(Booking).filter(Booking.entrance_datetime != None).first()
+    assert benchmark(booking.dump)["entrance_datetime"] is not None
@@ -0,0 +1,82 @@
+""" Serialization of a list of bookings: Booking.dump() + connexion vs bookings.serializers
+
+Both produce the same body (checked before measuring).
+
+    $ PYTHONPATH=. python benchmarks/bench_serialization.py [--rows N] [--repeat R]
+"""
+
+import argparse
+import datetime
+import time
+
+import flask
+
+from connexion.jsonifier import Jsonifier
+
+from bookings import serializers
+from bookings.app import create_app
+from bookings.orm import Booking
+
+def make_rows(n):
+    """ Return n bookings as tuples of column values (as read from the database) """
+    now = datetime.datetime(2020, 11, 10, 13, 0, 0, 123456)
+    rows = []
+    for i in range(1, n+1):
+        booking_datetime = now + datetime.timedelta(minutes=15*i)
+        entrance = booking_datetime + datetime.timedelta(minutes=3) if i % 3 == 0 else None
+        values = {"id": i, "user_id": i % 5000, "restaurant_id": i % 300, "number_of_people": 1 + i % 6, "datetime": now,
+            "booking_datetime": booking_datetime, "entrance_datetime": entrance, "table_id": i % 4000, "version": 1 + i % 3}
+        rows.append(tuple(values[c] for c in serializers.COLUMNS)) # a new column fails here (KeyError), not in serialize
+    return rows
+
+def make_bookings(rows):
+    """ Return the rows as Booking objects (as loaded by the ORM, with all the columns, version included) """
+    bookings = []
+    for row in rows:
+        b = Booking()
+        for c,v in zip(serializers.COLUMNS, row):
+            setattr(b, c, v)
+        bookings.append(b)
+    return bookings
+
+def best_of(repeat, function):
+    """ Return the best time (in ms) of repeat calls and the last result """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        elapsed = (time.perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100000, help="bookings serialized")
+    parser.add_argument("--repeat", type=int, default=3, help="runs for each implementation (the best is reported)")
+    args = parser.parse_args()
+
+    app = create_app("TEST").app
+    rows = make_rows(args.rows)
+    bookings = make_bookings(rows)
+    jsonifier = Jsonifier(flask.json, indent=2)
+    orjson = serializers.orjson
+
+    with app.app_context():
+        results = {}
+        results["Booking.dump() + connexion"] = best_of(args.repeat, lambda: jsonifier.dumps([p.dump() for p in bookings]).encode())
+        serializers.orjson = None
+        results["serializers (json)"] = best_of(args.repeat, lambda: serializers.dumps(serializers.serialize(rows)))
+        if orjson is not None:
+            serializers.orjson = orjson
+            results["serializers (orjson)"] = best_of(args.repeat, lambda: serializers.dumps(serializers.serialize(rows)))
+
+    bodies = set(body for _, body in results.values())
+    assert len(bodies) == 1, "the bodies are different"
+
+    print("%d bookings, %d bytes" % (args.rows, len(bodies.pop())))
+    baseline = results["Booking.dump() + connexion"][0]
+    for name, (elapsed, _) in results.items():
+        print("%-28s %9.1f ms  (x%.1f)" % (name, elapsed, baseline / elapsed))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+""" Throughput of the app with the Flask development server and with gunicorn
+
+Each server is started (python bookings/app.py CONFIG, as run.sh does) and loaded by
+client processes with keep-alive connections, reading bookings for a few seconds:
+GET /bookings/{id} and GET /bookings?rest={id}&limit=50.
+
+    $ PYTHONPATH=. python benchmarks/load_test.py [--clients N] [--duration SECONDS]
+"""
+
+import argparse
+import multiprocessing
+import os
+import random
+import signal
+import statistics
+import subprocess
+import sys
+import time
+
+import requests
+
+from bookings.app import get_config
+
+CONFIGURATIONS = { # name: the configuration of config.ini
+    "development server": "BENCHMARK",
+    "gunicorn": "BENCHMARK_GUNICORN",
+}
+
+def start(configuration, timeout=60):
+    """ Start the app with a configuration and return (process, base url) once it answers """
+    conf = get_config(configuration)
+    url = "http://%s:%d/" % (conf["IP"], conf["PORT"])
+    env = dict(os.environ, PYTHONPATH=".")
+    process = subprocess.Popen([sys.executable, "bookings/app.py", configuration], env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if requests.get(url+"bookings?limit=1", timeout=1).status_code == 200:
+                return process, url
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    stop(process)
+    raise RuntimeError(configuration+" did not start")
+
+def stop(process):
+    """ Stop the app gracefully (as docker stop does) """
+    process.send_signal(signal.SIGTERM)
+    try:
+        process.wait(30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+def client(url, duration, seed):
+    """ Send requests for duration seconds and return (latencies in ms, errors) """
+    random.seed(seed)
+    session = requests.Session()
+    ids = [b["id"] for b in session.get(url+"bookings?limit=1000").json()]
+    latencies, errors = [], 0
+    end = time.perf_counter() + duration
+    while True:
+        start = time.perf_counter()
+        if start > end:
+            return latencies, errors
+        if random.random() < 0.5:
+            response = session.get(url+"bookings/"+str(random.choice(ids)))
+        else:
+            response = session.get(url+"bookings?rest="+str(random.randint(1, 3))+"&limit=50")
+        latencies.append((time.perf_counter() - start) * 1000)
+        if response.status_code != 200:
+            errors += 1
+
+def load(url, clients, duration):
+    """ Return (requests per second, latencies, errors) of clients processes sending requests """
+    with multiprocessing.Pool(clients) as pool:
+        results = pool.starmap(client, [(url, duration, i) for i in range(clients)])
+    latencies = [l for r,_ in results for l in r]
+    return len(latencies) / duration, latencies, sum(e for _,e in results)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, default=16, help="client processes sending requests concurrently")
+    parser.add_argument("--duration", type=float, default=10, help="seconds of load for each server")
+    args = parser.parse_args()
+
+    results = {}
+    for name, configuration in CONFIGURATIONS.items():
+        process, url = start(configuration)
+        try:
+            load(url, args.clients, 1) # warm up
+            results[name] = load(url, args.clients, args.duration)
+        finally:
+            stop(process)
+
+    print("%d clients, %.0f seconds" % (args.clients, args.duration))
+    baseline = results["development server"][0]
+    for name, (throughput, latencies, errors) in results.items():
+        latencies.sort()
+        print("%-19s %8.1f req/s (x%.1f)   p50 %7.2f ms   p99 %7.2f ms   errors %d" % (
+            name,
+            throughput,
+            throughput / baseline,
+            statistics.median(latencies),
+            latencies[int(len(latencies) * 0.99) - 1],
+            errors
+        ))
+
+if __name__ == "__main__":
+    main()
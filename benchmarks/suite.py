@@ -0,0 +1,239 @@
+""" Throughput and latency of the booking endpoints, to find the regressions of the hot paths
+
+The database is filled with --rows random bookings in --restaurants random restaurants (see bookings/fake_data.py),
+the restaurant microservice is a local stub serving them and the app is served by a threaded server in this process.
+Each scenario is run for --duration seconds by --clients client processes (keep-alive connections):
+GET /bookings with each combination of filters, GET /bookings/{id}, POST, PUT and DELETE /bookings.
+
+The results (requests/s, p50/p95/p99 latencies and errors of each scenario) are printed and saved as json,
+so two runs can be compared:
+
+    $ PYTHONPATH=. python benchmarks/suite.py [--rows N] [--restaurants N] [--duration SECONDS] [--clients N] [--only REGEX]
+    $ PYTHONPATH=. python benchmarks/suite.py --output after.json --compare before.json
+"""
+
+import argparse
+import datetime
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import random
+import re
+import subprocess
+import threading
+import time
+
+import requests
+
+USERS = 1000 # the users of the random bookings
+LIMIT = 100 # bookings in a page of GET /bookings
+
+def day(rng, world, past=False):
+    """ A random day of the bookings, as the query parameters of a period (begin and end) """
+    first = datetime.datetime.fromisoformat(world["first"])
+    last = datetime.datetime.fromisoformat(world["today"]) - datetime.timedelta(days=1) if past else datetime.datetime.fromisoformat(world["last"])
+    begin = first + datetime.timedelta(days=rng.randint(0, max(0, (last - first).days)))
+    return begin.isoformat()+"Z", (begin + datetime.timedelta(days=1)).isoformat()+"Z"
+
+FILTERS = { # name: a random value of the filter (query parameters)
+    "user": lambda rng, world: "user=%d" % rng.randint(1, USERS),
+    "rest": lambda rng, world: "rest=%d" % rng.choice(world["restaurants"]),
+    "table": lambda rng, world: "table=%d" % rng.randint(1, world["tables"]),
+    "period": lambda rng, world: "begin=%s&end=%s" % day(rng, world),
+    "entrance": lambda rng, world: "begin_entrance=%s&end_entrance=%s" % day(rng, world, past=True),
+}
+
+def list_bookings(filters):
+    """ The requests of GET /bookings with some filters """
+    def request(rng, ids, world):
+        query = [FILTERS[f](rng, world) for f in filters] + ["limit=%d" % LIMIT]
+        return "GET", "/bookings?"+"&".join(query), None
+    return request
+
+def get_booking(rng, ids, world):
+    return "GET", "/bookings/%d" % rng.choice(ids), None
+
+def post_booking(rng, ids, world):
+    booking_datetime = datetime.datetime.now().replace(minute=0, second=0, microsecond=0) + datetime.timedelta(minutes=15*rng.randint(96, 30*96))
+    return "POST", "/bookings", {
+        "user_id": rng.randint(1, USERS),
+        "restaurant_id": rng.choice(world["restaurants"]),
+        "number_of_people": rng.randint(1, 2),
+        "booking_datetime": booking_datetime.isoformat(),
+    }
+
+def put_booking(rng, bookings, world):
+    booking_id, number_of_people = rng.choice(bookings)
+    return "PUT", "/bookings/%d" % booking_id, {"number_of_people": 1 if number_of_people > 1 else 2}
+
+def delete_booking(rng, bookings, world):
+    if bookings == []: # all deleted
+        return None
+    return "DELETE", "/bookings/%d" % bookings.pop()[0], None
+
+SCENARIOS = {} # name: (the function returning a random request, the expected status codes, the bookings used: ids or (id, number_of_people) of the future ones)
+for k in range(len(FILTERS)+1):
+    for filters in itertools.combinations(FILTERS, k):
+        SCENARIOS["GET /bookings?"+",".join(filters)] = (list_bookings(filters), (200,), "all")
+SCENARIOS["GET /bookings/{id}"] = (get_booking, (200,), "all")
+SCENARIOS["POST /bookings"] = (post_booking, (201, 409), None) # 409: no free tables or closed
+SCENARIOS["PUT /bookings/{id}"] = (put_booking, (200, 409), "future") # 409: no free tables
+SCENARIOS["DELETE /bookings/{id}"] = (delete_booking, (204,), "future") # each client deletes its own bookings
+
+def client(url, scenario, duration, seed, ids, world):
+    """ Send the requests of a scenario for duration seconds, return (latencies in ms, errors) """
+    request, expected, _ = SCENARIOS[scenario]
+    rng = random.Random(seed)
+    session = requests.Session()
+    latencies, errors = [], 0
+    end = time.perf_counter() + duration
+    while True:
+        r = request(rng, ids, world)
+        start = time.perf_counter()
+        if r is None or start > end:
+            return latencies, errors
+        method, path, body = r
+        response = session.request(method, url+path, json=body)
+        latencies.append((time.perf_counter() - start) * 1000)
+        if response.status_code not in expected:
+            errors += 1
+
+def percentile(values, p):
+    """ The p-th percentile of the sorted values (nearest rank) """
+    return values[max(0, int(round(len(values) * p / 100.0)) - 1)]
+
+def run(pool, url, scenario, clients, duration, ids, world):
+    """ Run a scenario, return its results (a dict) """
+    if SCENARIOS[scenario][2] == "future": # disjoint bookings for each client
+        ids = [ids[i::clients] for i in range(clients)]
+    else:
+        ids = [ids] * clients
+    start = time.perf_counter()
+    results = pool.starmap(client, [(url, scenario, duration, i, ids[i], world) for i in range(clients)])
+    elapsed = time.perf_counter() - start
+    latencies = sorted(l for r,_ in results for l in r)
+    if latencies == []:
+        return {"requests": 0, "rps": 0, "p50": 0, "p95": 0, "p99": 0, "errors": 0}
+    return {
+        "requests": len(latencies),
+        "rps": len(latencies) / min(elapsed, duration) if duration > 0 else 0,
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+        "errors": sum(e for _,e in results),
+    }
+
+def start_app(rows, restaurants, tables, cache_ttl, response_cache_ttl):
+    """ Start the app (in a thread) with rows random bookings and a stub of the restaurants
+
+    Return the url, the ids of the bookings, the (id, number_of_people) of the bookings from tomorrow
+    and the world of the bookings (restaurants, number of tables and period)
+    """
+    from werkzeug.serving import make_server
+
+    from bookings.app import create_app
+    from bookings.cache import TTLCache
+    from bookings.responses import ResponseCache
+    from bookings.orm import db, Booking
+    from bookings.fake_data import fake_restaurants, put_fake_bookings
+    from bookings.tests.stub_restaurants import StubRestaurantService
+
+    fake_world = fake_restaurants(restaurants, tables)
+    stub_url = StubRestaurantService(world=fake_world).start()
+    app = create_app("BENCHMARK").app
+    app.config["REST_SERVICE_URL"] = stub_url
+    app.extensions["restaurant_cache"] = TTLCache(cache_ttl, 1000, keep_stale=True)
+    app.extensions["response_cache"] = ResponseCache(TTLCache(response_cache_ttl, app.config["RESPONSE_CACHE_SIZE"]))
+    with app.app_context():
+        db.session.query(Booking).delete() # the bookings of FAKE_DATA are not in the random restaurants
+        db.session.commit()
+        start = time.perf_counter()
+        put_fake_bookings(rows, users=USERS, world=fake_world)
+        print("%d bookings inserted in %.1f s" % (rows, time.perf_counter() - start))
+        ids = [i for (i,) in db.session.query(Booking.id)]
+        future = [tuple(b) for b in db.session.query(Booking.id, Booking.number_of_people).filter(Booking.booking_datetime > datetime.datetime.now() + datetime.timedelta(days=1))]
+        first, last = db.session.query(db.func.min(Booking.booking_datetime), db.func.max(Booking.booking_datetime)).one()
+        db.session.remove()
+
+    world = {
+        "restaurants": [r["id"] for r in fake_world[0]],
+        "tables": restaurants * tables,
+        "first": first.date().isoformat(),
+        "last": last.date().isoformat(),
+        "today": datetime.date.today().isoformat(),
+    }
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return "http://127.0.0.1:%d" % server.server_port, ids, future, world
+
+def commit():
+    """ The current git commit (None if unknown) """
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+def compare(results, previous):
+    """ Print the changes from a previous run """
+    print("\ncompared with %s (%s)" % (previous.get("commit"), previous.get("date")))
+    for name, r in results["scenarios"].items():
+        p = previous["scenarios"].get(name)
+        if p is None or p["rps"] == 0 or p["p95"] == 0:
+            continue
+        print("%-48s req/s %+7.1f%%   p95 %+7.1f%%" % (name, (r["rps"] / p["rps"] - 1) * 100, (r["p95"] / p["p95"] - 1) * 100))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100000, help="random bookings in the database")
+    parser.add_argument("--restaurants", type=int, default=100, help="random restaurants of the bookings")
+    parser.add_argument("--tables", type=int, default=5, help="tables of each restaurant")
+    parser.add_argument("--duration", type=float, default=2, help="seconds of load for each scenario")
+    parser.add_argument("--clients", type=int, default=4, help="client processes sending requests concurrently")
+    parser.add_argument("--cache-ttl", type=int, default=300, help="RESTAURANT_CACHE_TTL of the app (0 disables the cache)")
+    parser.add_argument("--response-cache-ttl", type=int, default=5, help="RESPONSE_CACHE_TTL of the app (0 disables the cache)")
+    parser.add_argument("--only", default=None, help="run only the scenarios matching this regular expression")
+    parser.add_argument("--output", default=None, help="the json file of the results (default: .benchmarks/suite-DATE.json)")
+    parser.add_argument("--compare", default=None, help="the json file of a previous run to compare with")
+    args = parser.parse_args()
+
+    scenarios = [s for s in SCENARIOS if args.only is None or re.search(args.only, s)]
+    url, ids, future, world = start_app(args.rows, args.restaurants, args.tables, args.cache_ttl, args.response_cache_ttl)
+
+    results = {
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "rows": args.rows,
+        "restaurants": args.restaurants,
+        "tables": args.tables,
+        "clients": args.clients,
+        "response_cache_ttl": args.response_cache_ttl,
+        "duration": args.duration,
+        "scenarios": {},
+    }
+    with multiprocessing.get_context("spawn").Pool(args.clients) as pool:
+        pool.starmap(client, [(url, "GET /bookings/{id}", 0.2, i, ids, world) for i in range(args.clients)]) # warm up
+        print("%-48s %9s %9s %9s %9s %7s" % ("scenario", "req/s", "p50 ms", "p95 ms", "p99 ms", "errors"))
+        for scenario in scenarios:
+            bookings = {"all": ids, "future": future, None: []}[SCENARIOS[scenario][2]]
+            r = results["scenarios"][scenario] = run(pool, url, scenario, args.clients, args.duration, bookings, world)
+            print("%-48s %9.1f %9.2f %9.2f %9.2f %7d" % (scenario, r["rps"], r["p50"], r["p95"], r["p99"], r["errors"]))
+
+    output = args.output
+    if output is None:
+        os.makedirs(".benchmarks", exist_ok=True)
+        output = os.path.join(".benchmarks", "suite-"+results["date"].replace(":", "")+".json")
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print("results saved in "+output)
+
+    if args.compare is not None:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+
+if __name__ == "__main__":
+    main()
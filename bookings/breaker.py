@@ -0,0 +1,99 @@
+""" A circuit breaker for the calls to the other microservices
+
+While the remote service works the breaker is closed and every call is made.
+After failure_threshold consecutive failures it opens: the calls are rejected at once
+(no connection, no timeout) for reset_timeout seconds.
+Then it is half-open: a single call (the probe) is let through,
+if it succeeds the breaker is closed again, otherwise it is open for other reset_timeout seconds.
+"""
+
+import threading
+import time
+
+from bookings import metrics
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+STATES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2} # the values of the state in the metrics
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold, reset_timeout, timer=time.monotonic, service=None):
+        """ A thread safe circuit breaker (closed)
+
+        A failure_threshold equal to 0 disables the breaker (every call is made).
+
+        Params:
+            - failure_threshold: the consecutive failures that open the breaker
+            - reset_timeout: the seconds for which the breaker stays open before a probe
+            - timer: the clock used for the timeout (monotonic by default)
+            - service: the name of the remote service in the metrics (None: no metrics)
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.timer = timer
+        self.service = service
+        self.state = None
+        self._set_state(CLOSED)
+        self.failures = 0 # the consecutive failures
+        self.opened = 0 # how many times the breaker has been opened
+        self.rejected = 0 # the calls not made because the breaker was open
+        self._opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """ Return True if a call can be made now (then success or failure must be called) """
+        if self.failure_threshold <= 0:
+            return True
+        with self._lock:
+            if self.state == OPEN and self.timer() - self._opened_at >= self.reset_timeout:
+                self._set_state(HALF_OPEN)
+            if self.state == HALF_OPEN and not self._probing:
+                self._probing = True # this call is the probe
+                return True
+            if self.state == CLOSED:
+                return True
+            self.rejected += 1
+            if self.service is not None:
+                metrics.BREAKER_REJECTED.labels(self.service).inc()
+            return False
+
+    def success(self):
+        """ The call succeeded: the breaker is closed """
+        with self._lock:
+            self._set_state(CLOSED)
+            self.failures = 0
+            self._probing = False
+
+    def failure(self):
+        """ The call failed: the breaker is opened after failure_threshold consecutive failures (or a failed probe) """
+        if self.failure_threshold <= 0:
+            return
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    self.opened += 1
+                    if self.service is not None:
+                        metrics.BREAKER_OPENED.labels(self.service).inc()
+                self._set_state(OPEN)
+                self._opened_at = self.timer()
+            self._probing = False
+
+    def _set_state(self, state):
+        """ Change the state (with the lock held), also in the metrics """
+        if state != self.state and self.service is not None:
+            metrics.BREAKER_STATE.labels(self.service).set(STATES[state])
+        self.state = state
+
+    def stats(self):
+        """ Return the state and the counters of the breaker as a dict """
+        with self._lock:
+            return {
+                "state": self.state,
+                "failures": self.failures,
+                "opened": self.opened,
+                "rejected": self.rejected,
+            }
@@ -0,0 +1,112 @@
+""" An in-process cache for the data obtained from the other microservices
+
+Every entry expires after a time to live (TTL) and, when the cache is full,
+the least recently used entry is evicted to make room for the new one.
+
+If required, the expired entries are kept (until they are evicted) to be served 
+while they are refreshed (stale-while-revalidate).
+"""
+
+import threading
+import time
+
+from collections import OrderedDict
+
+class TTLCache:
+    def __init__(self, ttl, max_size, timer=time.monotonic, keep_stale=False):
+        """ A thread safe LRU cache whose entries expire after ttl seconds
+
+        A ttl or a max_size equal to 0 disables the cache (nothing is stored).
+
+        Params:
+            - ttl: the time to live of an entry (in seconds)
+            - max_size: the maximum number of entries
+            - timer: the clock used for the expiration (monotonic by default)
+            - keep_stale: keep the expired entries (see get_stale)
+        """
+        self.ttl = ttl
+        self.max_size = max_size
+        self.timer = timer
+        self.keep_stale = keep_stale
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.stale_hits = 0
+        self._entries = OrderedDict() # key -> (expiration, value), from the least to the most recently used
+        self._refreshing = set() # the keys being refreshed
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """ Return the value stored with the key or None (if it is missing or expired) """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry[0] <= self.timer(): # expired
+                if not self.keep_stale:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        """ Store the value with the key (None values are not stored) """
+        if value is None or self.ttl <= 0 or self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (self.timer() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size: # evict the least recently used
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_stale(self, key):
+        """ Return the value stored with the key even if it is expired (None if it is missing) """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self.stale_hits += 1
+            return entry[1]
+
+    def start_refresh(self, key):
+        """ Return True if the key is not already being refreshed (then end_refresh must be called) """
+        with self._lock:
+            if key in self._refreshing:
+                return False
+            self._refreshing.add(key)
+            return True
+
+    def end_refresh(self, key):
+        """ The refresh of the key is over """
+        with self._lock:
+            self._refreshing.discard(key)
+
+    def delete(self, key):
+        """ Remove the key from the cache (if present) """
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        """ Remove all the entries """
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        """ Return the counters of the cache as a dict (a consistent snapshot) """
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "stale_hits": self.stale_hits,
+            }
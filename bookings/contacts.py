@@ -0,0 +1,130 @@
+""" The contacts of a positive user (contact tracing)
+
+A user is in a restaurant from the entrance for the occupation time of the restaurant,
+so two users met if they entered the same restaurant less than an occupation time apart.
+
+The contacts are found one hop (depth) at a time:
+    1. the visits (entrances) of the users of the hop, since they may be infectious
+       (the positive user: from the beginning of the period, a contact: from the first contact)
+    2. the entrances of each visited restaurant around the visits (the windows of the visits are merged),
+       read with a single query (ix_booking_restaurant_entrance, without reading the bookings)
+    3. a sweep over the entrances of each restaurant: for each entrance, a binary search of the first visit overlapping it
+
+The users met for the first time are the next hop.
+"""
+
+import bisect
+import datetime
+
+from sqlalchemy import and_, or_
+
+from bookings.orm import db, Booking
+from bookings.utils import fetch_restaurant
+
+CHUNK = 500 # users or windows in a query (the variables of a query are limited)
+
+def chunks(items, size=CHUNK):
+    """ Yield lists of size items (the last one can be shorter) """
+    items = list(items)
+    for i in range(0, len(items), size):
+        yield items[i:i+size]
+
+def visits(since, end):
+    """ Return the visits of the users since they may be infectious, by restaurant: {restaurant: sorted [(entrance, user)]}
+
+    Params:
+        - since: {user: the datetime from which its visits are counted}
+        - end: the visits are up to this datetime
+    """
+    result = {}
+    for users in chunks(since):
+        q = db.session.query(Booking.user_id, Booking.restaurant_id, Booking.entrance_datetime).filter(
+            Booking.user_id.in_(users),
+            Booking.entrance_datetime != None,
+            Booking.entrance_datetime >= min(since[u] for u in users),
+            Booking.entrance_datetime <= end)
+        for user, restaurant, entrance in q:
+            if entrance >= since[user]:
+                result.setdefault(restaurant, []).append((entrance, user))
+    for restaurant_visits in result.values():
+        restaurant_visits.sort()
+    return result
+
+def windows(entrances, occupation):
+    """ Return the merged periods [entrance - occupation, entrance + occupation] of the sorted entrances """
+    result = []
+    for e in entrances:
+        if result != [] and e - occupation <= result[-1][1]:
+            result[-1][1] = e + occupation
+        else:
+            result.append([e - occupation, e + occupation])
+    return result
+
+def entrances(periods):
+    """ Return the entrances in the periods of the restaurants, by restaurant: {restaurant: [(entrance, user)]}
+
+    Params:
+        - periods: [(restaurant, begin, end)]
+    """
+    result = {}
+    for chunk in chunks(periods):
+        q = db.session.query(Booking.restaurant_id, Booking.entrance_datetime, Booking.user_id).filter(or_(*[
+            and_(Booking.restaurant_id == restaurant, Booking.entrance_datetime > begin, Booking.entrance_datetime < end)
+            for restaurant, begin, end in chunk]))
+        for restaurant, entrance, user in q:
+            result.setdefault(restaurant, []).append((entrance, user))
+    return result
+
+def occupations(restaurants):
+    """ Return the occupation time of the restaurants (timedelta), None if a restaurant is not available
+
+    The restaurants are requested concurrently (see utils.fetch_restaurant).
+    """
+    futures = {r: fetch_restaurant(r) for r in restaurants}
+    result = {}
+    for r, future in futures.items():
+        rest = future.result()
+        if rest is None:
+            return None
+        result[r] = datetime.timedelta(hours=int(rest["occupation_time"]))
+    return result
+
+def find_contacts(user_id, begin, end, depth=1):
+    """ Return the contacts of a positive user: {user: (hop, datetime of the first contact)}
+
+    Params:
+        - user_id: the positive user
+        - begin, end: the period in which the user may have been infectious (entrances)
+        - depth: the hops followed (1: the users met by the positive one, 2: also the ones met by them after, ...)
+
+    Return None if a visited restaurant is not available (its occupation time is unknown).
+    """
+    found = {user_id: (0, begin)}
+    frontier = {user_id: begin}
+    for hop in range(1, depth+1):
+        if frontier == {}:
+            break
+        visited = visits(frontier, end)
+        occupation = occupations(visited)
+        if occupation is None:
+            return None
+
+        periods = [(r, b, e) for r, vs in visited.items() for b, e in windows([v for v,_ in vs], occupation[r])]
+        frontier = {}
+        for r, restaurant_entrances in entrances(periods).items():
+            starts = [e for e,_ in visited[r]]
+            for entrance, user in restaurant_entrances:
+                if user in found: # already met (or the positive user)
+                    continue
+                i = bisect.bisect_right(starts, entrance - occupation[r]) # the first visit overlapping the entrance
+                while i < len(starts) and starts[i] < entrance + occupation[r] and visited[r][i][1] == user: # not with itself
+                    i += 1
+                if i == len(starts) or starts[i] >= entrance + occupation[r]:
+                    continue
+                met = max(entrance, starts[i])
+                if user not in frontier or met < frontier[user]:
+                    frontier[user] = met
+        for user, met in frontier.items():
+            found[user] = (hop, met)
+    del found[user_id]
+    return found
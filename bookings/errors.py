@@ -41,6 +41,14 @@ class Error404(Error):
         self.status = 404
         self.detail = detail
 
+class Error412(Error):
+    def __init__(self, detail):
+        """ Precondition Failed (the resource has been changed: If-Match) """
+        self.type = "about:blank"
+        self.title = "Precondition Failed"
+        self.status = 412
+        self.detail = detail
+
 class Error500(Error):
     def __init__(self):
         """ Internal Server Error 
@@ -0,0 +1,278 @@
+""" Realistic random bookings, in bulk (for the benchmarks and the performance tests)
+
+The fake world is made of restaurants (the ones of the mocks or n random ones, see fake_restaurants),
+each table hosts at most a booking for each opening of a day (lunch and dinner),
+so the bookings never overlap on a table (as if they were made through the service).
+The bookings are chosen at random among all the (restaurant, table, day, opening) of the period:
+    - the time: around the peak of the opening (e.g. 13:00 for lunch, 20:30 for dinner)
+    - the people: mostly 2 or 4 (never more than the capacity of the table)
+    - the users: some users book much more often than the others
+    - made some hours or days before (in the past)
+    - the past ones have an entrance a few minutes before or after the booking (except the no-shows)
+
+The rows are inserted with a single commit, BATCH_SIZE at a time (executemany).
+
+    $ PYTHONPATH=. python -m bookings.fake_data [CONFIG] [--rows N] [--restaurants N] [--tables N] [--users N] [--days N]
+
+or, when the app starts, with FAKE_DATA = true and FAKE_DATA_ROWS > 0 in config.ini.
+"""
+
+import argparse
+import csv
+import datetime
+import io
+import itertools
+import logging
+import math
+import random
+import time
+
+from bookings.orm import db, Booking
+from bookings.utils import lock_restaurant, warm_occupancy, invalidate_responses
+from bookings import utils
+
+BATCH_SIZE = 10000 # rows inserted at a time
+SAMPLES = 1024 # values sampled from each distribution
+COLUMNS = ("user_id", "restaurant_id", "number_of_people", "datetime", "booking_datetime", "entrance_datetime", "table_id") # of the generated bookings
+FILL = 0.6 # the fraction of the (table, day, opening) booked when the period is not given
+PAST = 0.75 # the fraction of the period before today
+NO_SHOWS = 0.1 # the fraction of past bookings without entrance
+PEOPLE = [(1, 8), (2, 40), (3, 12), (4, 25), (5, 6), (6, 6), (8, 3)] # (people, weight)
+CAPACITIES = [2, 2, 4, 4, 4, 6, 8] # of the random tables
+OPENINGS = [ # (first_opening_hour, first_closing_hour, second_opening_hour, second_closing_hour), the hours are included
+    (12, 15, 19, 23), (12, 15, 19, 23), (12, 15, 19, 23), # lunch and dinner
+    (11, 15, None, None), # only lunch
+    (18, 23, None, None), # only dinner
+]
+
+def fake_restaurants(n, tables_per_restaurant=5, seed=0):
+    """ Return n random restaurants (json, IDs from 1) and their tables, as the lists of the mocks (see bookings.utils)
+
+    The table IDs are unique (from 1), the same seed gives the same restaurants.
+    """
+    rng = random.Random(seed)
+    restaurants, tables = [], []
+    table_id = 0
+    for i in range(1, n+1):
+        first_opening, first_closing, second_opening, second_closing = rng.choice(OPENINGS)
+        restaurants.append({
+            "url": "/restaurants/"+str(i),
+            "id": i,
+            "name": "Rest "+str(i),
+            "rating_val": round(rng.uniform(1, 5), 1),
+            "rating_num": rng.randint(0, 1000),
+            "lat": round(rng.uniform(43.6, 43.8), 4),
+            "lon": round(rng.uniform(10.3, 10.5), 4),
+            "phone": "050"+str(rng.randint(100000, 999999)),
+            "first_opening_hour": first_opening,
+            "first_closing_hour": first_closing,
+            "second_opening_hour": second_opening,
+            "second_closing_hour": second_closing,
+            "occupation_time": rng.choice([1, 2, 2]),
+            "cuisine_type": "cuisine_type",
+            "menu": "menu",
+            "closed_days": rng.choice([[], [1], [1], [2], [7]]),
+        })
+        restaurant_tables = []
+        for _ in range(tables_per_restaurant):
+            table_id += 1
+            restaurant_tables.append({"id": table_id, "capacity": rng.choice(CAPACITIES)})
+        tables.append(restaurant_tables)
+    return restaurants, tables
+
+def openings(rest):
+    """ Return the openings of a restaurant (json) as lists of (minute of the day, weight) at which a booking can start
+
+    The meal ends before the closing (if possible), the weights peak at a third of the opening.
+    """
+    occupation = int(rest["occupation_time"]) * 60
+    result = []
+    for opening, closing in [(rest["first_opening_hour"], rest["first_closing_hour"]), (rest["second_opening_hour"], rest["second_closing_hour"])]:
+        if opening is None or closing is None:
+            continue
+        opening, closing = int(opening) * 60, int(closing) * 60
+        starts = list(range(opening, max(opening, closing - occupation) + 1, 15))
+        peak = opening + (closing - opening) / 3
+        result.append([(m, 1 / (1 + abs(m - peak) / 30)) for m in starts])
+    return result
+
+def generate(n, restaurants, tables, users=1000, days=0, seed=0, now=None):
+    """ Yield n random bookings (tuples with the values of COLUMNS), see the module for their distribution
+
+    Params:
+        - restaurants, tables: the fake world (as fake_restaurants returns)
+        - users: the bookings are made by the users from 1 to users
+        - days: the length of the period (PAST of it before today), 0 to fill FILL of the tables
+        - seed: the same bookings for the same parameters (and now)
+        - now: the current datetime
+
+    Raise ValueError if the tables are not enough for n bookings in the period.
+    """
+    rng = random.Random(seed)
+    now = datetime.datetime.now() if now is None else now
+    today = datetime.datetime.combine(now.date(), datetime.time())
+
+    services = [] # (restaurant, its tables, the starts of an opening, their cumulative weights)
+    for rest, rest_tables in zip(restaurants, tables):
+        if len(rest["closed_days"]) >= 7 or rest_tables == []:
+            continue
+        for opening in openings(rest):
+            services.append((rest, rest_tables, [m for m,_ in opening], list(itertools.accumulate(w for _,w in opening))))
+    if services == []:
+        raise ValueError("The restaurants are always closed or without tables")
+
+    if days <= 0:
+        per_week = sum(len(ts) * (7 - len(r["closed_days"])) for r,ts,_,_ in services)
+        days = max(1, math.ceil(n / (per_week / 7) / FILL))
+    first_day = today - datetime.timedelta(days=math.ceil(days * PAST))
+    period = [first_day + datetime.timedelta(days=d) for d in range(days)]
+
+    cells = [] # for each service: the days in which the restaurant is open
+    for rest, _, _, _ in services:
+        closed = set(rest["closed_days"])
+        cells.append([d for d in period if d.isoweekday() not in closed])
+    total = sum(len(ts) * len(ds) for (_,ts,_,_),ds in zip(services, cells))
+    if total < n:
+        raise ValueError("%d bookings do not fit in %d tables for %d days" % (n, total, days))
+
+    # the distributions are sampled once (SAMPLES values each), then a booking picks the values at random
+    draw = rng.random
+    people = rng.choices([p for p,_ in PEOPLE], [w for _,w in PEOPLE], k=SAMPLES)
+    leads = [datetime.timedelta(minutes=15 + min(int(rng.expovariate(1 / 2880)), 60 * 24 * 60)) for _ in range(SAMPLES)] # 2 days on average
+    entrances = [datetime.timedelta(seconds=int(max(-10, min(30, rng.gauss(3, 6))) * 60)) for _ in range(SAMPLES)] # 3 minutes late on average
+    frequent = max(2, users)
+
+    remaining, selected = total, 0
+    for (rest, rest_tables, starts, weights), service_days in zip(services, cells):
+        restaurant_id = rest["id"]
+        occupation = datetime.timedelta(hours=int(rest["occupation_time"]))
+        slots = rng.choices([datetime.timedelta(minutes=m) for m in starts], cum_weights=weights, k=SAMPLES)
+        for day in service_days:
+            for table in rest_tables:
+                remaining -= 1
+                if draw() * (remaining + 1) >= n - selected: # selection sampling: exactly n bookings, all equally likely
+                    continue
+                selected += 1
+
+                booking_datetime = day + slots[int(draw() * SAMPLES)]
+                if draw() < 0.2: # a frequent customer (log-uniform: the first users book more)
+                    user_id = min(users, int(frequent ** draw()))
+                else:
+                    user_id = int(draw() * users) + 1
+                entrance_datetime = None
+                if booking_datetime + occupation < now and draw() >= NO_SHOWS:
+                    entrance_datetime = booking_datetime + entrances[int(draw() * SAMPLES)]
+                yield (
+                    user_id,
+                    restaurant_id,
+                    min(people[int(draw() * SAMPLES)], table["capacity"]),
+                    min(booking_datetime - leads[int(draw() * SAMPLES)], now),
+                    booking_datetime,
+                    entrance_datetime,
+                    table["id"],
+                )
+                if selected == n:
+                    return
+
+def batches(rows, size):
+    """ Yield lists of size rows (the last one can be shorter) """
+    rows = iter(rows)
+    while True:
+        batch = list(itertools.islice(rows, size))
+        if batch == []:
+            return
+        yield batch
+
+def insert_bookings(rows, batch_size=BATCH_SIZE):
+    """ Insert the bookings (tuples with the values of COLUMNS) in the current transaction, in the fastest way of the database:
+        - SQLite: executemany of the driver (the datetimes formatted as SQLAlchemy stores them)
+        - PostgreSQL (psycopg2): COPY
+        - otherwise: executemany of SQLAlchemy
+    """
+    connection = db.session.connection()
+    if connection.dialect.name == "sqlite":
+        cursor = connection.connection.cursor()
+        sql = "INSERT INTO booking (%s) VALUES (%s)" % (", ".join(COLUMNS), ", ".join("?" * len(COLUMNS)))
+        for batch in batches(rows, batch_size):
+            cursor.executemany(sql, [
+                (u, r, p, d.isoformat(" ", "microseconds"), b.isoformat(" ", "microseconds"), None if e is None else e.isoformat(" ", "microseconds"), t)
+                for u,r,p,d,b,e,t in batch
+            ])
+    elif connection.dialect.name == "postgresql" and connection.dialect.driver == "psycopg2":
+        cursor = connection.connection.cursor()
+        sql = "COPY booking (%s) FROM STDIN WITH (FORMAT csv)" % ", ".join(COLUMNS)
+        for batch in batches(rows, batch_size):
+            buffer = io.StringIO()
+            csv.writer(buffer).writerows(batch) # None is an empty field (NULL)
+            buffer.seek(0)
+            cursor.copy_expert(sql, buffer)
+    else:
+        insert = Booking.__table__.insert()
+        for batch in batches(rows, batch_size):
+            connection.execute(insert, [dict(zip(COLUMNS, row)) for row in batch])
+
+def put_fake_bookings(n, users=1000, days=0, seed=0, world=None):
+    """ Insert n random bookings (see generate) with a single commit
+
+    The bookings are in the restaurants of the mocks, or of the fake world (restaurants, tables) if given.
+    The restaurants are locked meanwhile, their occupancy is loaded again and the cached responses are forgotten (the rows are inserted without the ORM).
+    If the table has fewer rows than n, its indexes are dropped and built again at the end (faster than updating them for each row).
+
+    Return n, None if a db error occured (no booking is added)
+    """
+    restaurants, tables = (utils.restaurants, utils.tables) if world is None else world
+    try:
+        for rest in restaurants:
+            if lock_restaurant(rest["id"]) is None: # db error
+                return None
+        rows = generate(n, restaurants, tables, users, days, seed)
+        connection = db.session.connection()
+        rebuild = db.session.query(Booking.id).count() < n
+        if rebuild:
+            for index in Booking.__table__.indexes:
+                index.drop(connection)
+        insert_bookings(rows)
+        if rebuild:
+            for index in Booking.__table__.indexes:
+                index.create(connection)
+        db.session.commit()
+    except ValueError:
+        db.session.rollback()
+        raise
+    except:
+        db.session.rollback()
+        return None
+    invalidate_responses()
+    warm_occupancy()
+    return n
+
+def main():
+    parser = argparse.ArgumentParser(description="Insert random bookings in the database of a configuration")
+    parser.add_argument("configuration", nargs="?", default=None, help="the configuration of config.ini (the default one if missing)")
+    parser.add_argument("--rows", type=int, default=None, help="bookings inserted (default: FAKE_DATA_ROWS)")
+    parser.add_argument("--restaurants", type=int, default=None, help="random restaurants, 0 for the ones of the mocks (default: FAKE_DATA_RESTAURANTS)")
+    parser.add_argument("--tables", type=int, default=None, help="tables of each random restaurant (default: FAKE_DATA_TABLES)")
+    parser.add_argument("--users", type=int, default=None, help="users making the bookings (default: FAKE_DATA_USERS)")
+    parser.add_argument("--days", type=int, default=None, help="days of the period, 0 to derive it from the rows (default: FAKE_DATA_DAYS)")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the random numbers")
+    args = parser.parse_args()
+
+    from bookings.app import create_app
+    app = create_app(args.configuration).app
+    config = app.config
+    rows = config["FAKE_DATA_ROWS"] if args.rows is None else args.rows
+    restaurants = config["FAKE_DATA_RESTAURANTS"] if args.restaurants is None else args.restaurants
+    tables = config["FAKE_DATA_TABLES"] if args.tables is None else args.tables
+    world = fake_restaurants(restaurants, tables) if restaurants > 0 else None
+
+    with app.app_context():
+        start = time.perf_counter()
+        put_fake_bookings(rows,
+            users=config["FAKE_DATA_USERS"] if args.users is None else args.users,
+            days=config["FAKE_DATA_DAYS"] if args.days is None else args.days,
+            seed=args.seed,
+            world=world)
+        logging.info("- GoOutSafe:Bookings %d fake bookings inserted in %.1f s", rows, time.perf_counter() - start)
+
+if __name__ == "__main__":
+    main()
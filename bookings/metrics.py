@@ -0,0 +1,136 @@
+""" The Prometheus metrics of the service (exposed by GET /metrics)
+
+- the number of requests and the time spent in the handler of each operation (by operationId),
+  with the refused requests (400, 409, 500 ...) counted by reason (the title of the error or the class of the exception),
+  also the ones refused before the handler (e.g. by the validation of the request, see init_errors)
+- the requests to the restaurant microservice (by outcome) and the state of its circuit breaker (see bookings.breaker)
+- the time to lock a restaurant and to search its occupied tables (in the occupancy index or in the database)
+- the serialization of the lists of bookings
+- the statements run on the database: their time and how many for each request (see bookings.statements)
+
+The metrics are updated in memory (a few microseconds each).
+With many worker processes (e.g. gunicorn), PROMETHEUS_MULTIPROC_DIR must be set to an empty directory
+shared by the workers (before they start): each worker writes its metrics there and /metrics aggregates them.
+"""
+
+import functools
+import os
+import time
+
+from flask import g, request
+
+from werkzeug.exceptions import HTTPException, default_exceptions
+
+from connexion.apis.flask_utils import flaskify_endpoint
+from connexion.exceptions import ProblemException
+from connexion.resolver import Resolver
+
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, CONTENT_TYPE_LATEST, generate_latest, multiprocess
+
+FAST_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+REQUESTS = Counter("bookings_requests_total", "Requests handled, by operation and status code", ["operation", "status"])
+REQUEST_LATENCY = Histogram("bookings_request_duration_seconds", "Time spent in the handler of each operation", ["operation"])
+REFUSED = Counter("bookings_refused_requests_total", "Requests refused (status code 400 or more), by operation, status code and reason", ["operation", "status", "reason"])
+
+RESTAURANT_LATENCY = Histogram("bookings_restaurant_request_duration_seconds", "Requests to the restaurant microservice, by outcome (ok, error, failed, rejected)", ["outcome"])
+BREAKER_STATE = Gauge("bookings_circuit_breaker_state", "State of the circuit breaker of a remote service (0 closed, 1 half open, 2 open)", ["service"], multiprocess_mode="liveall")
+BREAKER_OPENED = Counter("bookings_circuit_breaker_opened_total", "Times the circuit breaker of a remote service has been opened", ["service"])
+BREAKER_REJECTED = Counter("bookings_circuit_breaker_rejected_calls_total", "Calls to a remote service not made because its circuit breaker was open", ["service"])
+LOCK_LATENCY = Histogram("bookings_restaurant_lock_duration_seconds", "Time to lock the bookings of a restaurant (waiting for the other requests)", buckets=FAST_BUCKETS)
+SEARCH_LATENCY = Histogram("bookings_occupied_tables_search_duration_seconds", "Search of the occupied tables in get_a_table, by source (index or database)", ["source"], buckets=FAST_BUCKETS)
+SERIALIZATION_LATENCY = Histogram("bookings_serialization_duration_seconds", "Serialization of the lists of bookings", buckets=FAST_BUCKETS)
+STATEMENT_LATENCY = Histogram("bookings_db_statement_duration_seconds", "Statements run on the database", buckets=FAST_BUCKETS)
+REQUEST_STATEMENTS = Histogram("bookings_db_statements_per_request", "Statements run on the database by each request", buckets=(0, 1, 2, 3, 5, 8, 13, 21, 50, 100))
+
+INDEX_SEARCH = SEARCH_LATENCY.labels("index")
+DATABASE_SEARCH = SEARCH_LATENCY.labels("database")
+
+def status_of(result):
+    """ Return the status code of the value returned by a handler """
+    if isinstance(result, tuple) and len(result) > 1 and isinstance(result[1], int):
+        return result[1]
+    return getattr(result, "status_code", 200)
+
+def reason_of(result):
+    """ Return the reason of a refused request: the title of the error (one for each status code, not the detail) """
+    body = result[0] if isinstance(result, tuple) else None
+    if isinstance(body, dict):
+        return str(body.get("title") or "")
+    return ""
+
+def instrument(operation, function):
+    """ Return the handler of the operation measured: time, status code and reason of the refused requests """
+    latency = REQUEST_LATENCY.labels(operation)
+    counters = {} # status code -> the counter of the requests (labels are looked up once)
+
+    @functools.wraps(function) # connexion reads the parameters of the original function
+    def handler(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            result = function(*args, **kwargs)
+        except (ProblemException, HTTPException):
+            latency.observe(time.perf_counter() - start)
+            raise # an error response: counted by the error handler (see init_errors)
+        except Exception as e:
+            latency.observe(time.perf_counter() - start)
+            g.measured = True
+            REQUESTS.labels(operation, "500").inc()
+            REFUSED.labels(operation, "500", type(e).__name__).inc()
+            raise
+        latency.observe(time.perf_counter() - start)
+        g.measured = True
+        status = status_of(result)
+        counter = counters.get(status)
+        if counter is None:
+            counter = counters.setdefault(status, REQUESTS.labels(operation, str(status)))
+        counter.inc()
+        if status >= 400:
+            REFUSED.labels(operation, str(status), reason_of(result)).inc()
+        return result
+    return handler
+
+ENDPOINTS = {} # the Flask endpoint of each operation measured -> its operationId
+
+class MetricsResolver(Resolver):
+    """ Resolves the operationIds as connexion does, measuring the calls of each operation """
+    def resolve_function_from_operation_id(self, operation_id):
+        ENDPOINTS[flaskify_endpoint(operation_id)] = operation_id
+        return instrument(operation_id, self.handler(operation_id))
+
+    def handler(self, operation_id):
+        """ Return the function measured for the operation (the one of connexion, a subclass can wrap it) """
+        return super().resolve_function_from_operation_id(operation_id)
+
+def init_errors(app):
+    """ Count the error responses of the operations not returned by their handlers (see instrument)
+
+    e.g. the 400 of connexion when the request is not valid (the handler is not called).
+    The error handlers of connexion (app is the connexion app) are wrapped.
+    """
+    counted = count_errors(app.common_error_handler)
+    for code in default_exceptions:
+        app.add_error_handler(code, counted)
+    app.add_error_handler(ProblemException, counted)
+
+def count_errors(handler):
+    """ Return the error handler counting the error responses of the operations (by status code and title) """
+    @functools.wraps(handler)
+    def counted(exception):
+        response = handler(exception)
+        operation = ENDPOINTS.get(request.endpoint)
+        if operation is not None and not g.get("measured"): # not an unknown url, not already counted by instrument
+            status = str(response.status_code)
+            REQUESTS.labels(operation, status).inc()
+            if response.status_code >= 400:
+                REFUSED.labels(operation, status, getattr(exception, "title", None) or getattr(exception, "name", "")).inc()
+        return response
+    return counted
+
+def exposition():
+    """ Return the metrics (of all the workers, in multiprocess mode) in the Prometheus text format and its content type """
+    registry = REGISTRY
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ or "prometheus_multiproc_dir" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,181 @@
+""" An in-process index of the occupied tables of the restaurants
+
+For each restaurant it keeps, for each table, the sorted list of the datetimes of its bookings,
+so a free table is found with a binary search for each table (from the smaller one)
+instead of a range query on the database.
+
+The database is the source of truth: the index of a restaurant is labelled with the version
+of its bookings (see utils.lock_restaurant) and it is used only if the version is still the same,
+otherwise it is loaded again from the database.
+
+The index is bounded: the bookings that fall behind the window (OCCUPANCY_WINDOW) are dropped while it moves on (see trim)
+and only the OCCUPANCY_MAX_RESTAURANTS restaurants used most recently are kept.
+"""
+
+import bisect
+import datetime
+import sys
+import threading
+
+from collections import OrderedDict
+
+TRIM_STEP = datetime.timedelta(minutes=10) # how much the window moves before the bookings behind it are dropped
+
+class RestaurantOccupancy:
+    def __init__(self, version, since):
+        """ The bookings of a restaurant, by table
+
+        Params:
+            - version: the version of the bookings of the restaurant at the time of the load
+            - since: only the bookings after this datetime are stored
+        """
+        self.version = version
+        self.since = since
+        self._bookings = {} # booking id -> (table id, booking datetime)
+        self._tables = {} # table id -> sorted list of (booking datetime, booking id)
+        self._sorted = (None, [], []) # (the tables of the restaurant, the same tables sorted by capacity, their capacities)
+
+    def add(self, booking_id, table_id, booking_datetime):
+        """ Add a booking (or move it, if it is already present) """
+        self.remove(booking_id)
+        if booking_datetime is None or booking_datetime <= self.since:
+            return
+        self._bookings[booking_id] = (table_id, booking_datetime)
+        bisect.insort(self._tables.setdefault(table_id, []), (booking_datetime, booking_id))
+
+    def remove(self, booking_id):
+        """ Remove a booking (if present) """
+        booking = self._bookings.pop(booking_id, None)
+        if booking is None:
+            return
+        table_id, booking_datetime = booking
+        bookings = self._tables[table_id]
+        del bookings[bisect.bisect_left(bookings, (booking_datetime, booking_id))]
+
+    def trim(self, since):
+        """ Move the start of the stored period to since, dropping the bookings before it """
+        if since <= self.since:
+            return
+        self.since = since
+        for table_id, bookings in list(self._tables.items()):
+            first = bisect.bisect_right(bookings, (since, sys.maxsize))
+            if first == 0:
+                continue
+            for _, booking_id in bookings[:first]:
+                del self._bookings[booking_id]
+            if first == len(bookings):
+                del self._tables[table_id]
+            else:
+                self._tables[table_id] = bookings[first:] # a new list: a search running meanwhile keeps the old one
+
+    def __len__(self):
+        return len(self._bookings)
+
+    def is_free(self, table_id, starting_period, ending_period, excluded=-1):
+        """ Return True if the table has no bookings strictly between starting_period and ending_period (excluded apart) """
+        bookings = self._tables.get(table_id, [])
+        i = bisect.bisect_right(bookings, (starting_period, sys.maxsize))
+        while i < len(bookings) and bookings[i][0] < ending_period:
+            if bookings[i][1] != excluded:
+                return False
+            i += 1
+        return True
+
+    def by_capacity(self, tables):
+        """ Return the tables (json) sorted by capacity and their capacities (computed once for the same list of tables) """
+        if self._sorted[0] is not tables:
+            by_capacity = sorted(tables, key=lambda x:x["capacity"])
+            self._sorted = (tables, by_capacity, [t["capacity"] for t in by_capacity])
+        return self._sorted[1], self._sorted[2]
+
+    def free_table(self, tables, number_of_people, starting_period, ending_period, excluded=-1):
+        """ Return the smaller free table that can be used by number_of_people, otherwise -1 (as utils.free_table) """
+        tables, capacities = self.by_capacity(tables)
+        first = bisect.bisect_left(capacities, number_of_people)
+        for table in tables[first:]:
+            if self.is_free(table["id"], starting_period, ending_period, excluded):
+                return table["id"]
+        return -1
+
+class OccupancyIndex:
+    def __init__(self, max_restaurants=10000):
+        """ The thread safe index of the occupancy of the restaurants used most recently (at most max_restaurants) """
+        self.max_restaurants = max_restaurants
+        self.hits = 0
+        self.loads = 0
+        self.evictions = 0
+        self._restaurants = OrderedDict() # restaurant id -> RestaurantOccupancy, from the least to the most recently used
+        self._lock = threading.Lock()
+
+    def get(self, restaurant_id, version, since, window=None):
+        """ Return the occupancy of the restaurant if it is at version and covers the bookings after since, otherwise None
+
+        If window (the start of the period kept) has moved on by TRIM_STEP, the bookings before it are dropped first.
+        """
+        with self._lock:
+            occupancy = self._restaurants.get(restaurant_id)
+            if occupancy is None or occupancy.version != version:
+                return None
+            if window is not None and window - occupancy.since >= TRIM_STEP:
+                occupancy.trim(window)
+            if since < occupancy.since:
+                return None
+            self._restaurants.move_to_end(restaurant_id)
+            self.hits += 1
+            return occupancy
+
+    def put(self, restaurant_id, occupancy):
+        """ Store the occupancy of a restaurant just loaded from the database (the least recently used one may be evicted) """
+        with self._lock:
+            self._restaurants[restaurant_id] = occupancy
+            self._restaurants.move_to_end(restaurant_id)
+            self.loads += 1
+            while len(self._restaurants) > self.max_restaurants:
+                self._restaurants.popitem(last=False)
+                self.evictions += 1
+
+    def apply(self, restaurant_id, version, changes):
+        """ Apply the changes committed with a new version of the bookings of a restaurant
+
+        They are applied only if the occupancy is at the previous version,
+        otherwise it is discarded (it is loaded again when needed).
+
+        Params:
+            - version: the version of the bookings of the restaurant after the changes
+            - changes: a list of (booking id, table id, booking datetime), the datetime is None if the booking was deleted
+        """
+        with self._lock:
+            occupancy = self._restaurants.get(restaurant_id)
+            if occupancy is None:
+                return
+            if occupancy.version != version - 1:
+                del self._restaurants[restaurant_id]
+                return
+            for booking_id, table_id, booking_datetime in changes:
+                if booking_datetime is None:
+                    occupancy.remove(booking_id)
+                else:
+                    occupancy.add(booking_id, table_id, booking_datetime)
+            occupancy.version = version
+
+    def discard(self, restaurant_id=None):
+        """ Forget the occupancy of a restaurant (of all of them if restaurant_id is None) """
+        with self._lock:
+            if restaurant_id is None:
+                self._restaurants.clear()
+            else:
+                self._restaurants.pop(restaurant_id, None)
+
+    def __len__(self):
+        return len(self._restaurants)
+
+    def stats(self):
+        """ Return the counters of the index as a dict """
+        with self._lock:
+            return {
+                "restaurants": len(self._restaurants),
+                "bookings": sum(len(o) for o in self._restaurants.values()),
+                "hits": self.hits,
+                "loads": self.loads,
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,132 @@
+""" Profiling of single requests in production, written as collapsed stacks (flame graphs)
+
+The profiler is enabled by PROFILE_DIR (the directory of the profiles), then a request is profiled if
+    - it has the header X-Profile with the value of PROFILE_TOKEN (if it is set), or
+    - it is chosen at random, with probability PROFILE_RATE
+and its profile is written in PROFILE_DIR (the name is in the header X-Profile of the response).
+Only the last PROFILE_MAX_FILES profiles are kept.
+
+A profile is the time spent in each stack of calls of the handler (Python and C functions, e.g. the database driver),
+one line for each stack: "handler;function;...;function microseconds" (the collapsed format),
+that can be turned into a flame graph, e.g. with flamegraph.pl (https://github.com/brendangregg/FlameGraph)
+or speedscope (https://www.speedscope.app):
+
+    $ flamegraph.pl profiles/20201110T103000.123456-app.get_bookings-42.collapsed > get_bookings.svg
+
+The calls are traced (sys.setprofile) only in the thread of the profiled request, so the other requests are not slowed down,
+but the work done in other threads (e.g. the calls to the restaurant microservice) and in the streamed responses is not included.
+When the profiler is disabled the cost is a lookup in the extensions of the app for each request.
+"""
+
+import datetime
+import functools
+import hmac
+import os
+import random
+import sys
+import time
+
+from flask import after_this_request, current_app, request
+
+from bookings.metrics import MetricsResolver
+
+class Tracer:
+    def __init__(self):
+        """ The time spent in each stack of calls of the current thread, while it is running (see the module) """
+        self.stacks = {} # "function;...;function" -> seconds spent in the last function (not in its calls)
+        self.frames = [] # the current stack: [label, start, seconds spent in the calls]
+
+    def __enter__(self):
+        sys.setprofile(self.event)
+        return self
+
+    def __exit__(self, *exc):
+        sys.setprofile(None)
+        self.frames = []
+
+    def event(self, frame, event, arg):
+        now = time.perf_counter()
+        if event == "call":
+            self.frames.append([label(frame.f_code), now, 0.0])
+        elif event == "c_call":
+            self.frames.append([c_label(arg), now, 0.0])
+        elif self.frames: # return, c_return, c_exception (not the ones of the calls started before the tracing)
+            name, start, calls = self.frames.pop()
+            elapsed = now - start
+            key = ";".join([f[0] for f in self.frames] + [name])
+            self.stacks[key] = self.stacks.get(key, 0) + elapsed - calls
+            if self.frames:
+                self.frames[-1][2] += elapsed
+
+    def collapsed(self):
+        """ Return the stacks in the collapsed format: a line for each stack, with its time in microseconds """
+        return "".join("%s %d\n" % (stack, round(seconds * 1000000)) for stack, seconds in sorted(self.stacks.items()) if seconds >= 0.0000005)
+
+def label(code):
+    """ Return the name of a Python function with its file (the last two parts of the path) and line """
+    path = code.co_filename.replace("\\", "/").rsplit("/", 2)
+    return "%s (%s:%d)" % (code.co_name, "/".join(path[-2:]), code.co_firstlineno)
+
+def c_label(function):
+    """ Return the name of a C function (e.g. Cursor.execute) """
+    module = getattr(function, "__module__", None) or type(getattr(function, "__self__", None)).__module__
+    return "%s.%s" % (module, getattr(function, "__qualname__", repr(function)))
+
+class Profiler:
+    def __init__(self, directory, rate=0, token="", max_files=100):
+        """ Chooses the requests to profile and writes their profiles (see the module)
+
+        Params:
+            - directory: where the profiles are written (created if missing)
+            - rate: the probability of profiling a request (0: only the ones asking for it)
+            - token: the value of the header X-Profile that asks for a profile of the request (empty: the header is ignored)
+            - max_files: the number of profiles kept (the oldest ones are removed), at least 1
+        """
+        if max_files < 1:
+            raise ValueError("PROFILE_MAX_FILES must be at least 1, not "+str(max_files))
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.rate = rate
+        self.token = str(token) # a number in config.ini is read as a number
+        self.max_files = max_files
+
+    def wanted(self):
+        """ Return True if the current request must be profiled """
+        if self.token != "" and hmac.compare_digest(request.headers.get("X-Profile", "").encode(), self.token.encode()): # in constant time
+            return True
+        return self.rate > 0 and random.random() < self.rate
+
+    def save(self, operation, tracer):
+        """ Write the profile of a request and remove the oldest ones, return the name of the file """
+        name = "%s-%s-%d.collapsed" % (datetime.datetime.now().strftime("%Y%m%dT%H%M%S.%f"), operation, os.getpid())
+        with open(os.path.join(self.directory, name), "w") as f:
+            f.write(tracer.collapsed())
+        profiles = sorted(p for p in os.listdir(self.directory) if p.endswith(".collapsed"))
+        for old in profiles[:-self.max_files]:
+            try:
+                os.remove(os.path.join(self.directory, old))
+            except OSError: # already removed (by another worker)
+                pass
+        return name
+
+def profiled(operation, function):
+    """ Return the handler of the operation, profiled when the profiler asks for it """
+    @functools.wraps(function) # connexion reads the parameters of the original function
+    def handler(*args, **kwargs):
+        profiler = current_app.extensions.get("profiler")
+        if profiler is None or not profiler.wanted():
+            return function(*args, **kwargs)
+        with Tracer() as tracer:
+            result = function(*args, **kwargs)
+        name = profiler.save(operation, tracer)
+        @after_this_request
+        def add_header(response):
+            response.headers["X-Profile"] = name
+            return response
+        return result
+    return handler
+
+class ProfilingResolver(MetricsResolver):
+    """ A MetricsResolver whose handlers are also profiled on request (the profiles start from the handler) """
+    def handler(self, operation_id):
+        return profiled(operation_id, super().handler(operation_id))
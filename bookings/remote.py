@@ -0,0 +1,68 @@
+""" The async client of the restaurant microservice (REMOTE_CLIENT = async)
+
+The requests are coroutines (httpx) running on an event loop in a background thread of the app,
+so the lookups started in background (see bookings.utils.fetch_restaurant) wait for the restaurant microservice
+together, with a shared pool of connections, instead of taking one of the REMOTE_WORKERS threads of the app each.
+
+It is a blocking bridge: the handlers are synchronous (run by the server threads),
+they schedule the coroutines and wait for their results (see bookings.utils.fetch_restaurant and get_cached_from),
+so each request being served still holds its server thread while it waits.
+
+    client = AsyncClient(config)
+    future = client.submit(coroutine) # a concurrent.futures.Future
+    result = client.run(coroutine) # wait for the result
+    client.close()
+"""
+
+import asyncio
+import threading
+
+import httpx
+
+class AsyncClient:
+    def __init__(self, config):
+        """ Start the event loop and open the connection pool
+
+        Configuration:
+            - TIMEOUT: the timeout of the requests (seconds)
+            - HTTP_ASYNC_CONNECTIONS: the max number of connections open at the same time (for all the hosts)
+            - HTTP_POOL_MAXSIZE: the max number of idle keep-alive connections kept
+            - HTTP_RETRIES: how many times a request is retried when the connection fails
+        """
+        self.loop = asyncio.new_event_loop()
+        self._tasks = set() # the tasks started by spawn (a reference is kept until they are done)
+        self._thread = threading.Thread(target=self.loop.run_forever, name="restaurants-loop", daemon=True)
+        self._thread.start()
+        self.client = self.run(self._open(config))
+
+    async def _open(self, config):
+        limits = httpx.Limits(max_connections=config["HTTP_ASYNC_CONNECTIONS"], max_keepalive_connections=config["HTTP_POOL_MAXSIZE"])
+        transport = httpx.AsyncHTTPTransport(retries=config["HTTP_RETRIES"], limits=limits)
+        return httpx.AsyncClient(transport=transport, timeout=config["TIMEOUT"])
+
+    async def get(self, url):
+        """ Return the response of a get request (raises httpx.HTTPError on connection errors and timeouts) """
+        return await self.client.get(url)
+
+    def submit(self, coroutine):
+        """ Schedule a coroutine on the event loop (from any thread), return a Future with its result """
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+    def run(self, coroutine):
+        """ Run a coroutine on the event loop and wait for its result (never from the event loop) """
+        return self.submit(coroutine).result()
+
+    def spawn(self, coroutine):
+        """ Start a coroutine in background (from the event loop) without waiting for it """
+        task = self.loop.create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def close(self):
+        """ Close the connections and stop the event loop """
+        if self.loop.is_closed():
+            return
+        self.run(self.client.aclose())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self.loop.close()
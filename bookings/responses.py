@@ -0,0 +1,138 @@
+""" A short-lived cache of the responses of GET /bookings and GET /bookings/{id}
+
+A response is stored with a key made of the normalized parameters of the request and of a tag,
+the most selective filter of the request (e.g. the user for GET /bookings?user=3&rest=2,
+the booking for GET /bookings/{id}, all the bookings for an unfiltered list).
+Every tag has a token (a random value) that is part of the keys:
+when a booking changes, the tokens of its user, restaurant, tables and of the booking itself are replaced,
+so the responses that could contain it are no longer found (they are evicted or expire later).
+
+The key is computed before the database is read, so a response read before a change
+is stored with the old token and never served after the change (see utils.invalidate_responses).
+
+The backend stores the entries (tokens and responses), with a time to live and a bounded size:
+    - TTLCache: in the process (LRU), for a single process
+    - RedisBackend: in a Redis server shared by all the workers (RESPONSE_CACHE_URL)
+Any object with get(key) and set(key, value) can be used instead (e.g. a fake in the tests).
+
+The responses have a strong ETag (see booking_etag and list_etag), so the clients can revalidate them
+(If-None-Match: 304 without a body) and change a booking only if it has not changed meanwhile (If-Match).
+"""
+
+import hashlib
+import logging
+import pickle
+import uuid
+
+class ResponseCache:
+    def __init__(self, backend):
+        """ A cache of responses stored in a backend (see the module) """
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def token(self, name):
+        """ Return the token of a tag (a new one if it is missing) """
+        token = self.backend.get("token:"+name)
+        if token is None:
+            token = uuid.uuid4().hex
+            self.backend.set("token:"+name, token)
+        return token
+
+    def key(self, tag, params):
+        """ Return the key of a response (params: the normalized parameters of the request, a string) """
+        return "response:%s:%s:%s:%s" % (self.token("*"), tag, self.token(tag), params)
+
+    def get(self, key):
+        """ Return the response stored with the key or None """
+        response = self.backend.get(key)
+        if response is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return response
+
+    def set(self, key, response):
+        """ Store the response with the key """
+        self.backend.set(key, response)
+
+    def invalidate(self, tags):
+        """ Forget the responses with these tags """
+        for tag in tags:
+            self.backend.set("token:"+tag, uuid.uuid4().hex)
+            self.invalidations += 1
+
+    def clear(self):
+        """ Forget all the responses """
+        self.invalidate(["*"])
+
+    def stats(self):
+        """ Return the counters of the cache as a dict (with the ones of the backend, if any) """
+        stats = self.backend.stats() if hasattr(self.backend, "stats") else {}
+        stats.update({
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+        })
+        return stats
+
+class RedisBackend:
+    def __init__(self, url, ttl, prefix="bookings:"):
+        """ The entries in a Redis server (the redis package is needed)
+
+        The errors of the server are logged and the entries are considered missing,
+        so the requests are served by the database.
+
+        Params:
+            - url: the url of the server (e.g. redis://redis:6379/0)
+            - ttl: the time to live of an entry (in seconds)
+            - prefix: the prefix of the keys in the server
+        """
+        import redis # optional dependency
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, key):
+        try:
+            value = self.client.get(self.prefix+key)
+        except Exception as e:
+            logging.info("- GoOutSafe:Bookings response cache unavailable -> %s", e)
+            return None
+        return None if value is None else pickle.loads(value)
+
+    def set(self, key, value):
+        try:
+            self.client.set(self.prefix+key, pickle.dumps(value), ex=self.ttl)
+        except Exception as e:
+            logging.info("- GoOutSafe:Bookings response cache unavailable -> %s", e)
+
+def booking_tags(booking_id, user_ids, restaurant_ids, table_ids):
+    """ Return the tags of the responses that can contain a booking (with its users, restaurants and tables before and after a change) """
+    return ["booking:%s" % booking_id, "all"] + ["user:%s" % u for u in user_ids] + ["rest:%s" % r for r in restaurant_ids] + ["table:%s" % t for t in table_ids]
+
+def booking_etag(booking):
+    """ Return the ETag of a booking (dict with id and version), unquoted """
+    return "%s-%s" % (booking["id"], booking["version"])
+
+def list_etag(rows, id_index, version_index):
+    """ Return the ETag of a list of bookings (tuples with the id and the version at these indexes), unquoted
+
+    It is a digest of the ids and the versions of the bookings, so it changes if a booking
+    is added, removed or changed (every change increments its version).
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for row in rows:
+        digest.update(b"%d-%d," % (row[id_index], row[version_index]))
+    return digest.hexdigest()
+
+def list_tag(user=None, rest=None, table=None):
+    """ Return the tag of a list of bookings: its most selective filter """
+    if user is not None:
+        return "user:%s" % user
+    if table is not None:
+        return "table:%s" % table
+    if rest is not None:
+        return "rest:%s" % rest
+    return "all"
@@ -0,0 +1,57 @@
+""" The opening hours of a restaurant compiled for fast checks
+
+The restaurant json (closed_days and the opening/closing hours) is compiled once into two bitmasks:
+the days of the week in which it is open and the minutes of the day in which it is open,
+so checking a datetime is a couple of shifts instead of building and comparing datetimes.
+"""
+
+import functools
+
+MINUTES_IN_A_DAY = 24 * 60
+
+class Schedule:
+    __slots__ = ("days", "minutes")
+
+    def __init__(self, closed_days=(), openings=()):
+        """ The opening hours of a restaurant
+
+        Params:
+            - closed_days: the days in which the restaurant is closed (1 is Monday, 7 is Sunday)
+            - openings: the (opening, closing) pairs of each day as minutes of the day, both included (any number)
+        """
+        self.days = 0 # bit d is set if the restaurant is open in the weekday d (0 is Monday)
+        for day in range(7):
+            if day + 1 not in closed_days:
+                self.days |= 1 << day
+        self.minutes = 0 # bit m is set if the restaurant is open in the minute m of the day
+        for opening, closing in openings:
+            opening, closing = max(opening, 0), min(closing, MINUTES_IN_A_DAY - 1)
+            if opening <= closing:
+                self.minutes |= ((1 << (closing - opening + 1)) - 1) << opening
+
+    @staticmethod
+    def of(rest):
+        """ Return the schedule of a restaurant (json), compiled once for the same opening hours """
+        return _compile(
+            tuple(rest["closed_days"]),
+            rest["first_opening_hour"], rest["first_closing_hour"],
+            rest["second_opening_hour"], rest["second_closing_hour"],
+        )
+
+    def is_open(self, booking_datetime):
+        """ Check if the restaurant is open in a given datetime (the seconds are not considered) """
+        return bool((self.days >> booking_datetime.weekday()) & (self.minutes >> (booking_datetime.hour * 60 + booking_datetime.minute)) & 1)
+
+    def are_open(self, datetimes):
+        """ Check many datetimes at once: return a list of booleans (in the same order) """
+        days, minutes = self.days, self.minutes
+        return [bool((days >> d.weekday()) & (minutes >> (d.hour * 60 + d.minute)) & 1) for d in datetimes]
+
+@functools.lru_cache(maxsize=1024)
+def _compile(closed_days, first_opening_hour, first_closing_hour, second_opening_hour, second_closing_hour):
+    """ Compile the opening hours of the restaurant json (the hours are included, None if there is no opening) """
+    openings = []
+    for opening, closing in [(first_opening_hour, first_closing_hour), (second_opening_hour, second_closing_hour)]:
+        if opening is not None and closing is not None:
+            openings.append((int(opening) * 60, int(closing) * 60))
+    return Schedule(closed_days, openings)
@@ -0,0 +1,72 @@
+""" Fast serialization of the bookings for the json responses
+
+The bookings are read as tuples of column values (no ORM objects),
+the datetimes are formatted once while the dicts are built and the json is encoded
+with orjson when it is installed (with the json module otherwise).
+
+The output is the same, byte for byte, produced by connexion for the lists of Booking.dump():
+sorted keys, indent of 2 spaces, a final newline and the naive datetimes in ISO 8601 with a "Z".
+"""
+
+import json
+
+from sqlalchemy import DateTime
+
+from bookings.orm import Booking
+
+try:
+    import orjson
+except ImportError: # optional: the json module is used
+    orjson = None
+
+COLUMNS = tuple(Booking.__table__.columns.keys()) # the columns of a booking, in the order of the table
+FIELDS = COLUMNS + ("url",) # the properties of a booking in the responses
+DATETIME_COLUMNS = frozenset(c.name for c in Booking.__table__.columns if isinstance(c.type, DateTime))
+
+def columns_for(fields=FIELDS):
+    """ Return the columns to read to build the requested fields (the id and the version are always read: pagination and ETag) """
+    return tuple(c for c in COLUMNS if c in fields or c in ("id", "version"))
+
+def isoformat(value):
+    """ Format a datetime like connexion does (a naive datetime is UTC, so a "Z" is added) """
+    if value.tzinfo is None:
+        return value.isoformat()+"Z"
+    return value.isoformat()
+
+def serialize(rows, columns=COLUMNS, fields=FIELDS):
+    """ Return the bookings as a list of dicts ready for json
+
+    Params:
+        - rows: the bookings as tuples with the values of the columns
+        - columns: the names of the values in each row
+        - fields: the properties to keep (url included)
+    """
+    keep = [(i,c) for i,c in enumerate(columns) if c in fields]
+    datetimes = [i for i,c in keep if c in DATETIME_COLUMNS]
+    url = "url" in fields
+    id_index = columns.index("id")
+
+    bookings = []
+    for row in rows:
+        if datetimes:
+            row = list(row)
+            for i in datetimes:
+                if row[i] is not None:
+                    row[i] = isoformat(row[i])
+        booking = {c: row[i] for i,c in keep}
+        if url:
+            booking["url"] = "/bookings/"+str(row[id_index])
+        bookings.append(booking)
+    return bookings
+
+def dumps(data):
+    """ Return the body (bytes) of a json response """
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_SORT_KEYS | orjson.OPT_APPEND_NEWLINE)
+    return (json.dumps(data, indent=2, sort_keys=True)+"\n").encode()
+
+def dumps_line(data):
+    """ Return a line (bytes) of a newline delimited json response (compact json) """
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_SORT_KEYS | orjson.OPT_APPEND_NEWLINE)
+    return (json.dumps(data, sort_keys=True, separators=(",",":"))+"\n").encode()
@@ -0,0 +1,118 @@
+""" The production server: gunicorn, with the settings of the app configuration
+
+    $ ./run.sh PROD # SERVER = gunicorn in config.ini
+
+The master process prepares the database once (see setup), then forks WORKERS processes.
+Without PRELOAD each worker creates its own app after the fork;
+with PRELOAD the app is created once in the master and each worker recreates
+its connections and threads (see reinit), so nothing is shared between the processes.
+With more than one worker the responses are cached only in a shared cache (RESPONSE_CACHE_URL).
+
+The metrics of all the workers are reported by GET /metrics when PROMETHEUS_MULTIPROC_DIR is set
+(run.sh sets it), see bookings/metrics.py.
+"""
+
+import logging
+import multiprocessing
+import os
+
+from gunicorn.app.base import BaseApplication
+
+from prometheus_client import multiprocess
+
+from bookings.app import create_app, get_config, reinit, teardown
+from bookings.orm import db
+
+WORKER_CLASSES = { # WORKER_CLASS: the gunicorn worker class
+    "sync": "sync", # one request at a time
+    "gthread": "gthread", # THREADS requests at a time
+    "threaded": "gthread",
+    "gevent": "gevent", # greenlets (needs gevent installed)
+    "uvicorn": "uvicorn.workers.UvicornWorker", # ASGI (needs uvicorn installed)
+}
+
+def options(config):
+    """ Return the gunicorn settings for an app configuration """
+    if config["WORKER_CLASS"] not in WORKER_CLASSES:
+        raise ValueError("Unknown WORKER_CLASS "+str(config["WORKER_CLASS"])+" (one of "+", ".join(WORKER_CLASSES)+")")
+    workers = config["WORKERS"]
+    if workers <= 0:
+        workers = multiprocessing.cpu_count() * 2 + 1
+    return {
+        "bind": "%s:%d" % (config["IP"], config["PORT"]),
+        "workers": workers,
+        "worker_class": WORKER_CLASSES[config["WORKER_CLASS"]],
+        "threads": config["THREADS"],
+        "keepalive": config["KEEPALIVE"],
+        "graceful_timeout": config["GRACEFUL_TIMEOUT"],
+        "timeout": config["WORKER_TIMEOUT"],
+        "preload_app": config["PRELOAD"],
+        "post_fork": post_fork,
+        "child_exit": child_exit,
+        "worker_exit": worker_exit,
+    }
+
+def post_fork(arbiter, worker):
+    """ gunicorn hook (in the new worker): the preloaded app gets its own connections and threads """
+    if arbiter.app.application is not None:
+        reinit(arbiter.app.application)
+
+def worker_exit(arbiter, worker):
+    """ gunicorn hook (in the worker, when it stops): the app releases its connections and threads """
+    if worker.app.loaded is not None:
+        teardown(worker.app.loaded)
+
+def child_exit(arbiter, worker):
+    """ gunicorn hook (in the master): the metrics of a dead worker are merged and its live gauges removed """
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        multiprocess.mark_process_dead(worker.pid)
+
+class Server(BaseApplication):
+    def __init__(self, configuration=None):
+        """ The gunicorn application for a configuration of config.ini (the default one if None) """
+        self.configuration = configuration
+        self.conf = get_config(configuration)
+        self.application = None # the Flask app, when preloaded
+        self.loaded = None # the Flask app of this process (the one of the worker or the preloaded one)
+        super().__init__()
+
+    def load_config(self):
+        for k,v in options(self.conf).items():
+            self.cfg.set(k, v)
+
+    def load(self):
+        """ Return the WSGI (or ASGI) callable
+
+        Called in the master before the fork with PRELOAD, in each worker otherwise.
+        """
+        if self.conf["PRELOAD"]:
+            application = self.application = create_app(self.configuration).app
+        else:
+            application = create_app(self.configuration, prepare=False).app
+        self.loaded = application
+        if options(self.conf)["workers"] > 1 and not self.conf["RESPONSE_CACHE_URL"] and application.extensions.pop("response_cache", None) is not None:
+            # a worker would not know the changes made by the others: only a shared cache can be invalidated
+            logging.info("- GoOutSafe:Bookings response cache disabled: set RESPONSE_CACHE_URL to share it among the workers")
+        if self.conf["WORKER_CLASS"] == "uvicorn":
+            return asgi(application)
+        return application
+
+def asgi(application):
+    """ Return the ASGI callable of a WSGI app (the requests are handled by a pool of threads) """
+    from asgiref.wsgi import WsgiToAsgi
+    return WsgiToAsgi(application)
+
+def prepare(configuration=None):
+    """ Prepare the database (remove, create, migrate and fill it as configured) and release the app """
+    application = create_app(configuration).app
+    teardown(application)
+    with application.app_context():
+        db.get_engine(application).dispose()
+
+def serve(configuration=None):
+    """ Run the app with gunicorn until it is stopped (SIGTERM or SIGINT stop it gracefully) """
+    server = Server(configuration)
+    if not server.conf["PRELOAD"]:
+        prepare(configuration) # once, the workers use the database as it is
+    logging.info("- GoOutSafe:Bookings gunicorn: %s", options(server.conf))
+    server.run()
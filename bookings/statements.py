@@ -0,0 +1,81 @@
+""" The statements run on the database: how many for each request, how long they take and which ones are slow
+
+Every statement is timed by the events of the engine (a few microseconds each):
+    - the statements of a request and their time are counted (in flask.g) and, in debug mode,
+      returned in the headers X-Query-Count and X-Query-Time (milliseconds) of the response
+      (the statements of a streamed list run after the headers are sent: they are not counted)
+    - the statements slower than SLOW_QUERY_MS are logged with their parameters and their query plan (EXPLAIN)
+    - the time of the statements and the statements of each request are in the metrics (see bookings.metrics)
+
+recording() collects the statements run in a block, e.g. to check the query budget of an endpoint in the tests.
+"""
+
+import contextlib
+import logging
+import time
+
+from flask import g, has_request_context
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from bookings import metrics
+from bookings.orm import db
+
+def init_statements(app):
+    """ Time the statements run on the engine of the app and add the counters to the responses (see the module) """
+    engine = db.get_engine(app)
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def start(connection, cursor, statement, parameters, context, executemany):
+        context.statement_start = time.perf_counter() # the context of this execution (a failed statement has no end)
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def end(connection, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - context.statement_start
+        metrics.STATEMENT_LATENCY.observe(elapsed)
+        if has_request_context():
+            g.statements = g.get("statements", 0) + 1
+            g.statements_time = g.get("statements_time", 0) + elapsed
+        threshold = app.config["SLOW_QUERY_MS"] / 1000
+        if 0 < threshold <= elapsed:
+            plan = None if executemany else explain(connection, statement, parameters)
+            logging.warning("- GoOutSafe:Bookings SLOW QUERY (%.1f ms) %s %s\n%s", elapsed * 1000, statement, parameters, plan)
+
+    @app.after_request
+    def count(response):
+        statements = g.get("statements", 0)
+        metrics.REQUEST_STATEMENTS.observe(statements)
+        if app.config["DEBUG"]:
+            response.headers["X-Query-Count"] = str(statements)
+            response.headers["X-Query-Time"] = "%.3f" % (g.get("statements_time", 0) * 1000)
+        return response
+
+def explain(connection, statement, parameters):
+    """ Return the query plan of a query (a SELECT) as text, None for the other statements
+
+    The plan is read with a cursor of the same connection (in the same transaction, without the events of the engine).
+    """
+    if not statement.lstrip().upper().startswith("SELECT"):
+        return None
+    sqlite = connection.dialect.name == "sqlite"
+    cursor = connection.connection.cursor()
+    try:
+        cursor.execute(("EXPLAIN QUERY PLAN " if sqlite else "EXPLAIN ")+statement, parameters)
+        return "\n".join(str(row[-1]) if sqlite else " ".join(str(c) for c in row) for row in cursor.fetchall())
+    except Exception as e:
+        return "no query plan: %s" % e
+    finally:
+        cursor.close()
+
+@contextlib.contextmanager
+def recording():
+    """ Collect the statements run on any engine in the block: yield the list of them (filled when they are run) """
+    statements = []
+    def record(connection, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+    event.listen(Engine, "before_cursor_execute", record)
+    try:
+        yield statements
+    finally:
+        event.remove(Engine, "before_cursor_execute", record)
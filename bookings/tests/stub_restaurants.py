@@ -0,0 +1,103 @@
+""" A local stub of the restaurant microservice
+
+It serves the same restaurants and tables used as mocks (see bookings.utils) over HTTP,
+so the calls to the restaurant microservice can be tested (and measured) without mocks.
+
+    stub = StubRestaurantService(delay=0.05)
+    url = stub.start() # e.g. http://127.0.0.1:41234/
+    ...
+    stub.stop()
+"""
+
+import json
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from bookings.utils import restaurants, tables
+
+class StubRestaurantService:
+    def __init__(self, delay=0, port=0, world=None):
+        """ The stub server (not started)
+
+        Params:
+            - delay: seconds waited before answering each request
+            - port: the port to listen on (0 picks a free one)
+            - world: the restaurants and their tables served (see bookings.fake_data.fake_restaurants), the mocks if None
+        """
+        self.delay = delay
+        self.port = port
+        self.restaurants, self.tables = (restaurants, tables) if world is None else world
+        self.requests = [] # the paths requested, in order
+        self.connections = set() # the client (address, port) of each connection opened
+        self.failures = 0 # how many of the next requests are answered with 503
+        self._server = None
+        self._thread = None
+
+    def start(self):
+        """ Start serving in a background thread and return the base url """
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1" # keep-alive
+            disable_nagle_algorithm = True # headers and body are written separately
+
+            def do_GET(self):
+                stub.requests.append(self.path)
+                stub.connections.add(self.client_address)
+                if stub.delay:
+                    time.sleep(stub.delay)
+                if stub.failures > 0:
+                    stub.failures -= 1
+                    status, body = 503, {"title": "Service Unavailable"}
+                else:
+                    status, body = stub.response(self.path)
+                body = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args): # keep the tests output clean
+                pass
+
+        class Server(ThreadingHTTPServer):
+            request_queue_size = 128 # many concurrent connections
+
+        self._server = Server(("127.0.0.1", self.port), Handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return "http://127.0.0.1:"+str(self.port)+"/"
+
+    def stop(self):
+        """ Stop the server """
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def response(self, path):
+        """ Return the pair (status_code, json) for a path
+
+        /restaurants/{id} and /restaurants/{id}/tables are served, 404 otherwise
+        """
+        parts = [p for p in path.split("?")[0].split("/") if p != ""]
+        try:
+            id = int(parts[1]) - 1 # restaurant IDs starting by 1
+        except (IndexError, ValueError):
+            return 404, {"title": "Not Found"}
+        if parts[0] != "restaurants" or not (0 <= id < len(self.restaurants)):
+            return 404, {"title": "Not Found"}
+        if len(parts) == 2:
+            return 200, self.restaurants[id]
+        if len(parts) == 3 and parts[2] == "tables":
+            return 200, self.tables[id]
+        return 404, {"title": "Not Found"}
+
+    def count(self, suffix):
+        """ Return how many requested paths end with suffix """
+        return len([p for p in self.requests if p.endswith(suffix)])
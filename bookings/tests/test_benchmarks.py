@@ -0,0 +1,29 @@
+import unittest
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+BENCHMARKS = { # script: the arguments of a quick run
+    "bench_serialization.py": ["--rows", "50", "--repeat", "1"],
+    "bench_availability.py": ["--days", "2", "--bookings", "20", "--repeat", "1"],
+    "bench_contacts.py": ["--rows", "500", "--restaurants", "5", "--users", "50", "--positives", "2"],
+    "bench_get_a_table.py": ["--delay", "0", "--runs", "2"],
+    "bench_db.py": ["--threads", "2", "--seconds", "0.2"],
+}
+
+class BenchmarksTests(unittest.TestCase):
+    """ Smoke tests of the benchmarks: a quick run of each one must not fail (e.g. after a change of the schema) """
+
+###############
+#### tests ####
+###############
+
+    def test_benchmarks(self):
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join([ROOT] + [p for p in [os.environ.get("PYTHONPATH")] if p]))
+        for script, args in BENCHMARKS.items():
+            with self.subTest(script=script):
+                result = subprocess.run([sys.executable, os.path.join(ROOT, "benchmarks", script)] + args,
+                    cwd=ROOT, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, timeout=300)
+                self.assertEqual(result.returncode, 0, msg=result.stdout.decode()[-3000:])
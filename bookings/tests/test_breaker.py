@@ -0,0 +1,177 @@
+import unittest
+import time
+
+from bookings.app import create_app
+
+from bookings.breaker import CircuitBreaker
+
+from bookings.cache import TTLCache
+
+from bookings.utils import get_restaurant
+
+from bookings.tests.stub_restaurants import StubRestaurantService
+
+from bookings.tests.test_cache import FakeTimer
+
+class CircuitBreakerTests(unittest.TestCase):
+    """ Tests the states of the circuit breaker """
+
+    def test_open_and_close(self):
+        """ The breaker opens after the consecutive failures and a successful probe closes it """
+        timer = FakeTimer()
+        breaker = CircuitBreaker(3, 10, timer=timer)
+        for _ in range(2):
+            self.assertTrue(breaker.allow())
+            breaker.failure()
+        self.assertTrue(breaker.allow())
+        breaker.success() # not consecutive
+        for _ in range(3):
+            self.assertTrue(breaker.allow())
+            breaker.failure()
+        self.assertEqual(breaker.state, "open")
+        self.assertFalse(breaker.allow())
+
+        timer.now = 10
+        self.assertTrue(breaker.allow()) # the probe
+        self.assertEqual(breaker.state, "half_open")
+        self.assertFalse(breaker.allow()) # only one probe at a time
+        breaker.success()
+        self.assertEqual(breaker.state, "closed")
+        self.assertTrue(breaker.allow())
+        self.assertEqual(breaker.stats(), {"state": "closed", "failures": 0, "opened": 1, "rejected": 2})
+
+    def test_failed_probe(self):
+        """ A failed probe opens the breaker again """
+        timer = FakeTimer()
+        breaker = CircuitBreaker(1, 10, timer=timer)
+        breaker.allow()
+        breaker.failure()
+        timer.now = 10
+        self.assertTrue(breaker.allow())
+        breaker.failure()
+        self.assertEqual(breaker.state, "open")
+        timer.now = 19
+        self.assertFalse(breaker.allow())
+        timer.now = 20
+        self.assertTrue(breaker.allow())
+
+    def test_disabled(self):
+        """ A threshold equal to 0 never opens the breaker """
+        breaker = CircuitBreaker(0, 10)
+        for _ in range(100):
+            self.assertTrue(breaker.allow())
+            breaker.failure()
+        self.assertEqual(breaker.state, "closed")
+
+class RestaurantBreakerTests(unittest.TestCase):
+    """ Tests the calls to a flaky restaurant microservice (a local stub) """
+
+############################
+#### setup and teardown ####
+############################
+
+    # executed prior to each test
+    def setUp(self):
+        self.stub = StubRestaurantService()
+        url = self.stub.start()
+        app = create_app("FAILURE_TEST") # Test without mocks
+        self.app = app.app
+        self.app.config['TESTING'] = True
+        self.app.config['REST_SERVICE_URL'] = url
+        self.app.config['TIMEOUT'] = 0.2
+        self.timer = FakeTimer()
+        self.app.extensions["restaurant_breaker"] = CircuitBreaker(2, 30, timer=self.timer)
+        self.app.extensions["restaurant_cache"] = TTLCache(10, 100, timer=self.timer, keep_stale=True)
+
+    # executed after each test
+    def tearDown(self):
+        self.stub.stop()
+
+    def wait_for(self, condition):
+        """ Wait (up to 5 seconds) for a condition to be true """
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline:
+            if condition():
+                return
+            time.sleep(0.01)
+        self.fail("timeout")
+
+###############
+#### tests ####
+###############
+
+    def test_fail_fast(self):
+        """ After the timeouts the requests fail at once, until a probe succeeds """
+        self.stub.delay = 0.5 # slower than the timeout
+        with self.app.app_context():
+            for _ in range(2):
+                self.assertIsNone(get_restaurant(3))
+            start = time.monotonic()
+            for _ in range(10):
+                self.assertIsNone(get_restaurant(3))
+            self.assertLess(time.monotonic() - start, 0.1) # no timeouts
+            self.assertEqual(len(self.stub.requests), 2) # the requests were not made
+
+            self.stub.delay = 0
+            self.timer.now = 30
+            self.assertEqual(get_restaurant(3)["id"], 3) # the probe
+            self.assertEqual(len(self.stub.requests), 3)
+
+        json = self.app.test_client().get('/stats').get_json()
+        self.assertEqual(json["restaurant_breaker"], {"state": "closed", "failures": 0, "opened": 1, "rejected": 10}, msg=json)
+
+    def test_server_errors(self):
+        """ The 5xx responses are failures, the 404 are not """
+        with self.app.app_context():
+            self.assertIsNone(get_restaurant(42)) # not found
+            self.assertIsNone(get_restaurant(42))
+            self.assertIsNone(get_restaurant(42))
+            self.assertEqual(self.app.extensions["restaurant_breaker"].state, "closed")
+
+            self.stub.failures = 2
+            self.assertIsNone(get_restaurant(3))
+            self.assertIsNone(get_restaurant(3))
+            self.assertEqual(self.app.extensions["restaurant_breaker"].state, "open")
+            self.assertIsNone(get_restaurant(3)) # not requested
+        self.assertEqual(self.stub.count("/restaurants/3"), 2, msg=self.stub.requests)
+
+    def test_stale_while_revalidate(self):
+        """ An expired restaurant is served while it is refreshed in background (kept if the refresh fails) """
+        cache = self.app.extensions["restaurant_cache"]
+        with self.app.app_context():
+            self.assertEqual(get_restaurant(3)["id"], 3)
+            self.timer.now = 10 # expired
+
+            self.stub.failures = 1
+            self.assertEqual(get_restaurant(3)["id"], 3) # stale
+            self.wait_for(lambda: self.stub.count("/restaurants/3") == 2 and cache.start_refresh(("restaurant", 3)))
+            cache.end_refresh(("restaurant", 3))
+            self.assertIsNone(cache.get(("restaurant", 3))) # the refresh failed: still expired
+
+            self.assertEqual(get_restaurant(3)["id"], 3) # stale again
+            self.wait_for(lambda: cache.get(("restaurant", 3)) is not None) # refreshed
+            self.assertEqual(self.stub.count("/restaurants/3"), 3, msg=self.stub.requests)
+            self.assertEqual(get_restaurant(3)["id"], 3) # fresh
+        self.assertEqual(cache.stats()["stale_hits"], 2)
+
+    def test_unexpected_error(self):
+        """ Any error of a probe is a failure: the breaker is not left waiting for the probe """
+        breaker = self.app.extensions["restaurant_breaker"]
+        session = self.app.extensions["restaurant_session"]
+        class BrokenSession:
+            def get(self, url, timeout):
+                raise RuntimeError("broken")
+        with self.app.app_context():
+            self.app.extensions["restaurant_session"] = BrokenSession()
+            for _ in range(2):
+                self.assertIsNone(get_restaurant(3))
+            self.assertEqual(breaker.state, "open")
+
+            self.timer.now = 30
+            self.assertIsNone(get_restaurant(3)) # the probe fails
+            self.assertEqual(breaker.state, "open")
+
+            self.app.extensions["restaurant_session"] = session
+            self.timer.now = 60
+            self.assertEqual(get_restaurant(3)["id"], 3) # another probe
+            self.assertEqual(breaker.state, "closed")
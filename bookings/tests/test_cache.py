@@ -0,0 +1,181 @@
+import unittest
+import threading
+
+from bookings.app import create_app
+
+from bookings.cache import TTLCache
+
+from bookings.utils import get_restaurant, get_tables
+
+from bookings.tests.stub_restaurants import StubRestaurantService
+
+class FakeTimer:
+    """ A clock moved by hand """
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+class TTLCacheTests(unittest.TestCase):
+    """ Tests the LRU cache with expiration """
+
+    def test_expiration(self):
+        """ The entries expire after the ttl """
+        timer = FakeTimer()
+        cache = TTLCache(10, 100, timer=timer)
+        cache.set("a", 1)
+        self.assertEqual(cache.get("a"), 1)
+
+        timer.now = 9
+        self.assertEqual(cache.get("a"), 1)
+
+        timer.now = 10
+        self.assertEqual(cache.get("a"), None) # expired
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.stats()["hits"], 2)
+        self.assertEqual(cache.stats()["misses"], 1)
+
+    def test_lru_eviction(self):
+        """ The least recently used entry is evicted when the cache is full """
+        cache = TTLCache(10, 2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a") # now b is the least recently used
+        cache.set("c", 3)
+
+        self.assertEqual(cache.get("b"), None)
+        self.assertEqual(cache.get("a"), 1)
+        self.assertEqual(cache.get("c"), 3)
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    def test_disabled(self):
+        """ Nothing is stored with ttl (or max_size) equal to 0 or None values """
+        cache = TTLCache(0, 10)
+        cache.set("a", 1)
+        self.assertEqual(cache.get("a"), None)
+
+        cache = TTLCache(10, 0)
+        cache.set("a", 1)
+        self.assertEqual(cache.get("a"), None)
+
+        cache = TTLCache(10, 10)
+        cache.set("a", None)
+        self.assertEqual(len(cache), 0)
+
+    def test_delete_and_clear(self):
+        """ Remove some or all the entries """
+        cache = TTLCache(10, 10)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.delete("a")
+        cache.delete("z") # not present
+        self.assertEqual(cache.get("a"), None)
+        self.assertEqual(cache.get("b"), 2)
+        cache.clear()
+        self.assertEqual(cache.get("b"), None)
+
+    def test_stats_locked(self):
+        """ The counters are read together, not while an entry is being changed """
+        cache = TTLCache(10, 10)
+        cache.set("a", 1)
+        stats = []
+        with cache._lock: # a change in progress
+            reader = threading.Thread(target=lambda: stats.append(cache.stats()))
+            reader.start()
+            reader.join(0.2)
+            self.assertEqual(stats, []) # waiting for the change
+            cache.hits += 1
+        reader.join(5)
+        self.assertEqual(stats[0]["hits"], 1)
+        self.assertEqual(stats[0]["size"], 1)
+
+    def test_stale(self):
+        """ The expired entries can be kept and served while they are refreshed """
+        timer = FakeTimer()
+        cache = TTLCache(10, 100, timer=timer, keep_stale=True)
+        cache.set("a", 1)
+        timer.now = 10
+        self.assertEqual(cache.get("a"), None) # expired
+        self.assertEqual(cache.get_stale("a"), 1)
+        self.assertEqual(cache.get_stale("z"), None)
+        self.assertEqual(cache.stats()["stale_hits"], 1)
+
+        self.assertTrue(cache.start_refresh("a"))
+        self.assertFalse(cache.start_refresh("a")) # already refreshing
+        cache.end_refresh("a")
+        self.assertTrue(cache.start_refresh("a"))
+
+class RestaurantCacheTests(unittest.TestCase):
+    """ Tests the cache of the restaurants' data (against a local stub of the restaurant microservice) """
+
+############################
+#### setup and teardown ####
+############################
+
+    # executed prior to each test
+    def setUp(self):
+        self.stub = StubRestaurantService()
+        url = self.stub.start()
+        app = create_app("FAILURE_TEST") # Test without mocks
+        self.app = app.app
+        self.app.config['TESTING'] = True
+        self.app.config['REST_SERVICE_URL'] = url
+
+    # executed after each test
+    def tearDown(self):
+        self.stub.stop()
+
+###############
+#### tests ####
+###############
+
+    def test_restaurant_cached(self):
+        """ The restaurant and its tables are requested only once """
+        with self.app.app_context():
+            for _ in range(3):
+                r = get_restaurant(3)
+                self.assertEqual(r["id"], 3, msg=r)
+                r = get_tables(3)
+                self.assertEqual(len(r), 3, msg=r)
+
+        self.assertEqual(self.stub.count("/restaurants/3"), 1, msg=self.stub.requests)
+        self.assertEqual(self.stub.count("/restaurants/3/tables"), 1, msg=self.stub.requests)
+
+        client = self.app.test_client()
+        response = client.get('/stats')
+        json = response.get_json()
+        self.assertEqual(response.status_code, 200, msg=json)
+        self.assertEqual(json["restaurant_cache"]["hits"], 4, msg=json)
+        self.assertEqual(json["restaurant_cache"]["misses"], 2, msg=json)
+        self.assertEqual(json["restaurant_cache"]["size"], 2, msg=json)
+
+    def test_not_found_not_cached(self):
+        """ The failed requests are not stored """
+        with self.app.app_context():
+            self.assertEqual(get_restaurant(10), None)
+            self.assertEqual(get_restaurant(10), None)
+        self.assertEqual(self.stub.count("/restaurants/10"), 2, msg=self.stub.requests)
+
+    def test_invalidation(self):
+        """ The webhook removes the cached data of a restaurant """
+        client = self.app.test_client()
+        with self.app.app_context():
+            get_restaurant(3)
+            get_tables(3)
+            get_restaurant(4)
+
+        response = client.delete('/restaurants/3/cache')
+        self.assertEqual(response.status_code, 204)
+
+        with self.app.app_context():
+            get_restaurant(3)
+            get_tables(3)
+            get_restaurant(4)
+
+        self.assertEqual(self.stub.count("/restaurants/3"), 2, msg=self.stub.requests) # requested again
+        self.assertEqual(self.stub.count("/restaurants/3/tables"), 2, msg=self.stub.requests)
+        self.assertEqual(self.stub.count("/restaurants/4"), 1, msg=self.stub.requests) # still cached
+
+        response = client.delete('/restaurants/42/cache') # not cached
+        self.assertEqual(response.status_code, 204)
@@ -0,0 +1,100 @@
+import unittest
+import datetime
+import threading
+
+from bookings.app import create_app
+
+from bookings.orm import db, Booking
+
+class ConcurrentBookingsTests(unittest.TestCase):
+    """ Tests that concurrent requests for the same tables never make overlapping bookings """
+
+############################
+#### setup and teardown ####
+############################
+
+    # executed prior to each test
+    def setUp(self):
+        app = create_app("TEST") # Test with mocks (default)
+        self.app = app.app
+        self.app.config['TESTING'] = True
+
+    # executed after each test
+    def tearDown(self):
+        pass
+
+    def run_concurrently(self, requests):
+        """ Make the requests (method, url, json) at the same time, each from its own thread
+
+        Return the list of the responses (in the same order)
+        """
+        barrier = threading.Barrier(len(requests))
+        responses = [None] * len(requests)
+
+        def run(i, method, url, json):
+            client = self.app.test_client()
+            barrier.wait()
+            responses[i] = client.open(url, method=method, json=json)
+
+        threads = [threading.Thread(target=run, args=(i,)+r) for i,r in enumerate(requests)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return responses
+
+    def check_no_overlaps(self, restaurant_id, occupation_time):
+        """ No table of the restaurant is booked twice in the same period """
+        with self.app.app_context():
+            bookings = db.session.query(Booking.id, Booking.table_id, Booking.booking_datetime)\
+                .filter(Booking.restaurant_id == restaurant_id).all()
+        delta = datetime.timedelta(hours=occupation_time)
+        for a in bookings:
+            for b in bookings:
+                if a.id < b.id and a.table_id == b.table_id:
+                    self.assertFalse(abs(a.booking_datetime - b.booking_datetime) < delta, msg=(a, b))
+
+###############
+#### tests ####
+###############
+
+    def test_concurrent_new_bookings(self):
+        """ Many users book the same slot at once: each table is given only once """
+        booking_datetime = (datetime.datetime.now().replace(hour=13,minute=0,second=0,microsecond=0) + datetime.timedelta(days=40)).isoformat()
+        booking = {"user_id":1, "restaurant_id":3, "number_of_people":2, "booking_datetime":booking_datetime}
+        requests = []
+        for i in range(24):
+            if i % 3 == 0:
+                requests.append(("POST", "/bookings/batch", [booking, booking]))
+            else:
+                requests.append(("POST", "/bookings", booking))
+
+        statuses = []
+        for r in self.run_concurrently(requests):
+            if isinstance(r.json, list): # batch
+                self.assertEqual(r.status_code, 200)
+                statuses.extend(b["status"] for b in r.json)
+            else:
+                statuses.append(r.status_code)
+
+        self.assertEqual(statuses.count(201), 3) # the restaurant has 3 tables
+        self.assertEqual(statuses.count(409), len(statuses) - 3)
+        self.check_no_overlaps(3, 2)
+
+    def test_concurrent_edits(self):
+        """ Many bookings are moved to the same slot at once: each table is given only once """
+        client = self.app.test_client()
+        day = datetime.datetime.now().replace(hour=13,minute=0,second=0,microsecond=0) + datetime.timedelta(days=50)
+        ids = []
+        for i in range(6): # a booking on each day
+            booking_datetime = (day + datetime.timedelta(days=i)).isoformat()
+            response = client.post("/bookings", json={"user_id":1, "restaurant_id":3, "number_of_people":2, "booking_datetime":booking_datetime})
+            self.assertEqual(response.status_code, 201)
+            ids.append(response.json["id"])
+
+        target = (day + datetime.timedelta(days=10)).isoformat() # all on the same day
+        responses = self.run_concurrently([("PUT", "/bookings/"+str(i), {"booking_datetime":target}) for i in ids])
+        statuses = [r.status_code for r in responses]
+        self.assertEqual(statuses.count(200), 3) # the restaurant has 3 tables
+        self.assertEqual(statuses.count(409), 3)
+        self.check_no_overlaps(3, 2)
@@ -0,0 +1,110 @@
+import unittest
+import datetime
+
+from bookings.app import create_app
+
+from bookings.orm import db, Booking
+
+from bookings.contacts import find_contacts, windows
+
+class ContactsTests(unittest.TestCase):
+    """ Tests the contact tracing (GET /contacts) on the restaurants of the mocks """
+
+############################
+#### setup and teardown ####
+############################
+
+    # executed prior to each test
+    def setUp(self):
+        app = create_app("TEST")
+        self.app = app.app
+        self.app.config['TESTING'] = True
+        self.day = datetime.datetime(2020, 11, 10)
+        with self.app.app_context():
+            for user, rest, hour, minute in [
+                (100, 3, 20, 0),  # the positive user (restaurant 3: 2 hours of occupation)
+                (101, 3, 21, 30), # met
+                (102, 3, 22, 0),  # not met (2 hours later), met by 101 (second hop)
+                (103, 3, 18, 30), # met
+                (100, 2, 13, 0),  # the positive user (restaurant 2: 1 hour of occupation)
+                (104, 2, 13, 59), # met
+                (105, 2, 14, 30), # not met, met by 104 (second hop)
+                (101, 2, 23, 0),  # a contact, after the contact
+                (106, 2, 23, 30), # met by 101 (second hop)
+                (103, 2, 11, 0),  # a contact, before the contact
+                (107, 2, 11, 30), # met by 103 before (not a contact)
+                (104, 4, 15, 0),  # a contact, after the contact
+                (108, 4, 15, 30), # met by 104 (second hop)
+                (108, 3, 16, 0),  # 108, after the contact
+                (109, 3, 17, 0),  # met by 108 (third hop)
+            ]:
+                entrance = self.day.replace(hour=hour, minute=minute)
+                db.session.add(Booking(user_id=user, restaurant_id=rest, number_of_people=1, table_id=1, datetime=entrance, booking_datetime=entrance, entrance_datetime=entrance))
+            db.session.add(Booking(user_id=110, restaurant_id=3, number_of_people=1, table_id=1, datetime=self.day, booking_datetime=self.day.replace(hour=20))) # no entrance
+            db.session.commit()
+
+    def contacts(self, **params):
+        params.setdefault("from", "2020-11-09T00:00:00")
+        params.setdefault("to", "2020-11-11T00:00:00")
+        client = self.app.test_client()
+        response = client.get('/contacts', query_string=dict(user=100, **params))
+        json = response.get_json()
+        self.assertEqual(response.status_code, 200, msg=json)
+        return json
+
+###############
+#### tests ####
+###############
+
+    def test_windows(self):
+        h = datetime.timedelta(hours=1)
+        entrances = [self.day, self.day + h, self.day + 5*h]
+        self.assertEqual(windows(entrances, h), [[self.day - h, self.day + 2*h], [self.day + 4*h, self.day + 6*h]])
+        self.assertEqual(windows([], h), [])
+
+    def test_contacts(self):
+        """ The users that entered less than an occupation time apart """
+        json = self.contacts()
+        self.assertEqual([c["user_id"] for c in json], [101, 103, 104])
+        self.assertTrue(all(c["depth"] == 1 for c in json))
+        self.assertEqual(json[0]["first_contact"], "2020-11-10T21:30:00Z") # like the other datetimes
+        self.assertEqual(json[1]["first_contact"], "2020-11-10T20:00:00Z")
+
+    def test_contacts_depth(self):
+        """ The contacts of the contacts, after they met """
+        json = self.contacts(depth=2)
+        self.assertEqual([(c["user_id"], c["depth"]) for c in json], [(101, 1), (103, 1), (104, 1), (102, 2), (105, 2), (106, 2), (108, 2)])
+        json = self.contacts(depth=3)
+        self.assertEqual([(c["user_id"], c["depth"]) for c in json], [(101, 1), (103, 1), (104, 1), (102, 2), (105, 2), (106, 2), (108, 2), (109, 3)])
+
+    def test_contacts_period(self):
+        """ Only the visits of the period """
+        self.assertEqual([c["user_id"] for c in self.contacts(**{"from":"2020-11-10T19:00:00"})], [101, 103])
+        self.assertEqual(self.contacts(to="2020-11-10T12:00:00"), [])
+        self.assertEqual(self.contacts(**{"from":"2020-11-12T00:00:00", "to":"2020-11-13T00:00:00"}), [])
+
+    def test_contacts_unique(self):
+        """ A user met many times is returned once, with the first contact """
+        with self.app.app_context():
+            entrance = self.day.replace(hour=12, minute=30)
+            db.session.add(Booking(user_id=101, restaurant_id=2, number_of_people=1, table_id=1, datetime=entrance, booking_datetime=entrance, entrance_datetime=entrance))
+            db.session.commit()
+            contacts = find_contacts(100, self.day, self.day + datetime.timedelta(days=1))
+        self.assertEqual(contacts[101], (1, self.day.replace(hour=13)))
+        self.assertEqual(sorted(contacts), [101, 103, 104])
+
+    def test_contacts_wrong_parameters(self):
+        client = self.app.test_client()
+        for query in ["user=100&from=wrong", "user=100&to=wrong", "user=100&from=2020-11-11T00:00:00&to=2020-11-10T00:00:00", "user=100&depth=0", "user=100&depth=4", "depth=1"]:
+            response = client.get('/contacts?'+query)
+            self.assertEqual(response.status_code, 400, msg=query)
+
+    def test_contacts_restaurant_unavailable(self):
+        """ The occupation time of a visited restaurant is unknown """
+        with self.app.app_context():
+            entrance = self.day.replace(hour=10)
+            db.session.add(Booking(user_id=100, restaurant_id=42, number_of_people=1, table_id=1, datetime=entrance, booking_datetime=entrance, entrance_datetime=entrance))
+            db.session.commit()
+        client = self.app.test_client()
+        response = client.get('/contacts?user=100&from=2020-11-09T00:00:00&to=2020-11-11T00:00:00')
+        self.assertEqual(response.status_code, 500)
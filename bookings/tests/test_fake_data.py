@@ -0,0 +1,93 @@
+import unittest
+import datetime
+
+from bookings.app import create_app
+
+from bookings.orm import db, Booking
+
+from bookings.fake_data import fake_restaurants, generate, put_fake_bookings, COLUMNS
+
+from bookings.utils import get_restaurant, get_tables, get_a_table, is_open, restaurants, tables
+
+class FakeDataTests(unittest.TestCase):
+    """ Tests the random bookings of the benchmarks """
+
+############################
+#### setup and teardown ####
+############################
+
+    # executed prior to each test
+    def setUp(self):
+        app = create_app("TEST")
+        self.app = app.app
+        self.app.config['TESTING'] = True
+        self.now = datetime.datetime(2030, 6, 12, 16, 0)
+
+###############
+#### tests ####
+###############
+
+    def test_fake_restaurants(self):
+        """ The same seed gives the same restaurants, the tables have unique IDs """
+        rests, rest_tables = fake_restaurants(20, 3)
+        self.assertEqual((rests, rest_tables), fake_restaurants(20, 3))
+        self.assertNotEqual(rests, fake_restaurants(20, 3, seed=1)[0])
+        self.assertEqual([r["id"] for r in rests], list(range(1, 21)))
+        ids = [t["id"] for ts in rest_tables for t in ts]
+        self.assertEqual(sorted(ids), list(range(1, 61)))
+
+    def test_generate(self):
+        """ The bookings are at the opening times, never overlap on a table and the entrances are in the past """
+        world = fake_restaurants(30, 4)
+        rows = [dict(zip(COLUMNS, row)) for row in generate(3000, *world, users=50, now=self.now)]
+        self.assertEqual(len(rows), 3000)
+
+        capacity = {t["id"]: t["capacity"] for ts in world[1] for t in ts}
+        rests = {r["id"]: r for r in world[0]}
+        by_table = {}
+        for b in rows:
+            rest = rests[b["restaurant_id"]]
+            self.assertTrue(is_open(rest, b["booking_datetime"]), msg=b)
+            self.assertTrue(1 <= b["number_of_people"] <= capacity[b["table_id"]], msg=b)
+            self.assertTrue(1 <= b["user_id"] <= 50, msg=b)
+            self.assertLessEqual(b["datetime"], min(b["booking_datetime"], self.now), msg=b)
+            if b["entrance_datetime"] is not None:
+                self.assertLess(b["booking_datetime"], self.now, msg=b)
+            by_table.setdefault(b["table_id"], []).append((b["booking_datetime"], rest["occupation_time"]))
+        for bookings in by_table.values():
+            bookings.sort()
+            for (first, hours), (second, _) in zip(bookings, bookings[1:]):
+                self.assertGreaterEqual(second - first, datetime.timedelta(hours=hours))
+
+        self.assertEqual(rows, [dict(zip(COLUMNS, row)) for row in generate(3000, *world, users=50, now=self.now)])
+        self.assertTrue(any(b["entrance_datetime"] is not None for b in rows))
+        self.assertTrue(any(b["booking_datetime"] > self.now for b in rows))
+
+    def test_generate_too_many(self):
+        """ The bookings of a period do not fit in the tables """
+        with self.assertRaises(ValueError):
+            list(generate(1000, restaurants, tables, days=2, now=self.now))
+        with self.assertRaises(ValueError):
+            list(generate(1, restaurants[:1], tables[:1])) # always closed
+
+    def test_put_fake_bookings(self):
+        """ The random bookings are inserted with their indexes and they are seen by get_a_table """
+        with self.app.app_context():
+            count = db.session.query(Booking).count()
+            self.assertEqual(put_fake_bookings(2000, users=10), 2000)
+            self.assertEqual(db.session.query(Booking).count(), count+2000)
+            indexes = set(i.name for i in Booking.__table__.indexes)
+            self.assertEqual(indexes, set(i["name"] for i in db.inspect(db.engine).get_indexes("booking")))
+
+            now = datetime.datetime.now()
+            b = db.session.query(Booking).filter(Booking.id > count, Booking.restaurant_id == 3, Booking.booking_datetime > now).first()
+            occupied = set(t for (t,) in db.session.query(Booking.table_id).filter(Booking.restaurant_id == 3, Booking.booking_datetime > b.booking_datetime - datetime.timedelta(hours=2), Booking.booking_datetime < b.booking_datetime + datetime.timedelta(hours=2)))
+            self.assertNotIn(get_a_table(3, 1, b.booking_datetime), occupied)
+
+    def test_fake_world_mocks(self):
+        """ With FAKE_DATA_RESTAURANTS the mocks serve the random restaurants """
+        self.app.extensions["fake_world"] = fake_restaurants(10, 2)
+        with self.app.app_context():
+            self.assertEqual(get_restaurant(10)["name"], "Rest 10")
+            self.assertEqual([t["id"] for t in get_tables(10)], [19, 20])
+            self.assertIsNone(get_restaurant(11))
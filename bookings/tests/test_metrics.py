@@ -0,0 +1,136 @@
+import unittest
+import datetime
+import os
+import tempfile
+
+from prometheus_client import REGISTRY
+
+from bookings.app import create_app
+
+from bookings import metrics
+
+from bookings.breaker import CircuitBreaker
+
+class MetricsTests(unittest.TestCase):
+    """ Tests the metrics of the service """
+
+############################
+#### setup and teardown ####
+############################
+
+    # executed prior to each test
+    def setUp(self):
+        app = create_app("TEST") # Test with mocks (default)
+        self.app = app.app
+        self.app.config['TESTING'] = True
+
+    # executed after each test
+    def tearDown(self):
+        pass
+
+    def value(self, name, **labels):
+        """ The current value of a sample (0 if missing) """
+        return REGISTRY.get_sample_value(name, labels) or 0
+
+###############
+#### tests ####
+###############
+
+    def test_operations(self):
+        """ The requests are counted and timed by operation, the refused ones by reason (the title of the error) """
+        client = self.app.test_client()
+        created = self.value("bookings_requests_total", operation="app.new_booking", status="201")
+        refused = self.value("bookings_refused_requests_total", operation="app.new_booking", status="400", reason="Bad Request")
+        timed = self.value("bookings_request_duration_seconds_count", operation="app.new_booking")
+        found = self.value("bookings_requests_total", operation="app.get_booking", status="404")
+
+        booking = {"user_id":1, "restaurant_id":3, "number_of_people":2, "booking_datetime":(datetime.datetime.now().replace(hour=13) + datetime.timedelta(days=80)).isoformat()}
+        self.assertEqual(client.post('/bookings', json=booking).status_code, 201)
+        booking["booking_datetime"] = (datetime.datetime.now() - datetime.timedelta(days=1)).isoformat()
+        self.assertEqual(client.post('/bookings', json=booking).status_code, 400)
+        self.assertEqual(client.get('/bookings/424242').status_code, 404)
+
+        self.assertEqual(self.value("bookings_requests_total", operation="app.new_booking", status="201"), created + 1)
+        self.assertEqual(self.value("bookings_refused_requests_total", operation="app.new_booking", status="400", reason="Bad Request"), refused + 1)
+        self.assertEqual(self.value("bookings_request_duration_seconds_count", operation="app.new_booking"), timed + 2)
+        self.assertEqual(self.value("bookings_requests_total", operation="app.get_booking", status="404"), found + 1)
+
+    def test_not_valid(self):
+        """ The requests refused by the validation (the handler is not called) are counted, the others once """
+        client = self.app.test_client()
+        refused = self.value("bookings_refused_requests_total", operation="app.get_bookings", status="400", reason="Bad Request")
+        timed = self.value("bookings_request_duration_seconds_count", operation="app.get_bookings")
+        self.assertEqual(client.get('/bookings?limit=many').status_code, 400)
+        self.assertEqual(client.get('/bookings?begin=never').status_code, 400) # refused by the handler
+        self.assertEqual(self.value("bookings_refused_requests_total", operation="app.get_bookings", status="400", reason="Bad Request"), refused + 2)
+        self.assertEqual(self.value("bookings_request_duration_seconds_count", operation="app.get_bookings"), timed + 1)
+
+        found = self.value("bookings_requests_total", operation="app.get_booking", status="404")
+        self.assertEqual(client.get('/bookings/424243').status_code, 404)
+        self.assertEqual(self.value("bookings_requests_total", operation="app.get_booking", status="404"), found + 1) # once
+        self.assertEqual(client.get('/unknown').status_code, 404) # not an operation
+        reasons = set(s.labels["reason"] for m in REGISTRY.collect() if m.name == "bookings_refused_requests" for s in m.samples
+            if s.labels["operation"] == "app.get_bookings" and s.labels["status"] == "400")
+        self.assertEqual(reasons, {"Bad Request"}) # not the details of the errors
+
+    def test_internals(self):
+        """ The search of the tables and the serialization are timed """
+        client = self.app.test_client()
+        searches = self.value("bookings_occupied_tables_search_duration_seconds_count", source="index")
+        locks = self.value("bookings_restaurant_lock_duration_seconds_count")
+        serializations = self.value("bookings_serialization_duration_seconds_count")
+
+        booking = {"user_id":1, "restaurant_id":3, "number_of_people":2, "booking_datetime":(datetime.datetime.now().replace(hour=13) + datetime.timedelta(days=81)).isoformat()}
+        client.post('/bookings', json=booking)
+        client.get('/bookings')
+
+        self.assertEqual(self.value("bookings_occupied_tables_search_duration_seconds_count", source="index"), searches + 1)
+        self.assertEqual(self.value("bookings_restaurant_lock_duration_seconds_count"), locks + 1)
+        self.assertEqual(self.value("bookings_serialization_duration_seconds_count"), serializations + 1)
+
+    def test_breaker(self):
+        """ The state of the circuit breaker, its openings and the calls it rejected are exported """
+        now = [0]
+        breaker = CircuitBreaker(2, 10, timer=lambda: now[0], service="test")
+        opened = self.value("bookings_circuit_breaker_opened_total", service="test")
+        rejected = self.value("bookings_circuit_breaker_rejected_calls_total", service="test")
+        self.assertEqual(REGISTRY.get_sample_value("bookings_circuit_breaker_state", {"service": "test"}), 0)
+
+        for _ in range(2):
+            self.assertTrue(breaker.allow())
+            breaker.failure()
+        self.assertEqual(self.value("bookings_circuit_breaker_state", service="test"), 2) # open
+        self.assertEqual(self.value("bookings_circuit_breaker_opened_total", service="test"), opened + 1)
+        self.assertFalse(breaker.allow())
+        self.assertFalse(breaker.allow())
+        self.assertEqual(self.value("bookings_circuit_breaker_rejected_calls_total", service="test"), rejected + 2)
+
+        now[0] = 10
+        self.assertTrue(breaker.allow()) # the probe
+        self.assertEqual(self.value("bookings_circuit_breaker_state", service="test"), 1) # half open
+        breaker.success()
+        self.assertEqual(REGISTRY.get_sample_value("bookings_circuit_breaker_state", {"service": "test"}), 0) # closed
+
+        response = self.app.test_client().get('/metrics') # the breaker of the restaurant microservice
+        self.assertIn('bookings_circuit_breaker_state{service="restaurants"}', response.get_data(as_text=True))
+
+    def test_exposition(self):
+        """ GET /metrics returns the Prometheus text format """
+        client = self.app.test_client()
+        client.get('/bookings')
+        response = client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content_type.startswith("text/plain"), msg=response.content_type)
+        text = response.get_data(as_text=True)
+        self.assertIn('bookings_requests_total{operation="app.get_bookings",status="200"}', text)
+        self.assertIn("bookings_request_duration_seconds_bucket", text)
+
+    def test_multiprocess(self):
+        """ With PROMETHEUS_MULTIPROC_DIR the metrics are read from the files of the workers """
+        with tempfile.TemporaryDirectory() as directory:
+            os.environ["PROMETHEUS_MULTIPROC_DIR"] = directory
+            try:
+                body, content_type = metrics.exposition()
+            finally:
+                del os.environ["PROMETHEUS_MULTIPROC_DIR"]
+        self.assertEqual(body, b"") # no workers wrote metrics
@@ -0,0 +1,222 @@
+import unittest
+import datetime
+import random
+
+from bookings.app import create_app
+
+from bookings.occupancy import RestaurantOccupancy, OccupancyIndex
+
+from bookings.orm import db, Booking
+
+from bookings.utils import get_a_table, add_booking
+
+class OccupancyTests(unittest.TestCase):
+    """ Tests the in-memory occupancy of a restaurant """
+
+    def setUp(self):
+        self.now = datetime.datetime(2020, 11, 10, 13, 0)
+        self.tables = [{"id":4, "capacity":5}, {"id":5, "capacity":4}, {"id":6, "capacity":2}]
+
+    def test_free_table(self):
+        """ The smaller free table is returned, the bookings strictly inside the period occupy the table """
+        o = RestaurantOccupancy(0, self.now - datetime.timedelta(days=1))
+        hours = lambda h: self.now + datetime.timedelta(hours=h)
+        self.assertEqual(o.free_table(self.tables, 2, hours(-2), hours(2)), 6)
+        self.assertEqual(o.free_table(self.tables, 3, hours(-2), hours(2)), 5)
+        self.assertEqual(o.free_table(self.tables, 6, hours(-2), hours(2)), -1)
+
+        o.add(1, 6, self.now)
+        self.assertEqual(o.free_table(self.tables, 2, hours(-2), hours(2)), 5)
+        self.assertEqual(o.free_table(self.tables, 2, hours(-2), hours(2), excluded=1), 6)
+        self.assertEqual(o.free_table(self.tables, 2, hours(0), hours(4)), 6) # the period is open
+        self.assertEqual(o.free_table(self.tables, 2, hours(-4), hours(0)), 6)
+
+        o.add(1, 6, hours(5)) # moved
+        self.assertEqual(len(o), 1)
+        self.assertEqual(o.free_table(self.tables, 2, hours(-2), hours(2)), 6)
+        o.remove(1)
+        o.remove(1)
+        self.assertEqual(len(o), 0)
+        self.assertTrue(o.is_free(6, hours(3), hours(7)))
+
+    def test_same_as_query(self):
+        """ The same tables are found with the occupancy and with a linear search """
+        random.seed(42)
+        o = RestaurantOccupancy(0, self.now - datetime.timedelta(days=1))
+        bookings = {}
+        for i in range(300):
+            bookings[i] = (random.choice([4,5,6]), self.now + datetime.timedelta(minutes=15*random.randint(0, 500)))
+            o.add(i, *bookings[i])
+        for i in random.sample(range(300), 100):
+            o.remove(i)
+            del bookings[i]
+
+        for _ in range(200):
+            start = self.now + datetime.timedelta(minutes=15*random.randint(-10, 510))
+            end = start + datetime.timedelta(hours=4)
+            n = random.randint(1, 6)
+            occupied = set(t for t,d in bookings.values() if start < d < end)
+            expected = [t for t in sorted(self.tables, key=lambda x:x["capacity"]) if t["id"] not in occupied and t["capacity"] >= n]
+            expected = expected[0]["id"] if expected != [] else -1
+            self.assertEqual(o.free_table(self.tables, n, start, end), expected)
+
+    def test_index_versions(self):
+        """ The occupancy is used only at the same version, the changes are applied only to the previous one """
+        index = OccupancyIndex()
+        since = self.now - datetime.timedelta(days=1)
+        index.put(3, RestaurantOccupancy(7, since))
+        self.assertIsNotNone(index.get(3, 7, self.now))
+        self.assertIsNone(index.get(3, 8, self.now))
+        self.assertIsNone(index.get(3, 7, since - datetime.timedelta(hours=1))) # not loaded
+
+        index.apply(3, 8, [(1, 6, self.now)])
+        self.assertEqual(len(index.get(3, 8, self.now)), 1)
+        index.apply(3, 8, [(1, None, None)]) # not the next version: discarded
+        self.assertIsNone(index.get(3, 8, self.now))
+        self.assertEqual(index.stats()["restaurants"], 0)
+
+    def test_old_bookings_dropped(self):
+        """ The bookings that fall behind the window are dropped while it moves on """
+        index = OccupancyIndex()
+        since = self.now - datetime.timedelta(days=1)
+        o = RestaurantOccupancy(0, since)
+        for i in range(48):
+            o.add(i, 4 + i % 3, since + datetime.timedelta(hours=i+1))
+        index.put(3, o)
+
+        later = since + datetime.timedelta(minutes=5) # less than TRIM_STEP: nothing to do
+        self.assertIs(index.get(3, 0, self.now, later), o)
+        self.assertEqual((o.since, len(o)), (since, 48))
+
+        later = since + datetime.timedelta(hours=10, minutes=30) # a day later the window has moved by 10 hours and a half
+        self.assertIs(index.get(3, 0, self.now, later), o)
+        self.assertEqual((o.since, len(o)), (later, 38))
+        self.assertEqual(index.stats()["bookings"], 38)
+        self.assertEqual(o.free_table(self.tables, 2, since, later), 6) # the old ones are not there
+        self.assertEqual(o.free_table(self.tables, 2, later, later + datetime.timedelta(hours=4)), -1) # the others are
+
+        o.add(100, 6, later - datetime.timedelta(hours=1)) # a change in the past (e.g. an entrance): not kept
+        self.assertEqual(len(o), 38)
+        self.assertIsNone(index.get(3, 0, since, later)) # before the window: the db is queried
+
+        index.get(3, 0, self.now, since + datetime.timedelta(days=3)) # all past
+        self.assertEqual(len(o), 0)
+        self.assertEqual(o._tables, {})
+
+    def test_max_restaurants(self):
+        """ Only the restaurants used most recently are kept """
+        index = OccupancyIndex(max_restaurants=2)
+        since = self.now - datetime.timedelta(days=1)
+        for restaurant_id in [1, 2]:
+            index.put(restaurant_id, RestaurantOccupancy(0, since))
+        self.assertIsNotNone(index.get(1, 0, self.now)) # 2 is the least recently used
+        index.put(3, RestaurantOccupancy(0, since))
+        self.assertIsNone(index.get(2, 0, self.now))
+        self.assertIsNotNone(index.get(1, 0, self.now))
+        self.assertIsNotNone(index.get(3, 0, self.now))
+        self.assertEqual(index.stats()["restaurants"], 2)
+        self.assertEqual(index.stats()["evictions"], 1)
+
+class OccupancyIndexTests(unittest.TestCase):
+    """ Tests that the occupancy index of the service follows the database """
+
+############################
+#### setup and teardown ####
+############################
+
+    # executed prior to each test
+    def setUp(self):
+        app = create_app("TEST") # Test with mocks (default)
+        self.app = app.app
+        self.app.config['TESTING'] = True
+        self.day = datetime.datetime.now().replace(hour=13,minute=0,second=0,microsecond=0) + datetime.timedelta(days=60)
+
+    # executed after each test
+    def tearDown(self):
+        pass
+
+    def book(self, client, booking_datetime, number_of_people=2):
+        response = client.post("/bookings", json={"user_id":1, "restaurant_id":3, "number_of_people":number_of_people, "booking_datetime":booking_datetime.isoformat()})
+        return response.status_code, response.json
+
+###############
+#### tests ####
+###############
+
+    def test_warmed(self):
+        """ The bookings are loaded at the start """
+        response = self.app.test_client().get("/stats")
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(response.json["occupancy"]["restaurants"], 0)
+        self.assertGreater(response.json["occupancy"]["bookings"], 0)
+
+    def test_hot_path(self):
+        """ The bookings, the changes and the deletions are applied to the index (no loads) """
+        client = self.app.test_client()
+        loads = client.get("/stats").json["occupancy"]["loads"]
+        ids = []
+        for _ in range(3):
+            status, booking = self.book(client, self.day)
+            self.assertEqual(status, 201)
+            ids.append(booking["id"])
+        self.assertEqual(self.book(client, self.day)[0], 409)
+
+        response = client.put("/bookings/"+str(ids[0]), json={"booking_datetime":(self.day + datetime.timedelta(hours=5)).isoformat()})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.book(client, self.day)[0], 201) # the moved table is free
+
+        response = client.delete("/bookings/"+str(ids[1]))
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.book(client, self.day)[0], 201)
+        self.assertEqual(self.book(client, self.day)[0], 409)
+
+        stats = client.get("/stats").json["occupancy"]
+        self.assertEqual(stats["loads"], loads) # always up to date
+        self.assertGreater(stats["hits"], 0)
+
+    def insert_bookings(self, tables, new_version):
+        """ Insert bookings of the restaurant 3 bypassing the service (as another worker or a script would do) """
+        with self.app.app_context():
+            with db.get_engine(self.app).begin() as connection:
+                for table in tables:
+                    connection.execute(Booking.__table__.insert().values(user_id=1, restaurant_id=3, number_of_people=2, 
+                        datetime=datetime.datetime.now(), booking_datetime=self.day, table_id=table))
+                if new_version:
+                    connection.exec_driver_sql("UPDATE restaurant_lock SET version = version + 1 WHERE restaurant_id = 3")
+
+    def test_changed_elsewhere(self):
+        """ The bookings committed by another worker (with a new version) make the index load the restaurant again """
+        client = self.app.test_client()
+        self.assertEqual(self.book(client, self.day)[0], 201) # the lock row exists
+        loads = client.get("/stats").json["occupancy"]["loads"]
+
+        self.insert_bookings([5], True)
+        self.assertEqual(self.book(client, self.day)[0], 201) # the last table
+        self.assertEqual(self.book(client, self.day)[0], 409)
+        self.assertEqual(client.get("/stats").json["occupancy"]["loads"], loads + 1)
+
+    def test_changed_in_process(self):
+        """ The bookings saved without a lock make the index load the restaurant again """
+        client = self.app.test_client()
+        with self.app.app_context():
+            for table in [4, 5, 6]:
+                add_booking(1, 3, 2, self.day, table)
+        self.assertEqual(self.book(client, self.day)[0], 409)
+
+    def test_rebuild(self):
+        """ The bookings changed directly in the database (without a new version) are seen after the rebuild """
+        client = self.app.test_client()
+        self.insert_bookings([4, 5, 6], False)
+        response = client.delete("/occupancy")
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.book(client, self.day)[0], 409)
+
+    def test_disabled(self):
+        """ Without the index the occupied tables are searched in the database """
+        app = create_app("TEST").app
+        app.extensions.pop("occupancy")
+        client = app.test_client()
+        self.assertNotIn("occupancy", client.get("/stats").json)
+        self.assertEqual(self.book(client, self.day)[0], 201)
+        with app.app_context():
+            self.assertEqual(get_a_table(3, 2, self.day), 5)
@@ -0,0 +1,246 @@
+import unittest
+import datetime
+import sqlite3
+
+from sqlalchemy import event, inspect
+
+from bookings.app import create_app
+from bookings.orm import db, Booking, migrate, database_uri, engine_options
+from bookings.utils import lock_restaurant
+from bookings.statements import recording
+from bookings.tests.stub_restaurants import StubRestaurantService
+
+class BookingsOrmTests(unittest.TestCase):
+    """ Tests the database model (indexes and migrations) """
+
+############################
+#### setup and teardown ####
+############################
+
+    # executed prior to each test
+    def setUp(self):
+        app = create_app("TEST") # Test with mocks (default)
+        self.app = app.app
+        self.app.config['TESTING'] = True
+
+    # executed after each test
+    def tearDown(self):
+        pass
+
+    def query_plan(self, query):
+        """ Return the SQLite query plan of an ORM query as a single string """
+        engine = db.get_engine(self.app)
+        compiled = query.statement.compile(dialect=engine.dialect)
+        params = tuple(compiled.params[k] for k in compiled.positiontup)
+        with engine.connect() as connection:
+            rows = connection.exec_driver_sql("EXPLAIN QUERY PLAN "+str(compiled), params).fetchall()
+        return " | ".join(r[-1] for r in rows)
+
+    def request_plan(self, url):
+        """ Return the SQLite query plan of the list of bookings read by GET url (the statement built by get_bookings) """
+        engine = db.get_engine(self.app)
+        statements = []
+        def record(connection, cursor, statement, parameters, context, executemany):
+            if statement.lstrip().startswith("SELECT") and "ORDER BY booking.id" in statement:
+                statements.append((statement, parameters))
+        event.listen(engine, "before_cursor_execute", record)
+        try:
+            response = self.app.test_client().get(url)
+        finally:
+            event.remove(engine, "before_cursor_execute", record)
+        self.assertEqual(response.status_code, 200, msg=response.data)
+        self.assertEqual(len(statements), 1, msg=statements)
+        with engine.connect() as connection:
+            rows = connection.exec_driver_sql("EXPLAIN QUERY PLAN "+statements[0][0], statements[0][1]).fetchall()
+        return " | ".join(r[-1] for r in rows)
+
+    def skip_unless_sqlite(self):
+        """ The query plans and the pragmas are the ones of SQLite (the other databases are not checked) """
+        dialect = db.get_engine(self.app).dialect.name
+        if dialect != "sqlite":
+            self.skipTest("SQLite only, not checked on "+dialect+" (DATABASE_URI)")
+
+    def indexes(self):
+        """ Return the names of the indexes on the booking table """
+        inspector = inspect(db.get_engine(self.app))
+        return set(i["name"] for i in inspector.get_indexes("booking"))
+
+###############
+#### tests ####
+###############
+
+    def test_indexes_created(self):
+        """ The indexes are created together with the table """
+        with self.app.app_context():
+            self.assertEqual(self.indexes(), set(i.name for i in Booking.__table__.indexes))
+
+    def test_migrate_existing_database(self):
+        """ The missing indexes are added to an already existing table """
+        with self.app.app_context():
+            with db.get_engine(self.app).begin() as connection:
+                connection.exec_driver_sql("DROP INDEX ix_booking_restaurant_datetime")
+                connection.exec_driver_sql("DROP INDEX ix_booking_entrance_datetime")
+            self.assertNotIn("ix_booking_restaurant_datetime", self.indexes())
+
+            migrate(self.app)
+            self.assertEqual(self.indexes(), set(i.name for i in Booking.__table__.indexes))
+
+            migrate(self.app) # nothing to do
+            self.assertEqual(self.indexes(), set(i.name for i in Booking.__table__.indexes))
+
+    def test_migrate_new_columns(self):
+        """ The missing columns are added to an already existing table, with their default value """
+        with self.app.app_context():
+            self.skip_unless_sqlite()
+            if sqlite3.sqlite_version_info < (3, 35):
+                self.skipTest("DROP COLUMN needs SQLite 3.35")
+            engine = db.get_engine(self.app)
+            with engine.begin() as connection:
+                connection.exec_driver_sql("ALTER TABLE booking DROP COLUMN version")
+            db.session.remove()
+
+            migrate(self.app)
+            self.assertIn("version", [c["name"] for c in inspect(engine).get_columns("booking")])
+            self.assertEqual(set(v for (v,) in db.session.query(Booking.version)), {1})
+
+    def test_free_tables_query_plan(self):
+        """ The search of the occupied tables (get_a_table) uses the restaurant index """
+        now = datetime.datetime.now()
+        with self.app.app_context():
+            self.skip_unless_sqlite()
+            q = db.session.query(Booking.table_id).select_from(Booking)\
+                .filter(Booking.restaurant_id == 3)\
+                .filter(now - datetime.timedelta(hours=2) < Booking.booking_datetime)\
+                .filter(Booking.booking_datetime < now + datetime.timedelta(hours=2))\
+                .filter(Booking.id != -1)
+            plan = self.query_plan(q)
+            self.assertIn("ix_booking_restaurant_datetime", plan, msg=plan)
+
+    def test_filters_query_plan(self):
+        """ The filters of GET /bookings use the indexes, with the columns and the order (by id) of the real statement """
+        now = (datetime.datetime.now()).isoformat()+"Z"
+        yesterday = (datetime.datetime.now() - datetime.timedelta(days=1)).isoformat()+"Z"
+        with self.app.app_context():
+            self.skip_unless_sqlite()
+            expected = {
+                "/bookings?user=3": "ix_booking_user_datetime",
+                "/bookings?user=3&begin="+now: "ix_booking_user_datetime (user_id=? AND booking_datetime>?)",
+                "/bookings?rest=3": "ix_booking_restaurant_id (restaurant_id=?)",
+                "/bookings?rest=3&limit=2&after_id=1": "ix_booking_restaurant_id (restaurant_id=? AND id>?)",
+                "/bookings?rest=3&end="+now: "ix_booking_restaurant_datetime (restaurant_id=? AND booking_datetime<?)",
+                "/bookings?table=4&fields=id,table_id": "ix_booking_table_datetime",
+                "/bookings?begin_entrance="+yesterday: "ix_booking_entrance_datetime",
+                "/bookings?end_entrance="+now: "ix_booking_entrance_datetime",
+                "/bookings?begin_entrance="+yesterday+"&end_entrance="+now: "ix_booking_entrance_datetime",
+            }
+            plans = dict((url, self.request_plan(url)) for url in expected)
+            for url, index in expected.items():
+                self.assertIn("USING INDEX "+index, plans[url], msg=url)
+            self.assertNotIn("TEMP B-TREE", plans["/bookings?rest=3"]) # already in order of id
+
+    def test_sqlite_pragmas(self):
+        """ Every SQLite connection uses the write-ahead log, the configured synchronous mode and busy timeout """
+        with self.app.app_context():
+            self.skip_unless_sqlite()
+            with db.get_engine(self.app).connect() as connection:
+                self.assertEqual(connection.exec_driver_sql("PRAGMA journal_mode").scalar(), "wal")
+                self.assertEqual(connection.exec_driver_sql("PRAGMA synchronous").scalar(), 1) # NORMAL
+                self.assertEqual(connection.exec_driver_sql("PRAGMA busy_timeout").scalar(), self.app.config["SQLITE_BUSY_TIMEOUT"])
+
+    def test_database_uri(self):
+        """ A file name is a SQLite database, a url is used as it is """
+        self.assertEqual(database_uri("bookings.db"), "sqlite:///bookings.db")
+        self.assertEqual(database_uri("sqlite:////tmp/b.db"), "sqlite:////tmp/b.db")
+        self.assertEqual(database_uri("postgresql://u:p@db/bookings"), "postgresql://u:p@db/bookings")
+
+    def test_engine_options(self):
+        """ The pool is configured only for the server databases """
+        config = dict(self.app.config, SQLALCHEMY_DATABASE_URI="sqlite:///bookings_test.db") # whatever DATABASE_URI is
+        self.assertEqual(engine_options(config), {}) # SQLite
+
+        config["SQLALCHEMY_DATABASE_URI"] = "postgresql://u:p@db/bookings"
+        config["DB_POOL_SIZE"] = 20
+        options = engine_options(config)
+        self.assertEqual(options["pool_size"], 20)
+        self.assertEqual(options["max_overflow"], config["DB_MAX_OVERFLOW"])
+        self.assertEqual(options["pool_recycle"], config["DB_POOL_RECYCLE"])
+        self.assertTrue(options["pool_pre_ping"])
+
+class StatementsTests(unittest.TestCase):
+    """ Tests the number of statements run by each endpoint on the bookings (the booking is read once) """
+
+    configuration = "TEST" # with mocks
+
+############################
+#### setup and teardown ####
+############################
+
+    # executed prior to each test
+    def setUp(self):
+        app = create_app(self.configuration)
+        self.app = app.app
+        self.app.config['TESTING'] = True
+        self.app.extensions.pop("response_cache") # the bookings are read from the database
+        self.client = self.app.test_client()
+        with self.app.app_context():
+            lock_restaurant(3) # the first lock of a restaurant creates its row
+            db.session.commit()
+            # the restaurant is locked by the update of its row (the version is read again without RETURNING)
+            self.lock = 1 if db.get_engine(self.app).dialect.full_returning else 2
+        self.day = (datetime.datetime.now() + datetime.timedelta(days=3)).replace(hour=13, minute=0, second=0, microsecond=0)
+
+    def count(self, method, url, **kwargs):
+        """ Return the number of statements run by a request """
+        with recording() as statements:
+            response = getattr(self.client, method)(url, **kwargs)
+        self.assertLess(response.status_code, 300, msg=response.data)
+        return len(statements)
+
+###############
+#### tests ####
+###############
+
+    def test_new_booking(self):
+        """ The lock of the restaurant and the insert (the booking is not read again) """
+        booking = {"user_id": 1, "restaurant_id": 3, "number_of_people": 1, "booking_datetime": self.day.isoformat()}
+        self.assertEqual(self.count("post", "/bookings", json=booking), self.lock + 1)
+
+    def test_get_booking(self):
+        self.assertEqual(self.count("get", "/bookings/2"), 1)
+
+    def test_put_booking(self):
+        """ The booking is read once, then the lock of the restaurant and the update """
+        self.assertEqual(self.count("put", "/bookings/2", json={"number_of_people": 2}), 1 + self.lock + 1)
+        self.assertEqual(self.count("put", "/bookings/2?entrance=true", json={}), 2)
+
+    def test_delete_booking(self):
+        self.assertEqual(self.count("delete", "/bookings/2"), 1 + self.lock + 1)
+
+class RemoteStatementsTests(StatementsTests):
+    """ The same tests, with the restaurants requested to the restaurant microservice (a local stub, nothing cached yet) """
+
+    configuration = "FAILURE_TEST" # without mocks
+
+############################
+#### setup and teardown ####
+############################
+
+    # executed prior to each test
+    def setUp(self):
+        self.stub = StubRestaurantService()
+        url = self.stub.start()
+        super().setUp()
+        self.app.config['REST_SERVICE_URL'] = url
+
+    # executed after each test
+    def tearDown(self):
+        self.stub.stop()
+
+###############
+#### tests ####
+###############
+
+    def test_restaurant_requested(self):
+        """ The restaurant is requested in the thread of the request: the booking is not read again after it """
+        self.assertEqual(self.count("put", "/bookings/2", json={"number_of_people": 2}), 1 + self.lock + 1)
+        self.assertIn("/restaurants/3", self.stub.requests)
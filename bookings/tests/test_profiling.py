@@ -0,0 +1,109 @@
+import unittest
+import os
+import shutil
+import tempfile
+
+from prometheus_client import REGISTRY
+
+from bookings.app import create_app
+
+from bookings.profiling import Profiler, Tracer
+
+def outer():
+    return inner() + inner()
+
+def inner():
+    return sum(range(1000))
+
+class ProfilingTests(unittest.TestCase):
+    """ Tests the profiles of the requests (collapsed stacks) """
+
+############################
+#### setup and teardown ####
+############################
+
+    # executed prior to each test
+    def setUp(self):
+        app = create_app("TEST")
+        self.app = app.app
+        self.app.config['TESTING'] = True
+        self.client = self.app.test_client()
+        self.directory = tempfile.mkdtemp()
+
+    # executed after each test
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def enable(self, rate=0, token="secret", max_files=100):
+        self.app.extensions["profiler"] = Profiler(self.directory, rate, token, max_files)
+
+    def profiles(self):
+        return sorted(os.listdir(self.directory))
+
+###############
+#### tests ####
+###############
+
+    def test_tracer(self):
+        """ The time of each stack, without the time of its calls """
+        with Tracer() as tracer:
+            outer()
+        stacks = dict(line.rsplit(" ", 1) for line in tracer.collapsed().splitlines())
+        outer_stack = [s for s in stacks if s.startswith("outer (") and ";" not in s]
+        self.assertEqual(len(outer_stack), 1)
+        inner_label = "inner (tests/test_profiling.py:%d)" % inner.__code__.co_firstlineno
+        self.assertIn(outer_stack[0]+";"+inner_label, stacks)
+        self.assertIn(outer_stack[0]+";"+inner_label+";builtins.sum", stacks)
+        self.assertTrue(all(int(us) > 0 for us in stacks.values()))
+
+    def test_disabled(self):
+        response = self.client.get('/bookings', headers={"X-Profile": "secret"})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("X-Profile", response.headers)
+
+    def test_profile_on_request(self):
+        """ A request is profiled if it has the header with the token """
+        self.enable()
+        response = self.client.get('/bookings?rest=3', headers={"X-Profile": "wrong"})
+        self.assertNotIn("X-Profile", response.headers)
+        response = self.client.get('/bookings?rest=3', headers={"X-Profile": "s\u00e9cret"}) # not ASCII
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("X-Profile", response.headers)
+        self.assertEqual(self.profiles(), [])
+
+        response = self.client.get('/bookings?user=4', headers={"X-Profile": "secret"}) # not cached
+        self.assertEqual(response.status_code, 200)
+        name = response.headers["X-Profile"]
+        self.assertEqual(self.profiles(), [name])
+        self.assertIn("-app.get_bookings-", name)
+        with open(os.path.join(self.directory, name)) as f:
+            lines = f.read().splitlines()
+        self.assertTrue(all(l.startswith("get_bookings (bookings/app.py:") for l in lines), msg=lines[:3])
+        self.assertTrue(any("cursor.execute" in l.lower() for l in lines)) # the database driver (sqlite3.Cursor, psycopg2 cursor ...)
+
+    def test_measured(self):
+        """ The profiled requests are measured too (a single resolver wraps the handlers) """
+        self.enable()
+        counted = REGISTRY.get_sample_value("bookings_requests_total", {"operation": "app.get_bookings", "status": "200"}) or 0
+        response = self.client.get('/bookings?user=5', headers={"X-Profile": "secret"})
+        self.assertIn("X-Profile", response.headers)
+        self.assertEqual(REGISTRY.get_sample_value("bookings_requests_total", {"operation": "app.get_bookings", "status": "200"}), counted + 1)
+
+    def test_no_token(self):
+        """ Without a token the header is ignored """
+        self.enable(token="")
+        response = self.client.get('/bookings/2', headers={"X-Profile": ""})
+        self.assertNotIn("X-Profile", response.headers)
+
+    def test_sampling_and_max_files(self):
+        """ With a rate the requests are profiled at random, the oldest profiles are removed """
+        self.enable(rate=1, max_files=3)
+        names = [self.client.get('/bookings/%d' % i).headers["X-Profile"] for i in range(1, 6)]
+        self.assertEqual(self.profiles(), names[-3:])
+
+    def test_max_files_at_least_one(self):
+        """ The profiles cannot be kept without a limit by mistake (e.g. PROFILE_MAX_FILES = 0) """
+        self.assertRaises(ValueError, Profiler, self.directory, 1, "", 0)
+        self.enable(rate=1, max_files=1)
+        names = [self.client.get('/bookings/%d' % i).headers["X-Profile"] for i in range(1, 3)]
+        self.assertEqual(self.profiles(), names[-1:])
@@ -0,0 +1,118 @@
+import unittest
+import asyncio
+import datetime
+import time
+
+from bookings.app import create_app
+
+from bookings.breaker import CircuitBreaker
+
+from bookings.remote import AsyncClient
+
+from bookings.utils import get_restaurant, get_tables, fetch_restaurant, fetch_tables
+
+from bookings.tests.stub_restaurants import StubRestaurantService
+
+from bookings.tests.test_cache import FakeTimer
+
+class AsyncClientTests(unittest.TestCase):
+    """ Tests the lookups of the restaurants with the async client (REMOTE_CLIENT = async) """
+
+############################
+#### setup and teardown ####
+############################
+
+    # executed prior to each test
+    def setUp(self):
+        self.stub = StubRestaurantService()
+        url = self.stub.start()
+        app = create_app("FAILURE_TEST") # Test without mocks
+        self.app = app.app
+        self.app.config['TESTING'] = True
+        self.app.config['REST_SERVICE_URL'] = url
+        self.app.config['REMOTE_CLIENT'] = "async"
+        self.app.extensions["restaurant_client"] = AsyncClient(self.app.config)
+        self.app.extensions["restaurant_cache"].ttl = 0 # every lookup is a request
+
+    # executed after each test
+    def tearDown(self):
+        self.app.extensions.pop("restaurant_client").close()
+        self.stub.stop()
+
+###############
+#### tests ####
+###############
+
+    def test_lookups(self):
+        """ The restaurants and the tables are requested by the async client """
+        with self.app.app_context():
+            self.assertEqual(get_restaurant(3)["id"], 3)
+            self.assertEqual(get_tables(1), [{"id":1, "capacity":4}])
+            self.assertEqual(fetch_restaurant(2).result()["id"], 2)
+            self.assertEqual(len(fetch_tables(3).result()), 3)
+            self.assertIsNone(get_restaurant(42)) # not found
+        self.assertEqual(len(self.stub.requests), 5, msg=self.stub.requests)
+
+    def test_concurrent_lookups(self):
+        """ The background lookups wait together, they do not need a thread of the pool each """
+        self.stub.delay = 0.2
+        with self.app.app_context():
+            start = time.monotonic()
+            futures = [fetch_tables(3) for _ in range(4 * self.app.config["REMOTE_WORKERS"])]
+            for f in futures:
+                self.assertEqual(len(f.result()), 3)
+            self.assertLess(time.monotonic() - start, 4 * 0.2) # the thread pool would take 4 rounds
+
+    def test_failures(self):
+        """ The timeouts and the 5xx responses are failures of the circuit breaker """
+        self.app.extensions["restaurant_breaker"] = CircuitBreaker(2, 30)
+        self.app.extensions.pop("restaurant_client").close()
+        self.app.config['TIMEOUT'] = 0.1
+        self.app.extensions["restaurant_client"] = AsyncClient(self.app.config)
+        with self.app.app_context():
+            self.stub.failures = 1
+            self.assertIsNone(get_restaurant(3))
+            self.stub.delay = 0.5 # slower than the timeout
+            self.assertIsNone(fetch_restaurant(3).result())
+            self.assertEqual(self.app.extensions["restaurant_breaker"].state, "open")
+            self.assertIsNone(get_restaurant(3)) # not requested
+        self.assertEqual(len(self.stub.requests), 2, msg=self.stub.requests)
+
+    def test_cancelled_probe(self):
+        """ A probe cancelled (e.g. by a timeout) is a failure: the breaker is not left waiting for the probe """
+        timer = FakeTimer()
+        breaker = self.app.extensions["restaurant_breaker"] = CircuitBreaker(1, 30, timer=timer)
+        client = self.app.extensions["restaurant_client"]
+        get = client.get
+        async def cancelled(url):
+            raise asyncio.CancelledError()
+        with self.app.app_context():
+            breaker.allow()
+            breaker.failure()
+            timer.now = 30
+            client.get = cancelled
+            self.assertIsNone(get_restaurant(3)) # the probe
+            self.assertEqual(breaker.state, "open")
+
+            client.get = get
+            timer.now = 60
+            self.assertEqual(get_restaurant(3)["id"], 3) # another probe
+            self.assertEqual(breaker.state, "closed")
+
+    def test_new_booking(self):
+        """ A booking is created with the async lookups """
+        booking = {
+            "user_id":1,
+            "restaurant_id":3,
+            "number_of_people":3,
+            "booking_datetime": (datetime.datetime.now().replace(hour=13) + datetime.timedelta(days=1)).isoformat()
+            }
+        client = self.app.test_client()
+        response = client.post('/bookings', json=booking)
+        json = response.get_json()
+        self.assertEqual(response.status_code, 201, msg=json)
+        self.assertEqual(self.stub.count("/restaurants/3"), 1, msg=self.stub.requests)
+        self.assertEqual(self.stub.count("/restaurants/3/tables"), 1, msg=self.stub.requests)
+
+        response = client.put(json["url"], json={"number_of_people":2})
+        self.assertEqual(response.status_code, 200, msg=response.get_json())
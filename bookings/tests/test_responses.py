@@ -0,0 +1,255 @@
+import unittest
+import datetime
+
+from sqlalchemy import text
+
+from bookings.app import create_app
+
+from bookings.orm import db
+
+from bookings.cache import TTLCache
+
+from bookings.responses import ResponseCache, booking_tags, list_tag
+
+class FakeBackend:
+    """ A shared backend (as RedisBackend) in the process: the caches of many workers can use the same one """
+    def __init__(self):
+        self.entries = {}
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    def set(self, key, value):
+        self.entries[key] = value
+
+class ResponseCacheTests(unittest.TestCase):
+    """ Tests the cache of the responses of GET /bookings and GET /bookings/{id} """
+
+############################
+#### setup and teardown ####
+############################
+
+    # executed prior to each test
+    def setUp(self):
+        app = create_app("TEST")
+        self.app = app.app
+        self.app.config['TESTING'] = True
+        self.client = self.app.test_client()
+
+    def change_directly(self, booking_id, number_of_people):
+        """ Change a booking without the ORM (the cache does not know it) """
+        with self.app.app_context():
+            db.session.execute(text("UPDATE booking SET number_of_people = :n WHERE id = :id"), {"n": number_of_people, "id": booking_id})
+            db.session.commit()
+
+    def people(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, msg=response.get_json())
+        json = response.get_json()
+        return json["number_of_people"] if isinstance(json, dict) else sorted((b["id"], b["number_of_people"]) for b in json)
+
+    def new_booking(self, user, restaurant, hour):
+        booking = {
+            "user_id": user,
+            "restaurant_id": restaurant,
+            "number_of_people": 1,
+            "booking_datetime": (datetime.datetime.now().replace(hour=hour, minute=0, second=0, microsecond=0) + datetime.timedelta(days=2)).isoformat()
+        }
+        response = self.client.post('/bookings', json=booking)
+        self.assertEqual(response.status_code, 201, msg=response.get_json())
+        return response.get_json()
+
+###############
+#### tests ####
+###############
+
+    def test_keys(self):
+        """ The keys change when their tags are invalidated """
+        cache = ResponseCache(TTLCache(60, 100))
+        key = cache.key("user:1", "user=1")
+        self.assertEqual(cache.key("user:1", "user=1"), key)
+        cache.set(key, "response")
+        self.assertEqual(cache.get(key), "response")
+        other = cache.key("rest:2", "rest=2")
+
+        cache.invalidate(booking_tags(7, [1], [3], [4]))
+        self.assertNotEqual(cache.key("user:1", "user=1"), key)
+        self.assertEqual(cache.key("rest:2", "rest=2"), other)
+        cache.clear()
+        self.assertNotEqual(cache.key("rest:2", "rest=2"), other)
+        self.assertEqual(cache.stats()["hits"], 1)
+
+    def test_list_tag(self):
+        self.assertEqual(list_tag(user=1, rest=2, table=3), "user:1")
+        self.assertEqual(list_tag(rest=2, table=3), "table:3")
+        self.assertEqual(list_tag(rest=2), "rest:2")
+        self.assertEqual(list_tag(), "all")
+
+    def test_booking_cached(self):
+        """ A booking is served by the cache until it is changed by the service """
+        self.assertEqual(self.people('/bookings/2'), 1)
+        self.change_directly(2, 5)
+        self.assertEqual(self.people('/bookings/2'), 1) # cached
+
+        response = self.client.put('/bookings/2', json={"number_of_people": 3})
+        self.assertEqual(response.status_code, 200, msg=response.get_json())
+        self.assertEqual(self.people('/bookings/2'), 3)
+        self.assertEqual(self.app.extensions["response_cache"].stats()["hits"], 1) # the second GET (the PUT does not read the cache)
+
+    def test_list_normalized(self):
+        """ The same filters (in any order and format) are the same entry """
+        before = self.people('/bookings?rest=3&begin=2020-11-10T00:00:00Z')
+        self.change_directly(2, 5)
+        self.assertEqual(self.people('/bookings?begin=2020-11-10T00:00:00%2B00:00&rest=3'), before) # cached
+        self.assertNotEqual(self.people('/bookings?rest=3'), before) # another entry
+
+    def test_precise_invalidation(self):
+        """ A change invalidates only the lists of its user, restaurant and table """
+        rest3 = self.people('/bookings?rest=3')
+        user2 = self.people('/bookings?user=2')
+        self.people('/bookings')
+        self.change_directly(2, 5) # user 4, restaurant 3
+
+        self.new_booking(1, 4, 21) # another restaurant and user
+        self.assertEqual(self.people('/bookings?rest=3'), rest3) # still cached
+        self.assertIn((2, 5), self.people('/bookings')) # the lists of all the bookings are invalidated
+
+        booking = self.new_booking(1, 3, 13)
+        self.assertIn((2, 5), self.people('/bookings?rest=3'))
+        self.assertIn((booking["id"], 1), self.people('/bookings?rest=3'))
+        self.assertEqual(self.people('/bookings?user=2'), user2) # still cached
+
+    def test_delete_and_entrance(self):
+        """ The deletions and the entrances invalidate the lists """
+        self.assertIn(2, [b for b,_ in self.people('/bookings?user=4')])
+        response = self.client.delete('/bookings/2')
+        self.assertEqual(response.status_code, 204)
+        self.assertNotIn(2, [b for b,_ in self.people('/bookings?user=4')])
+        self.assertEqual(self.client.get('/bookings/2').status_code, 404)
+
+        response = self.client.get('/bookings?table=5')
+        self.assertIsNone(response.get_json()[0]["entrance_datetime"])
+        response = self.client.put('/bookings/5?entrance=true', json={})
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get('/bookings?table=5')
+        self.assertIsNotNone(response.get_json()[0]["entrance_datetime"])
+
+    def test_bulk_changes(self):
+        """ A bulk change of the bookings invalidates everything """
+        before = self.people('/bookings?rest=3')
+        with self.app.app_context():
+            db.session.execute(text("UPDATE booking SET number_of_people = 5 WHERE id = 2"))
+            from bookings.orm import Booking
+            db.session.query(Booking).filter(Booking.id == 6).delete()
+            db.session.commit()
+        self.assertNotEqual(self.people('/bookings?rest=3'), before)
+
+    def test_shared_backend(self):
+        """ With a shared backend a worker does not serve the bookings changed by another one """
+        backend = FakeBackend()
+        worker1, worker2 = ResponseCache(backend), ResponseCache(backend)
+        self.app.extensions["response_cache"] = worker1
+        self.assertEqual(self.people('/bookings/2'), 1)
+        self.change_directly(2, 5)
+        self.app.extensions["response_cache"] = worker2
+        self.assertEqual(self.people('/bookings/2'), 1) # the response cached by worker1
+
+        response = self.client.put('/bookings/2', json={"number_of_people": 3}) # invalidated by worker2
+        self.assertEqual(response.status_code, 200, msg=response.get_json())
+        self.app.extensions["response_cache"] = worker1
+        self.assertEqual(self.people('/bookings/2'), 3)
+
+    def test_disabled(self):
+        self.app.extensions.pop("response_cache")
+        self.assertEqual(self.people('/bookings/2'), 1)
+        self.change_directly(2, 5)
+        self.assertEqual(self.people('/bookings/2'), 5)
+
+class ConditionalRequestsTests(unittest.TestCase):
+    """ Tests the ETags of the bookings (If-None-Match and If-Match) """
+
+############################
+#### setup and teardown ####
+############################
+
+    # executed prior to each test
+    def setUp(self):
+        app = create_app("TEST")
+        self.app = app.app
+        self.app.config['TESTING'] = True
+        self.client = self.app.test_client()
+
+###############
+#### tests ####
+###############
+
+    def test_booking_not_modified(self):
+        """ A booking is not sent again until it changes """
+        response = self.client.get('/bookings/2')
+        etag = response.headers["ETag"]
+        self.assertEqual(etag, '"2-1"')
+        response = self.client.get('/bookings/2', headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.data, b"")
+        self.assertEqual(response.headers["ETag"], etag)
+
+        response = self.client.put('/bookings/2', json={"number_of_people": 2})
+        self.assertEqual(response.status_code, 200, msg=response.get_json())
+        self.assertEqual(response.headers["ETag"], '"2-2"')
+        self.assertEqual(response.get_json()["version"], 2)
+        response = self.client.get('/bookings/2', headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+
+    def test_list_not_modified(self):
+        """ A list is not sent again until one of its bookings changes """
+        for cache in (True, False):
+            if not cache:
+                self.app.extensions.pop("response_cache")
+            response = self.client.get('/bookings?user=4')
+            etag = response.headers["ETag"]
+            response = self.client.get('/bookings?user=4', headers={"If-None-Match": etag})
+            self.assertEqual(response.status_code, 304)
+            response = self.client.get('/bookings?user=3', headers={"If-None-Match": etag})
+            self.assertEqual(response.status_code, 200)
+            response = self.client.get('/bookings?user=4&limit=1', headers={"If-None-Match": etag})
+            self.assertEqual(response.status_code, 200) # another page
+
+            response = self.client.put('/bookings/5', json={"number_of_people": 2 if cache else 3})
+            self.assertEqual(response.status_code, 200, msg=response.get_json())
+            response = self.client.get('/bookings?user=4', headers={"If-None-Match": etag})
+            self.assertEqual(response.status_code, 200)
+            self.assertNotEqual(response.headers["ETag"], etag)
+
+    def test_list_etag_deletion(self):
+        """ The ETag of a list changes when a booking is deleted """
+        etag = self.client.get('/bookings?rest=3').headers["ETag"]
+        self.assertEqual(self.client.delete('/bookings/2').status_code, 204)
+        response = self.client.get('/bookings?rest=3', headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+
+    def test_if_match(self):
+        """ A booking is changed or deleted only if it is still the expected version """
+        etag = self.client.get('/bookings/2').headers["ETag"]
+        response = self.client.put('/bookings/2', json={"number_of_people": 2}, headers={"If-Match": etag})
+        self.assertEqual(response.status_code, 200, msg=response.get_json())
+
+        response = self.client.put('/bookings/2', json={"number_of_people": 3}, headers={"If-Match": etag}) # old version
+        self.assertEqual(response.status_code, 412, msg=response.get_json())
+        response = self.client.put('/bookings/2?entrance=true', json={}, headers={"If-Match": etag})
+        self.assertEqual(response.status_code, 412, msg=response.get_json())
+        response = self.client.delete('/bookings/2', headers={"If-Match": etag})
+        self.assertEqual(response.status_code, 412, msg=response.get_json())
+        self.assertEqual(self.client.get('/bookings/2').get_json()["number_of_people"], 2)
+
+        response = self.client.delete('/bookings/2', headers={"If-Match": '"2-2"'})
+        self.assertEqual(response.status_code, 204)
+
+    def test_changed_meanwhile(self):
+        """ The update fails if the booking is changed by another request after it has been read """
+        from bookings.utils import update_booking
+        with self.app.app_context():
+            booking = self.client.get('/bookings/2').get_json()
+            tomorrow = datetime.datetime.now() + datetime.timedelta(days=1)
+            self.assertEqual(update_booking(2, 2, tomorrow, 4, version=booking["version"])["version"], 2)
+            self.assertEqual(update_booking(2, 3, tomorrow, 4, version=booking["version"]), -1) # an old version
+            self.assertEqual(update_booking(2, 3, tomorrow, 4)["number_of_people"], 3)
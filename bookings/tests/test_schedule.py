@@ -0,0 +1,55 @@
+import unittest
+import datetime
+
+from bookings.schedule import Schedule
+
+from bookings.utils import restaurants
+
+def reference_is_open(rest, booking_datetime):
+    """ The previous implementation of utils.is_open (with datetimes) """
+    if (booking_datetime.weekday()+1) in rest["closed_days"]:
+        return False
+    now = datetime.datetime.now()
+    booking = now.replace( hour=booking_datetime.hour, minute=booking_datetime.minute, second=0, microsecond=0 )
+    for o,c in [("first_opening_hour","first_closing_hour"), ("second_opening_hour","second_closing_hour")]:
+        if rest[o] is not None and rest[c] is not None:
+            opening = now.replace( hour=int(rest[o]), minute=0, second=0, microsecond=0 )
+            closing = now.replace( hour=int(rest[c]), minute=0, second=0, microsecond=0 )
+            if opening <= booking <= closing:
+                return True
+    return False
+
+class ScheduleTests(unittest.TestCase):
+    """ Tests the compiled opening hours """
+
+    def setUp(self):
+        monday = datetime.datetime(2020, 11, 9, 0, 0, 30)
+        self.week = [monday + datetime.timedelta(minutes=m) for m in range(7 * 24 * 60)] # every minute of a week
+
+    def test_same_as_before(self):
+        """ The schedule of the restaurants gives the same results of the previous implementation """
+        rests = list(restaurants) + [
+            dict(restaurants[1], first_opening_hour=23, first_closing_hour=1), # never open (as before)
+            dict(restaurants[1], first_opening_hour="8", first_closing_hour="9", closed_days=[]),
+        ]
+        for rest in rests:
+            schedule = Schedule.of(rest)
+            expected = [reference_is_open(rest, d) for d in self.week]
+            self.assertEqual([schedule.is_open(d) for d in self.week], expected, msg=rest["id"])
+            self.assertEqual(schedule.are_open(self.week), expected, msg=rest["id"])
+
+    def test_many_openings(self):
+        """ More than two openings in a day """
+        schedule = Schedule(closed_days=[7], openings=[(7*60, 9*60+30), (12*60, 14*60), (19*60, 24*60)])
+        saturday = datetime.datetime(2020, 11, 14)
+        self.assertTrue(schedule.is_open(saturday.replace(hour=9, minute=30)))
+        self.assertFalse(schedule.is_open(saturday.replace(hour=9, minute=31)))
+        self.assertTrue(schedule.is_open(saturday.replace(hour=13)))
+        self.assertTrue(schedule.is_open(saturday.replace(hour=23, minute=59)))
+        self.assertFalse(schedule.is_open(saturday.replace(hour=6)))
+        self.assertFalse(schedule.is_open(saturday.replace(hour=13) + datetime.timedelta(days=1))) # sunday
+
+    def test_compiled_once(self):
+        """ The same opening hours are compiled once """
+        self.assertIs(Schedule.of(restaurants[2]), Schedule.of(dict(restaurants[2])))
+        self.assertIsNot(Schedule.of(restaurants[2]), Schedule.of(dict(restaurants[2], closed_days=[1])))
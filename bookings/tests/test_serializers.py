@@ -0,0 +1,97 @@
+import unittest
+import datetime
+
+import flask
+
+from connexion.jsonifier import Jsonifier
+
+from bookings import serializers
+
+from bookings.app import create_app
+
+from bookings.orm import db, Booking
+
+class SerializersTests(unittest.TestCase):
+    """ Tests that the fast serialization of the bookings is the same of connexion (byte for byte) """
+
+############################
+#### setup and teardown ####
+############################
+
+    # executed prior to each test
+    def setUp(self):
+        app = create_app("TEST") # Test with mocks (default)
+        self.app = app.app
+        self.app.config['TESTING'] = True
+        self.orjson = serializers.orjson
+
+    # executed after each test
+    def tearDown(self):
+        serializers.orjson = self.orjson
+
+    def connexion_body(self, data):
+        """ The body built by connexion for a handler returning data """
+        return Jsonifier(flask.json, indent=2).dumps(data).encode()
+
+    def check_bookings_list(self):
+        """ GET /bookings is the same of the list of Booking.dump() serialized by connexion """
+        client = self.app.test_client()
+        with self.app.app_context():
+            expected = self.connexion_body([p.dump() for p in db.session.query(Booking).order_by(Booking.id)])
+
+        response = client.get('/bookings')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, "application/json")
+        self.assertEqual(response.get_data(), expected)
+
+        response = client.get('/bookings?user=1') # empty list
+        self.assertEqual(response.get_data(), self.connexion_body([]))
+
+###############
+#### tests ####
+###############
+
+    def test_same_body_json(self):
+        """ Same body with the json module """
+        serializers.orjson = None
+        self.check_bookings_list()
+
+    @unittest.skipIf(serializers.orjson is None, "orjson is not installed")
+    def test_same_body_orjson(self):
+        """ Same body with orjson """
+        self.check_bookings_list()
+
+    def test_datetimes(self):
+        """ Naive and timezone aware datetimes are formatted like connexion """
+        naive = datetime.datetime(2020, 11, 10, 10, 30, 0, 123)
+        aware = datetime.datetime(2020, 11, 10, 10, 30, tzinfo=datetime.timezone(datetime.timedelta(hours=1)))
+        row = (42, 3, 4, 2, naive, aware, None, 7, 1)
+        booking = dict(zip(serializers.COLUMNS, row))
+        booking["url"] = "/bookings/42"
+
+        with self.app.app_context():
+            expected = self.connexion_body([booking])
+        serializers.orjson = None
+        self.assertEqual(serializers.dumps(serializers.serialize([row])), expected)
+        if self.orjson is not None:
+            serializers.orjson = self.orjson
+            self.assertEqual(serializers.dumps(serializers.serialize([row])), expected)
+
+    def test_fields(self):
+        """ Only the requested fields are kept """
+        row = (42, datetime.datetime(2020, 11, 10, 10, 30))
+        columns = ("id", "booking_datetime")
+        r = serializers.serialize([row], columns, ("booking_datetime", "url"))
+        self.assertEqual(r, [{"booking_datetime": "2020-11-10T10:30:00Z", "url": "/bookings/42"}])
+
+        self.assertEqual(serializers.columns_for(("url",)), ("id", "version"))
+        self.assertEqual(serializers.columns_for(("table_id", "user_id")), ("id", "user_id", "table_id", "version"))
+
+    def test_lines(self):
+        """ A line of newline delimited json """
+        serializers.orjson = None
+        line = serializers.dumps_line({"id":1, "a":None})
+        self.assertEqual(line, b'{"a":null,"id":1}\n')
+        if self.orjson is not None:
+            serializers.orjson = self.orjson
+            self.assertEqual(serializers.dumps_line({"id":1, "a":None}), line)
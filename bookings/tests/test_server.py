@@ -0,0 +1,115 @@
+import unittest
+import datetime
+import os
+
+from bookings.app import create_app, get_config, reinit
+
+from bookings.orm import db, Booking
+
+from bookings.server import Server, options, worker_exit
+
+class ServerTests(unittest.TestCase):
+    """ Tests the production server settings and the app created before and after the fork """
+
+############################
+#### setup and teardown ####
+############################
+
+    # executed prior to each test
+    def setUp(self):
+        app = create_app("TEST") # Test with mocks (default)
+        self.app = app.app
+        self.app.config['TESTING'] = True
+
+###############
+#### tests ####
+###############
+
+    def test_options(self):
+        """ The gunicorn settings come from the configuration """
+        conf = get_config("TEST")
+        conf.update(SERVER="gunicorn", WORKERS=3, WORKER_CLASS="threaded", THREADS=8, KEEPALIVE=7, GRACEFUL_TIMEOUT=20, WORKER_TIMEOUT=40)
+        o = options(conf)
+        self.assertEqual(o["bind"], "0.0.0.0:8080")
+        self.assertEqual(o["workers"], 3)
+        self.assertEqual(o["worker_class"], "gthread")
+        self.assertEqual((o["threads"], o["keepalive"], o["graceful_timeout"], o["timeout"]), (8, 7, 20, 40))
+        self.assertFalse(o["preload_app"])
+
+        conf["WORKER_CLASS"] = "uvicorn"
+        self.assertEqual(options(conf)["worker_class"], "uvicorn.workers.UvicornWorker")
+        conf["WORKERS"] = 0
+        self.assertGreaterEqual(options(conf)["workers"], 3)
+        conf["WORKER_CLASS"] = "tornado"
+        self.assertRaises(ValueError, options, conf)
+
+    def test_load(self):
+        """ The workers use the database as it is, the preloaded app is kept for the workers """
+        with self.app.app_context():
+            count = db.session.query(Booking).count()
+            db.session.query(Booking).filter(Booking.id == 1).delete()
+            db.session.commit()
+
+        server = Server("TEST")
+        worker_app = server.load()
+        self.assertIsNone(server.application)
+        self.assertIs(server.loaded, worker_app)
+        self.assertNotIn("response_cache", worker_app.extensions) # not shared by the workers
+        with worker_app.app_context():
+            self.assertEqual(db.session.query(Booking).count(), count-1) # not filled again
+
+        server.conf["PRELOAD"] = True
+        preloaded = server.load()
+        self.assertIs(server.application, preloaded)
+
+    def test_worker_exit(self):
+        """ A worker releases the connections and threads of its app when it stops """
+        server = Server("TEST")
+        worker_app = server.load()
+        executor = worker_app.extensions["restaurant_executor"]
+        worker_exit(None, type("Worker", (), {"app": server}))
+        self.assertNotIn("restaurant_session", worker_app.extensions)
+        self.assertNotIn("restaurant_executor", worker_app.extensions)
+        self.assertRaises(RuntimeError, executor.submit, print) # shut down
+
+    def test_reinit(self):
+        """ After reinit the app has its own connections and threads """
+        session = self.app.extensions["restaurant_session"]
+        executor = self.app.extensions["restaurant_executor"]
+        reinit(self.app)
+        self.assertIsNot(self.app.extensions["restaurant_session"], session)
+        self.assertIsNot(self.app.extensions["restaurant_executor"], executor)
+
+        client = self.app.test_client()
+        self.assertEqual(client.get("/bookings/1").status_code, 200)
+
+    @unittest.skipUnless(hasattr(os, "fork"), "fork is not available")
+    def test_fork(self):
+        """ A forked process can use the app created before the fork """
+        client = self.app.test_client()
+        self.assertEqual(client.get("/bookings/1").status_code, 200) # the parent opens its connections
+        with self.app.app_context():
+            count = db.session.query(Booking).count()
+        booking = {
+            "user_id":1,
+            "restaurant_id":3,
+            "number_of_people":3,
+            "booking_datetime": (datetime.datetime.now().replace(hour=13) + datetime.timedelta(days=1)).isoformat()
+            }
+
+        pid = os.fork()
+        if pid == 0: # the worker
+            code = 1
+            try:
+                reinit(self.app)
+                response = client.post("/bookings", json=booking)
+                if response.status_code == 201:
+                    code = 0
+            finally:
+                os._exit(code)
+        _, status = os.waitpid(pid, 0)
+        self.assertEqual(os.WEXITSTATUS(status), 0)
+
+        self.assertEqual(client.get("/bookings/1").status_code, 200) # the parent connections still work
+        with self.app.app_context():
+            self.assertEqual(db.session.query(Booking).count(), count+1)
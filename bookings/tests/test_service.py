@@ -1,8 +1,13 @@
 import unittest 
 import datetime
+import json as jsonlib
+
+import pytest
 
 from bookings.app import create_app 
 
+from bookings.utils import get_a_table
+
 
 class BookingsTests(unittest.TestCase): 
     """ Tests endpoints with mocks """
@@ -274,6 +279,47 @@ class BookingsTests(unittest.TestCase):
         json = response.get_json()
         self.assertEqual(response.status_code, 409, msg=json) # no free tables (now)
 
+    def test_new_bookings_batch(self):
+        """ Tests the creation of many bookings at once """
+        client = self.app.test_client()
+
+        tomorrow = (datetime.datetime.now().replace(hour=13) + datetime.timedelta(days=1)).isoformat()
+        booking = {
+            "user_id":1,
+            "restaurant_id":3,
+            "number_of_people":1, 
+            "booking_datetime": tomorrow
+            }
+        bookings = [
+            booking,
+            dict(booking, user_id=2),
+            dict(booking, booking_datetime="worngdatetime"),
+            dict(booking, user_id=3),
+            dict(booking, restaurant_id=2, booking_datetime=(datetime.datetime.now().replace(hour=18) + datetime.timedelta(days=1)).isoformat()),
+            dict(booking, restaurant_id=42),
+            dict(booking, restaurant_id=4, number_of_people=2, booking_datetime=(datetime.datetime.now().replace(hour=21) + datetime.timedelta(days=2)).isoformat()),
+        ]
+        response = client.post('/bookings/batch',json=bookings)
+        json = response.get_json()
+        self.assertEqual(response.status_code, 200, msg=json)
+        self.assertEqual([r["status"] for r in json], [201, 201, 400, 409, 409, 500, 201], msg=json)
+
+        self.assertEqual(json[0]["booking"]["table_id"], 6, msg=json) # the smaller table
+        self.assertEqual(json[1]["booking"]["table_id"], 5, msg=json) # 6 has been given to the first booking (4 is already booked)
+        self.assertEqual(json[3]["error"]["title"], "Conflict", msg=json) # no more free tables
+        self.assertEqual(json[6]["booking"]["table_id"], 3, msg=json)
+
+        for r in [json[0], json[1], json[6]]: # the bookings have been made
+            response = client.get(r["booking"]["url"])
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.get_json(), r["booking"])
+
+        response = client.post('/bookings', json=booking) # no more space
+        self.assertEqual(response.status_code, 409)
+
+        response = client.post('/bookings/batch',json=[]) 
+        self.assertEqual(response.status_code, 400) # at least a booking
+
     def test_404(self): 
         """ Tests that all the endpoints that manage ids responds with 404 in case of not found error """
         client = self.app.test_client() 
@@ -301,6 +347,88 @@ class BookingsTests(unittest.TestCase):
         self.assertEqual(response.status_code, 200, msg=json) # OK
         self.assertEqual(len(json), 8, msg=json) # right length
 
+    def test_get_bookings_pages(self): 
+        """ Tests get the list of all bookings one page at a time """
+        client = self.app.test_client() 
+
+        response = client.get('/bookings?limit=3') 
+        json = response.get_json() 
+        self.assertEqual(response.status_code, 200, msg=json) # OK
+        self.assertEqual([b["id"] for b in json], [1,2,3], msg=json) # first page
+        self.assertEqual(response.headers["Link"], '</bookings?limit=3&after_id=3>; rel="next"')
+
+        response = client.get('/bookings?limit=3&after_id=3') 
+        json = response.get_json() 
+        self.assertEqual(response.status_code, 200, msg=json)
+        self.assertEqual([b["id"] for b in json], [4,5,6], msg=json) # second page
+        self.assertEqual(response.headers["Link"], '</bookings?limit=3&after_id=6>; rel="next"')
+
+        response = client.get('/bookings?limit=3&after_id=6') 
+        json = response.get_json() 
+        self.assertEqual(response.status_code, 200, msg=json)
+        self.assertEqual([b["id"] for b in json], [7,8], msg=json) # last page
+        self.assertNotIn("Link", response.headers) # no next page
+
+        response = client.get('/bookings?rest=3&limit=2') # with filters
+        json = response.get_json() 
+        self.assertEqual(response.status_code, 200, msg=json)
+        self.assertEqual([b["id"] for b in json], [2,5], msg=json)
+        self.assertEqual(response.headers["Link"], '</bookings?rest=3&limit=2&after_id=5>; rel="next"')
+
+        response = client.get('/bookings?rest=3&limit=2&after_id=5') 
+        json = response.get_json() 
+        self.assertEqual([b["id"] for b in json], [6,7], msg=json)
+
+        response = client.get('/bookings?limit=0') 
+        json = response.get_json() 
+        self.assertEqual(response.status_code, 400, msg=json) # limit must be positive
+
+    def test_get_bookings_fields(self): 
+        """ Tests get only some properties of the bookings """
+        client = self.app.test_client() 
+
+        response = client.get('/bookings?fields=user_id,table_id') 
+        json = response.get_json() 
+        self.assertEqual(response.status_code, 200, msg=json)
+        self.assertEqual(len(json), 8, msg=json)
+        self.assertEqual(json[0], {"user_id":3, "table_id":3}, msg=json) # only the requested properties
+
+        response = client.get('/bookings?user=3&fields=url,booking_datetime&limit=1') 
+        json = response.get_json() 
+        self.assertEqual(response.status_code, 200, msg=json)
+        self.assertEqual(sorted(json[0].keys()), ["booking_datetime", "url"], msg=json)
+        self.assertEqual(json[0]["url"], "/bookings/1", msg=json)
+        self.assertIn("after_id=1", response.headers["Link"])
+
+        response = client.get('/bookings?fields=password') 
+        json = response.get_json() 
+        self.assertEqual(response.status_code, 400, msg=json) # not a property
+
+    def test_get_bookings_stream(self): 
+        """ Tests get the list of all bookings as newline delimited json """
+        client = self.app.test_client() 
+        self.app.config["STREAM_BATCH_SIZE"] = 3 # more batches
+
+        expected = client.get('/bookings').get_json()
+
+        response = client.get('/bookings?stream=true') 
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, "application/x-ndjson")
+        lines = response.get_data(as_text=True).splitlines()
+        self.assertEqual([jsonlib.loads(l) for l in lines], expected) # same bookings, one for each line
+
+        response = client.get('/bookings', headers={"Accept":"application/x-ndjson"}) 
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, "application/x-ndjson")
+        self.assertEqual(len(response.get_data(as_text=True).splitlines()), 8)
+
+        response = client.get('/bookings?stream=true&rest=3&fields=id,table_id&limit=2') # with filters, projection and limit
+        lines = response.get_data(as_text=True).splitlines()
+        self.assertEqual([jsonlib.loads(l) for l in lines], [{"id":2, "table_id":4}, {"id":5, "table_id":5}])
+
+        response = client.get('/bookings?stream=true&begin=now') 
+        self.assertEqual(response.status_code, 400) # the filters are checked before streaming
+
     def test_bookings_filter_by_id(self): 
         """ Tests get the list of all bookings that match the filters (only filters that work with ids)"""
         client = self.app.test_client() 
@@ -546,4 +674,118 @@ class BookingsTests(unittest.TestCase):
             }
         response = client.put('/bookings/2',json=booking) # try to change
         json = response.get_json()
-        self.assertEqual(response.status_code, 400, msg=json) # forbidden
\ No newline at end of file
+        self.assertEqual(response.status_code, 400, msg=json) # forbidden
+
+    def test_availability(self):
+        """ The available slots are the ones in which get_a_table finds a table """
+        client = self.app.test_client()
+        day = datetime.datetime.now().replace(hour=0,minute=0,second=0,microsecond=0) + datetime.timedelta(days=70)
+        url = "/restaurants/3/availability?from="+day.isoformat()+"&to="+(day + datetime.timedelta(days=2)).isoformat()+"&people=2&step=30"
+
+        for _ in range(3): # all the tables at 13:00
+            booking = {"user_id":1, "restaurant_id":3, "number_of_people":2, "booking_datetime":(day + datetime.timedelta(hours=13)).isoformat()}
+            response = client.post('/bookings', json=booking)
+            self.assertEqual(response.status_code, 201, msg=response.get_json())
+
+        response = client.get(url)
+        json = response.get_json()
+        self.assertEqual(response.status_code, 200, msg=json)
+        with self.app.app_context():
+            expected = []
+            for i in range(2 * 48 + 1):
+                slot = day + datetime.timedelta(minutes=30 * i)
+                if get_a_table(3, 2, slot) > 0:
+                    expected.append(slot.isoformat()+"Z")
+        self.assertEqual(json, expected)
+        self.assertNotIn((day + datetime.timedelta(hours=13)).isoformat()+"Z", json)
+        self.assertNotEqual(json, [])
+
+        response = client.get(url.replace("people=2", "people=6")) # no tables so big
+        self.assertEqual(response.get_json(), [])
+
+    def test_availability_400(self):
+        """ Bad periods """
+        client = self.app.test_client()
+        now = datetime.datetime.now()
+        response = client.get("/restaurants/3/availability?from=wrongdatetime&to="+now.isoformat())
+        self.assertEqual(response.status_code, 400, msg=response.get_json())
+        response = client.get("/restaurants/3/availability?from="+now.isoformat()+"&to="+(now - datetime.timedelta(days=1)).isoformat())
+        self.assertEqual(response.status_code, 400, msg=response.get_json())
+        response = client.get("/restaurants/3/availability?from="+now.isoformat()+"&to="+(now + datetime.timedelta(days=1000)).isoformat()+"&step=1")
+        self.assertEqual(response.status_code, 400, msg=response.get_json()) # too many slots
+
+@pytest.mark.usefixtures("query_budget")
+class QueryBudgetTests(unittest.TestCase):
+    """ Tests the statements run on the database by each endpoint (see the fixture query_budget in conftest.py)
+
+    The bookings are the ones of the mocks, the restaurants have never been locked:
+    the first lock of a restaurant creates its row (4 statements instead of 2).
+    """
+
+    ############################
+    #### setup and teardown ####
+    ############################
+
+    # executed prior to each test
+    def setUp(self):
+        app = create_app("TEST")
+        self.app = app.app
+        self.app.config['TESTING'] = True
+        self.client = self.app.test_client()
+        self.day = (datetime.datetime.now() + datetime.timedelta(days=3)).replace(hour=13, minute=0, second=0, microsecond=0)
+
+    def request(self, method, url, **kwargs):
+        response = getattr(self.client, method)(url, **kwargs)
+        self.assertLess(response.status_code, 300, msg=response.data)
+        return response
+
+###############
+#### tests ####
+###############
+
+    def test_get_bookings(self):
+        with self.query_budget(1):
+            self.request("get", "/bookings")
+        with self.query_budget(1):
+            self.request("get", "/bookings?rest=3&begin=2020-11-10T00:00:00Z&fields=id,user_id")
+        with self.query_budget(0): # cached
+            self.request("get", "/bookings")
+
+    def test_get_booking(self):
+        with self.query_budget(1):
+            self.request("get", "/bookings/2")
+        with self.query_budget(0): # cached
+            self.request("get", "/bookings/2")
+
+    def test_new_booking(self):
+        """ The lock of the restaurant and the insert """
+        booking = {"user_id": 1, "restaurant_id": 3, "number_of_people": 1, "booking_datetime": self.day.isoformat()}
+        with self.query_budget(5):
+            self.request("post", "/bookings", json=booking)
+
+    def test_new_bookings(self):
+        """ The lock and the occupied tables of each restaurant, an insert for each booking (to get its id) """
+        bookings = [{"user_id": u, "restaurant_id": r, "number_of_people": 1, "booking_datetime": self.day.isoformat()} for u,r in [(1,3), (2,3), (3,2)]]
+        with self.query_budget(2 * (4 + 1) + 3):
+            self.request("post", "/bookings/batch", json=bookings)
+
+    def test_put_booking(self):
+        """ The booking is read once, the lock of the restaurant and the update """
+        with self.query_budget(1 + 4 + 1):
+            self.request("put", "/bookings/2", json={"number_of_people": 2})
+        with self.query_budget(2):
+            self.request("put", "/bookings/2?entrance=true", json={})
+
+    def test_delete_booking(self):
+        with self.query_budget(1 + 4 + 1):
+            self.request("delete", "/bookings/2")
+
+    def test_availability(self):
+        """ The bookings of the restaurant are read once for all the slots """
+        with self.query_budget(1):
+            self.request("get", "/restaurants/3/availability?from=%s&to=%s" % (self.day.isoformat(), (self.day + datetime.timedelta(hours=5)).isoformat()))
+
+    def test_contacts(self):
+        """ Two queries for each hop (the visits and the entrances around them) """
+        with self.query_budget(2 * 3):
+            self.request("get", "/contacts?user=4&depth=3")
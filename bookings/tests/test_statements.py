@@ -0,0 +1,70 @@
+import unittest
+
+from sqlalchemy import text
+
+from bookings.app import create_app
+
+from bookings.orm import db
+
+from bookings.statements import explain, recording
+
+class StatementsTests(unittest.TestCase):
+    """ Tests the instrumentation of the statements run on the database """
+
+############################
+#### setup and teardown ####
+############################
+
+    # executed prior to each test
+    def setUp(self):
+        app = create_app("TEST")
+        self.app = app.app
+        self.app.config['TESTING'] = True
+        self.client = self.app.test_client()
+
+###############
+#### tests ####
+###############
+
+    def test_headers_in_debug_mode(self):
+        """ The statements of the request are counted in the headers in debug mode only """
+        response = self.client.get('/bookings/2')
+        self.assertNotIn("X-Query-Count", response.headers)
+
+        self.app.config["DEBUG"] = True
+        response = self.client.get('/bookings/3')
+        self.assertEqual(response.headers["X-Query-Count"], "1")
+        self.assertGreater(float(response.headers["X-Query-Time"]), 0)
+        response = self.client.get('/bookings/3') # cached
+        self.assertEqual(response.headers["X-Query-Count"], "0")
+        self.assertEqual(float(response.headers["X-Query-Time"]), 0)
+
+    def test_slow_query_logged(self):
+        """ The slow statements are logged with their parameters and query plan """
+        self.app.config["SLOW_QUERY_MS"] = 1e-6 # every statement is slow
+        with self.assertLogs(level="WARNING") as logs:
+            self.client.get('/bookings?user=3')
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn("SLOW QUERY", logs.output[0])
+        self.assertRegex(logs.output[0], r"\(3,|'user_id_1': 3") # the parameters (a tuple for SQLite, a dict for PostgreSQL)
+        self.assertIn("ix_booking_user_datetime", logs.output[0]) # the plan (the only index on user_id)
+
+        self.app.config["SLOW_QUERY_MS"] = 0 # disabled
+        with self.assertRaises(AssertionError): # nothing logged
+            with self.assertLogs(level="WARNING"):
+                self.client.get('/bookings?user=3')
+
+    def test_explain(self):
+        with self.app.app_context():
+            connection = db.session.connection()
+            if connection.dialect.name == "sqlite":
+                self.assertIn("ix_booking_user_datetime", explain(connection, "SELECT id FROM booking WHERE user_id = ?", (3,)))
+            self.assertIsNone(explain(connection, "UPDATE booking SET number_of_people = 1", ()))
+
+    def test_recording(self):
+        with self.app.app_context():
+            with recording() as statements:
+                db.session.execute(text("SELECT 1"))
+                db.session.execute(text("SELECT 2"))
+            db.session.execute(text("SELECT 3"))
+        self.assertEqual(statements, ["SELECT 1", "SELECT 2"])
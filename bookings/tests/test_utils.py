@@ -1,7 +1,14 @@
 import unittest 
 import datetime
+import time
+import gc
+import weakref
 
-from bookings.utils import get_restaurant, get_tables, restaurant_is_open, get_a_table, update_booking
+from bookings.utils import get_restaurant, get_tables, restaurant_is_open, get_a_table, update_booking, get_from, create_session, allocate_tables
+
+from bookings.app import teardown, APPS
+
+from bookings.tests.stub_restaurants import StubRestaurantService
 
 from bookings.app import create_app 
 
@@ -204,4 +211,115 @@ class BookingsUtilsTests(unittest.TestCase):
     def test_update_booking_wrong_id(self):
         """ Try to update a booking with a very big id (not in fake data) """
         with self.app.app_context():
-            self.assertEqual(None,update_booking(999, 2, datetime.datetime.now(), 1)) # not found ( ids in range 1-4) in faked data
\ No newline at end of file
+            self.assertEqual(None,update_booking(999, 2, datetime.datetime.now(), 1)) # not found ( ids in range 1-4) in faked data
+
+
+class RestaurantSessionTests(unittest.TestCase):
+    """ Tests the pooled session used for the calls to the restaurant microservice (against a local stub) """
+
+############################ 
+#### setup and teardown #### 
+############################ 
+
+    # executed prior to each test 
+    def setUp(self): 
+        self.stub = StubRestaurantService()
+        self.url = self.stub.start()
+        app = create_app("FAILURE_TEST") # Test without mocks
+        self.app = app.app 
+        self.app.config['TESTING'] = True 
+
+    # executed after each test 
+    def tearDown(self): 
+        self.stub.stop()
+
+###############
+#### tests #### 
+############### 
+
+    def test_keep_alive(self):
+        """ The connection to the restaurant microservice is reused """
+        with self.app.app_context():
+            for i in range(5):
+                r = get_from(self.url+"restaurants/3")
+                self.assertEqual(r["id"], 3, msg=r)
+        self.assertEqual(len(self.stub.requests), 5, msg=self.stub.requests)
+        self.assertEqual(len(self.stub.connections), 1, msg=self.stub.connections) # a single connection
+
+    def test_retries(self):
+        """ The failed requests are retried as configured """
+        config = dict(self.app.config, HTTP_RETRIES=2, HTTP_BACKOFF=0)
+        self.app.extensions["restaurant_session"] = create_session(config)
+
+        with self.app.app_context():
+            self.stub.failures = 2
+            r = get_from(self.url+"restaurants/3")
+            self.assertEqual(r["id"], 3, msg=r) # the third attempt succeeded
+            self.assertEqual(len(self.stub.requests), 3, msg=self.stub.requests)
+
+            self.stub.failures = 3
+            r = get_from(self.url+"restaurants/3")
+            self.assertEqual(r, None, msg=r) # too many failures
+            self.assertEqual(len(self.stub.requests), 6, msg=self.stub.requests)
+
+    def test_no_retries(self):
+        """ By default the failed requests are not retried """
+        with self.app.app_context():
+            self.stub.failures = 1
+            r = get_from(self.url+"restaurants/3")
+            self.assertEqual(r, None, msg=r)
+            self.assertEqual(len(self.stub.requests), 1, msg=self.stub.requests)
+
+    def test_get_a_table_concurrent(self):
+        """ The restaurant and its tables are requested at the same time """
+        self.stub.delay = 0.3
+        self.app.config["REST_SERVICE_URL"] = self.url
+        self.app.extensions["restaurant_cache"].ttl = 0 # always ask the restaurant microservice
+
+        booking = (datetime.datetime.now().replace(hour=13) + datetime.timedelta(days=1))
+        with self.app.app_context():
+            start = time.perf_counter()
+            r = get_a_table(3, 1, booking)
+            elapsed = time.perf_counter() - start
+        self.assertEqual(r, 6, msg=r) # same result as with mocks
+        self.assertEqual(self.stub.count("/restaurants/3"), 1, msg=self.stub.requests)
+        self.assertEqual(self.stub.count("/restaurants/3/tables"), 1, msg=self.stub.requests)
+        self.assertLess(elapsed, 0.55, msg=elapsed) # one round trip (0.3s), not two (0.6s)
+
+    def test_allocate_tables_once_per_restaurant(self):
+        """ Many bookings of the same restaurants: each restaurant is requested once """
+        self.app.config["REST_SERVICE_URL"] = self.url
+        self.app.extensions["restaurant_cache"].ttl = 0 # always ask the restaurant microservice
+
+        booking = (datetime.datetime.now().replace(hour=13) + datetime.timedelta(days=1))
+        with self.app.app_context():
+            r = allocate_tables([(3, 1, booking)] * 4 + [(4, 2, booking.replace(hour=21))] * 2)
+        self.assertEqual(r, [6, 5, -1, -1, 3, -1], msg=r) # table 4 is already booked
+        self.assertEqual(self.stub.count("/restaurants/3"), 1, msg=self.stub.requests)
+        self.assertEqual(self.stub.count("/restaurants/3/tables"), 1, msg=self.stub.requests)
+        self.assertEqual(self.stub.count("/restaurants/4"), 1, msg=self.stub.requests)
+        self.assertEqual(self.stub.count("/restaurants/4/tables"), 1, msg=self.stub.requests)
+
+    def test_teardown(self):
+        """ The session is closed and removed with the app """
+        teardown(self.app)
+        self.assertNotIn("restaurant_session", self.app.extensions)
+        teardown(self.app) # nothing to do
+
+    def test_teardown_replaced(self):
+        """ The resources replaced by something else are only removed """
+        self.app.extensions["restaurant_session"] = object()
+        self.app.extensions["restaurant_client"] = None
+        teardown(self.app)
+        self.assertNotIn("restaurant_session", self.app.extensions)
+        self.assertNotIn("restaurant_executor", self.app.extensions)
+
+    def test_apps_not_kept(self):
+        """ The apps are not kept alive until the exit to be released """
+        app = create_app("TEST").app
+        self.assertIn(app, APPS)
+        apps = weakref.ref(app)
+        teardown(app)
+        del app
+        gc.collect()
+        self.assertIsNone(apps())
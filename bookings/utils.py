@@ -1,9 +1,22 @@
 import datetime
+import time
+import httpx
 import requests
 
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
 from flask import current_app
 
-from bookings.orm import db, Booking
+from sqlalchemy import event, inspect, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm.exc import StaleDataError
+
+from bookings.orm import db, Booking, RestaurantLock
+from bookings.occupancy import RestaurantOccupancy
+from bookings.schedule import Schedule
+from bookings.responses import booking_tags
+from bookings import metrics
 
 """ The list of restaurants used when the mocks are required 
     
@@ -95,96 +108,530 @@ tables = [
     [{"id":3, "capacity":2}]
 ]
 
+def create_session(config):
+    """ Return the HTTP session used for the requests to the other microservices
+
+    The session keeps a pool of keep-alive connections for each host, 
+    so the connections are reused instead of opening a new one for every request.
+    It is shared by all the threads of the app (the connection pools are thread safe).
+
+    Configuration:
+        - HTTP_POOL_CONNECTIONS: the number of hosts whose pool is kept
+        - HTTP_POOL_MAXSIZE: the max number of connections kept for each host
+        - HTTP_POOL_BLOCK: if true, no more than HTTP_POOL_MAXSIZE connections are opened to a host (requests wait for a free one)
+        - HTTP_RETRIES: how many times a failed request is retried (connection errors, 502, 503 and 504);
+          with the circuit breaker keep it at 0: each retry of a dead service waits another TIMEOUT
+          before the breaker counts a single failure
+        - HTTP_BACKOFF: the backoff factor between retries (sleeps backoff * 2^(retry-1) seconds)
+    """
+    retry = Retry(
+        total=config["HTTP_RETRIES"],
+        backoff_factor=config["HTTP_BACKOFF"],
+        status_forcelist=(502, 503, 504),
+        allowed_methods=frozenset(["GET"]),
+        raise_on_status=False, # return the last response
+    )
+    adapter = HTTPAdapter(
+        pool_connections=config["HTTP_POOL_CONNECTIONS"],
+        pool_maxsize=config["HTTP_POOL_MAXSIZE"],
+        pool_block=config["HTTP_POOL_BLOCK"],
+        max_retries=retry,
+    )
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
 def get_from(url):
-    """ Makes a get request with a timeout.
+    """ Makes a get request with a timeout (through the pooled session of the app).
 
     Returns the json object if the code is 200, otherwise None
 
     The timeout is set in config.ini or the default one is used (0.001)
+
+    The requests go through the circuit breaker of the app (see bookings.breaker):
+    the connection errors, the timeouts and the 5xx responses are failures
+    and, while the breaker is open, None is returned at once.
+
+    It runs in the app context of the caller (the request or the thread of submit), see get_restaurant.
     """
     try:
-        with current_app.app_context():
-            r = requests.get(url, timeout=current_app.config["TIMEOUT"])
-            if r.status_code == 200:
-                return r.json()
+        breaker = current_app.extensions["restaurant_breaker"]
+        session = current_app.extensions["restaurant_session"]
+        if not breaker.allow(): # the service is down: fail fast
+            metrics.RESTAURANT_LATENCY.labels("rejected").observe(0)
             return None
+        start = time.perf_counter()
+        try:
+            r = session.get(url, timeout=current_app.config["TIMEOUT"])
+        except requests.RequestException: # connection error or timeout
+            breaker.failure()
+            metrics.RESTAURANT_LATENCY.labels("failed").observe(time.perf_counter() - start)
+            return None
+        except BaseException: # any other error is a failure too (a probe of the breaker must always be resolved)
+            breaker.failure()
+            metrics.RESTAURANT_LATENCY.labels("failed").observe(time.perf_counter() - start)
+            raise
+        if r.status_code >= 500:
+            breaker.failure()
+            metrics.RESTAURANT_LATENCY.labels("error").observe(time.perf_counter() - start)
+        else:
+            breaker.success()
+            metrics.RESTAURANT_LATENCY.labels("ok").observe(time.perf_counter() - start)
+        if r.status_code == 200:
+            return r.json()
+        return None
     except:
         return None
 
+def get_cached_from(key, url):
+    """ Makes a get request (see get_from) unless the response is in the restaurants' cache.
+
+    Only the successful responses are stored, they expire after RESTAURANT_CACHE_TTL seconds.
+
+    If RESTAURANT_SERVE_STALE is true, an expired response is returned at once 
+    while a fresh one is requested in background (it is kept if the request fails).
+
+    With REMOTE_CLIENT = async the request is made by the async client of the app (see get_cached_from_async).
+    """
+    client = current_app.extensions.get("restaurant_client")
+    if client is not None:
+        return client.run(get_cached_from_async(current_app._get_current_object(), key, url))
+    cache = current_app.extensions["restaurant_cache"]
+    data = cache.get(key)
+    if data is not None:
+        return data
+    if cache.keep_stale:
+        data = cache.get_stale(key)
+        if data is not None:
+            if cache.start_refresh(key): # only one refresh for each key
+                submit(refresh_cached, key, url)
+            return data
+    data = get_from(url)
+    cache.set(key, data)
+    return data
+
+def refresh_cached(key, url):
+    """ Request again a response of the restaurants' cache (in background, see get_cached_from) """
+    cache = current_app.extensions["restaurant_cache"]
+    try:
+        cache.set(key, get_from(url)) # a failed request is not stored: the stale response is kept
+    finally:
+        cache.end_refresh(key)
+
+async def get_from_async(app, url):
+    """ get_from as a coroutine, with the async client of the app (see bookings.remote) """
+    try:
+        breaker = app.extensions["restaurant_breaker"]
+        client = app.extensions["restaurant_client"]
+        if not breaker.allow(): # the service is down: fail fast
+            metrics.RESTAURANT_LATENCY.labels("rejected").observe(0)
+            return None
+        start = time.perf_counter()
+        try:
+            r = await client.get(url)
+        except httpx.HTTPError: # connection error or timeout
+            breaker.failure()
+            metrics.RESTAURANT_LATENCY.labels("failed").observe(time.perf_counter() - start)
+            return None
+        except BaseException: # any other error (e.g. cancelled by a timeout of client.run) is a failure too (see get_from)
+            breaker.failure()
+            metrics.RESTAURANT_LATENCY.labels("failed").observe(time.perf_counter() - start)
+            raise
+        if r.status_code >= 500:
+            breaker.failure()
+            metrics.RESTAURANT_LATENCY.labels("error").observe(time.perf_counter() - start)
+        else:
+            breaker.success()
+            metrics.RESTAURANT_LATENCY.labels("ok").observe(time.perf_counter() - start)
+        if r.status_code == 200:
+            return r.json()
+        return None
+    except:
+        return None
+
+async def get_cached_from_async(app, key, url):
+    """ get_cached_from as a coroutine (the stale responses are refreshed by another coroutine) """
+    cache = app.extensions["restaurant_cache"]
+    data = cache.get(key)
+    if data is not None:
+        return data
+    if cache.keep_stale:
+        data = cache.get_stale(key)
+        if data is not None:
+            if cache.start_refresh(key): # only one refresh for each key
+                app.extensions["restaurant_client"].spawn(refresh_cached_async(app, key, url))
+            return data
+    data = await get_from_async(app, url)
+    cache.set(key, data)
+    return data
+
+async def refresh_cached_async(app, key, url):
+    """ refresh_cached as a coroutine """
+    cache = app.extensions["restaurant_cache"]
+    try:
+        cache.set(key, await get_from_async(app, url))
+    finally:
+        cache.end_refresh(key)
+
+def invalidate_restaurant(id):
+    """ Remove the restaurant and its tables from the restaurants' cache
+
+    The next request will get the fresh data from the restaurant microservice.
+    """
+    cache = current_app.extensions["restaurant_cache"]
+    cache.delete(("restaurant", id))
+    cache.delete(("tables", id))
+
+def mocks():
+    """ Return the restaurants and the tables used as mocks: the ones of the fake data (see bookings.fake_data) or the default ones """
+    return current_app.extensions.get("fake_world", (restaurants, tables))
+
 def get_restaurant(id):
     """ Get the restaurant json or None 
     
     Use the default ones if mocks are requested
+
+    It runs in the app context of the caller: a new one would remove the session of the request when it ends
+    (the bookings loaded by the request would be read again).
     """
-    with current_app.app_context():
-        if current_app.config["USE_MOCKS"]:
-            id -= 1 # restaurant IDs starting by 1
-            if 0 <= id < len(restaurants):
-                return restaurants[id]
-            else:
-                return None
+    if current_app.config["USE_MOCKS"]:
+        mock_restaurants, _ = mocks()
+        id -= 1 # restaurant IDs starting by 1
+        if 0 <= id < len(mock_restaurants):
+            return mock_restaurants[id]
         else:
-            return get_from(current_app.config["REST_SERVICE_URL"]+"/restaurants/"+str(id))
+            return None
+    else:
+        return get_cached_from(("restaurant", id), current_app.config["REST_SERVICE_URL"]+"/restaurants/"+str(id))
 
 def get_tables(id):
     """ Get the list fo the restaurant's tables or None 
     
-    Use the default ones if mocks are requested
+    Use the default ones if mocks are requested (in the app context of the caller, see get_restaurant)
     """
-    with current_app.app_context():
-        if current_app.config["USE_MOCKS"]:
-            id -= 1 # restaurant IDs starting by 1
-            if 0 <= id < len(restaurants):
-                return tables[id]
-            else:
-                return None
+    if current_app.config["USE_MOCKS"]:
+        _, mock_tables = mocks()
+        id -= 1 # restaurant IDs starting by 1
+        if 0 <= id < len(mock_tables):
+            return mock_tables[id]
         else:
-            return get_from(current_app.config["REST_SERVICE_URL"]+"/restaurants/"+str(id)+"/tables")
+            return None
+    else:
+        return get_cached_from(("tables", id), current_app.config["REST_SERVICE_URL"]+"/restaurants/"+str(id)+"/tables")
+
+async def get_restaurant_async(app, id):
+    """ get_restaurant as a coroutine """
+    if app.config["USE_MOCKS"]:
+        with app.app_context():
+            return get_restaurant(id)
+    return await get_cached_from_async(app, ("restaurant", id), app.config["REST_SERVICE_URL"]+"/restaurants/"+str(id))
+
+async def get_tables_async(app, id):
+    """ get_tables as a coroutine """
+    if app.config["USE_MOCKS"]:
+        with app.app_context():
+            return get_tables(id)
+    return await get_cached_from_async(app, ("tables", id), app.config["REST_SERVICE_URL"]+"/restaurants/"+str(id)+"/tables")
+
+def fetch_restaurant(id):
+    """ Request the restaurant in background (see get_restaurant), return a Future with the json or None """
+    return fetch(get_restaurant, get_restaurant_async, id)
+
+def fetch_tables(id):
+    """ Request the tables of the restaurant in background (see get_tables), return a Future with the list or None """
+    return fetch(get_tables, get_tables_async, id)
+
+def fetch(function, coroutine, id):
+    """ Run function(id) in the thread pool of the app (see submit) or, 
+    with REMOTE_CLIENT = async, coroutine(app, id) on the event loop of the async client (see bookings.remote).
+
+    Return a Future with the result.
+    """
+    app = current_app._get_current_object()
+    client = app.extensions.get("restaurant_client")
+    if client is None:
+        return submit(function, id)
+    return client.submit(coroutine(app, id))
+
+def submit(function, *args):
+    """ Run function(*args) in the thread pool of the app (inside the app context)
+
+    Return a Future with the result. 
+    The pool is bounded (REMOTE_WORKERS threads): it is used to make the calls to the other microservices concurrently.
+    """
+    app = current_app._get_current_object()
+    def run():
+        with app.app_context():
+            return function(*args)
+    return app.extensions["restaurant_executor"].submit(run)
 
 def add_booking(user_id, rest_id, number_of_people, booking_datetime, table_id, entrance_datetime=None):
     """ Add a new reservation 
     
-    Return the booking id, otherwise
+    Return the booking (dict), otherwise
     Return None if a db error occured
     """
     try:
         booking = Booking()
         booking.restaurant_id = rest_id
         booking.user_id = user_id
-        booking.booking_datetime = booking_datetime
+        booking.booking_datetime = naive(booking_datetime) # dumped as it will be read
         booking.entrance_datetime = entrance_datetime
         booking.number_of_people = number_of_people
         booking.table_id = table_id
         booking.datetime = datetime.datetime.now()
         db.session.add(booking)
+        db.session.flush() # get the id
+        added = booking.dump() # before the commit expires it (it would be read again)
+        db.session.commit()
+        return added
+    except:
+        db.session.rollback()
+        return None
+
+def add_bookings(bookings):
+    """ Add many reservations with a single commit 
+    
+    Return the list of the bookings (dict), otherwise
+    Return None if a db error occured (no booking is added)
+
+    Parameters:
+        - bookings: a list of (user_id, rest_id, number_of_people, booking_datetime, table_id)
+    """
+    try:
+        added = []
+        now = datetime.datetime.now()
+        for user_id, rest_id, number_of_people, booking_datetime, table_id in bookings:
+            booking = Booking()
+            booking.restaurant_id = rest_id
+            booking.user_id = user_id
+            booking.booking_datetime = naive(booking_datetime) # dumped as it will be read
+            booking.number_of_people = number_of_people
+            booking.table_id = table_id
+            booking.datetime = now
+            added.append(booking)
+        db.session.add_all(added)
+        db.session.flush() # get the ids
+        added = [b.dump() for b in added] # before the commit expires them
         db.session.commit()
-        return booking.id
+        return added
     except:
         db.session.rollback()
         return None
 
-def update_booking(booking_id, number_of_people, booking_datetime, table_id, entrance_datetime=None):
+def update_booking(booking_id, number_of_people, booking_datetime, table_id, entrance_datetime=None, version=None):
     """ Edit a reservation specified by the id 
+
+    If version is given, the booking is changed only if it is still at that version
+    (checked again by the update itself, see Booking.version).
+
+    The booking already loaded in the session (e.g. by the request) is not read again,
+    and the result is dumped before the commit: the update is the only statement on the booking.
     
-    Return the booking id, otherwise
+    Return the booking (dict), otherwise
+    Return -1 if the booking has been changed meanwhile (not at the version)
     Return None if a db error occured
     """
     try:
-        booking = db.session.query(Booking).filter_by(id = booking_id).first()
+        booking = db.session.get(Booking, booking_id) # from the identity map, if it has been loaded
         if booking is None:
             return None
-        booking.booking_datetime = booking_datetime
+        if version is not None and booking.version != version:
+            db.session.rollback()
+            return -1
+        booking.booking_datetime = naive(booking_datetime) # dumped as it will be read
         booking.entrance_datetime = entrance_datetime
         booking.number_of_people = number_of_people
         booking.table_id = table_id
-        db.session.add(booking)
+        db.session.flush()
+        updated = booking.dump() # before the commit expires it (it would be read again)
         db.session.commit()
-        return booking.id
+        return updated
+    except StaleDataError: # changed by another request after it has been read
+        db.session.rollback()
+        return -1
     except:
         db.session.rollback()
         return None
 
-def get_a_table(restaurant_id, number_of_people, booking_datetime, excluded=-1):
+def lock_restaurant(restaurant_id):
+    """ Lock the bookings of a restaurant until the end of the transaction (commit or rollback)
+
+    The search of a free table and the insertion (or update) of the booking must be atomic,
+    otherwise two concurrent requests (threads or workers) can be given the same table.
+    The lock is the update of the row of the restaurant in restaurant_lock (created the first time),
+    so it works with every database: a row lock on PostgreSQL/MySQL, the write lock of the database on SQLite.
+    The other requests for the same restaurant wait for the commit (up to the timeout of the database).
+
+    Every lock increments the version of the bookings of the restaurant (committed with the changes),
+    that is used to know if the occupancy index of the restaurant is up to date.
+    Where the database supports it (PostgreSQL) the new version is returned by the update itself (UPDATE ... RETURNING),
+    otherwise it is read after the update.
+
+    Return the new version if the lock has been taken, None if a db error occured (e.g. timeout)
+    """
+    returning = db.engine.dialect.full_returning
+    for _ in range(2):
+        try:
+            if returning:
+                version = db.session.execute(update(RestaurantLock).where(RestaurantLock.restaurant_id == restaurant_id)\
+                    .values(version=RestaurantLock.version + 1).returning(RestaurantLock.version)\
+                    .execution_options(synchronize_session=False)).scalar()
+            else:
+                updated = db.session.query(RestaurantLock).filter_by(restaurant_id = restaurant_id)\
+                    .update({RestaurantLock.version: RestaurantLock.version + 1}, synchronize_session=False)
+                version = None if updated == 0 else restaurant_version(restaurant_id)
+            if version is None: # the first booking of the restaurant
+                with db.session.begin_nested(): # only the insert is rolled back if it fails (the other locks are kept)
+                    db.session.add(RestaurantLock(restaurant_id=restaurant_id, version=1))
+                version = 1
+            db.session.info.setdefault("locked_restaurants", {})[restaurant_id] = version
+            return version
+        except IntegrityError: # the row has been created by another request meanwhile: update it
+            pass
+        except:
+            db.session.rollback()
+            return None
+    return None
+
+def restaurant_version(restaurant_id):
+    """ Return the version of the bookings of a restaurant (0 if they have never been locked) """
+    version = db.session.query(RestaurantLock.version).filter_by(restaurant_id = restaurant_id).scalar()
+    return 0 if version is None else version
+
+def get_occupancy(restaurant_id, version, starting_period):
+    """ Return the occupancy (see bookings.occupancy) of a restaurant at version, loading it from the db if needed
+
+    Only the bookings of the last OCCUPANCY_WINDOW hours (and the future ones) are kept.
+    Return None if the index is disabled or starting_period is before the window (the db must be queried).
+    """
+    index = current_app.extensions.get("occupancy")
+    if index is None:
+        return None
+
+    since = datetime.datetime.now() - datetime.timedelta(hours=current_app.config["OCCUPANCY_WINDOW"])
+    occupancy = index.get(restaurant_id, version, starting_period, since)
+    if occupancy is not None:
+        return occupancy
+
+    if starting_period < since:
+        return None
+    occupancy = RestaurantOccupancy(version, since)
+    bookings = db.session.query(Booking.id, Booking.table_id, Booking.booking_datetime).select_from(Booking)\
+        .filter(Booking.restaurant_id == restaurant_id)\
+        .filter(Booking.booking_datetime > since)
+    for booking_id, table_id, booking_datetime in bookings:
+        occupancy.add(booking_id, table_id, booking_datetime)
+    index.put(restaurant_id, occupancy)
+    return occupancy
+
+def warm_occupancy():
+    """ Load the occupancy of all the restaurants with bookings in the last OCCUPANCY_WINDOW hours (or in the future)
+
+    The versions are read before the bookings: if some bookings change meanwhile, 
+    the occupancy of the restaurant is just considered old (and loaded again when needed).
+    """
+    index = current_app.extensions.get("occupancy")
+    if index is None:
+        return
+
+    since = datetime.datetime.now() - datetime.timedelta(hours=current_app.config["OCCUPANCY_WINDOW"])
+    versions = dict(db.session.query(RestaurantLock.restaurant_id, RestaurantLock.version).all())
+    bookings = db.session.query(Booking.restaurant_id, Booking.id, Booking.table_id, Booking.booking_datetime).select_from(Booking)\
+        .filter(Booking.booking_datetime > since)
+
+    occupancies = {}
+    for restaurant_id, booking_id, table_id, booking_datetime in bookings:
+        if restaurant_id not in occupancies:
+            occupancies[restaurant_id] = RestaurantOccupancy(versions.get(restaurant_id, 0), since)
+        occupancies[restaurant_id].add(booking_id, table_id, booking_datetime)
+
+    index.discard()
+    for restaurant_id, occupancy in occupancies.items():
+        index.put(restaurant_id, occupancy)
+
+def invalidate_responses(tags=None):
+    """ Forget the cached responses with the tags (see bookings.responses), all of them if tags is None
+
+    Needed when the bookings are changed without the ORM (with the ORM it is done after each commit).
+    """
+    cache = current_app.extensions.get("response_cache")
+    if cache is None:
+        return
+    if tags is None:
+        cache.clear()
+    else:
+        cache.invalidate(tags)
+
+@event.listens_for(db.session, "after_flush")
+def record_booking_changes(session, flush_context):
+    """ Record the changes of the tables and datetimes of the bookings (applied to the occupancy index after the commit)
+    and the tags of the cached responses that could contain the changed bookings (invalidated after the commit)
+    """
+    tags = session.info.setdefault("response_tags", set())
+    for booking in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(booking, Booking):
+            state = inspect(booking)
+            old = lambda attr: list(getattr(state.attrs, attr).history.deleted or []) # the values before the change
+            tags.update(booking_tags(booking.id, [booking.user_id] + old("user_id"), [booking.restaurant_id] + old("restaurant_id"), [booking.table_id] + old("table_id")))
+    changes = session.info.setdefault("booking_changes", [])
+    for booking in session.new:
+        if isinstance(booking, Booking):
+            changes.append((booking.restaurant_id, booking.id, booking.table_id, booking.booking_datetime))
+    for booking in session.dirty:
+        if isinstance(booking, Booking):
+            state = inspect(booking)
+            if state.attrs.table_id.history.has_changes() or state.attrs.booking_datetime.history.has_changes():
+                changes.append((booking.restaurant_id, booking.id, booking.table_id, booking.booking_datetime))
+    for booking in session.deleted:
+        if isinstance(booking, Booking):
+            changes.append((booking.restaurant_id, booking.id, booking.table_id, None))
+
+@event.listens_for(db.session, "after_bulk_update")
+@event.listens_for(db.session, "after_bulk_delete")
+def record_bulk_changes(context):
+    """ Any booking could have been changed by a bulk update or delete: all the cached responses are invalidated after the commit """
+    if context.mapper.class_ is Booking:
+        context.session.info.setdefault("response_tags", set()).add("*")
+
+@event.listens_for(db.session, "after_commit")
+def apply_booking_changes(session):
+    """ Apply the committed changes of the bookings to the occupancy index and forget the cached responses containing them
+
+    The occupancy of a restaurant is updated only if it was locked in the transaction 
+    (so the version is known), otherwise it is discarded.
+    """
+    if session.in_nested_transaction(): # a savepoint
+        return
+    tags = session.info.pop("response_tags", None)
+    if tags and current_app:
+        invalidate_responses(tags)
+    changes = session.info.pop("booking_changes", [])
+    locked = session.info.pop("locked_restaurants", {})
+    index = current_app.extensions.get("occupancy") if current_app else None
+    if index is None:
+        return
+
+    by_restaurant = dict((r, []) for r in locked)
+    for restaurant_id, booking_id, table_id, booking_datetime in changes:
+        by_restaurant.setdefault(restaurant_id, []).append((booking_id, table_id, None if booking_datetime is None else naive(booking_datetime)))
+    for restaurant_id, restaurant_changes in by_restaurant.items():
+        if restaurant_id in locked:
+            index.apply(restaurant_id, locked[restaurant_id], restaurant_changes)
+        else:
+            index.discard(restaurant_id)
+
+@event.listens_for(db.session, "after_rollback")
+def forget_booking_changes(session):
+    """ Nothing has changed: forget the changes recorded in the transaction """
+    if session.in_nested_transaction(): # a savepoint
+        return
+    session.info.pop("booking_changes", None)
+    session.info.pop("locked_restaurants", None)
+    session.info.pop("response_tags", None)
+
+def get_a_table(restaurant_id, number_of_people, booking_datetime, excluded=-1, lock=False):
     """ Return a free table if it is available, otherwise
         - Return -1 if there are no free tables
         - Return -2 if the restaurant is closed
@@ -203,25 +650,47 @@ def get_a_table(restaurant_id, number_of_people, booking_datetime, excluded=-1):
                     add a seat (if the capacity of the table allows it) could not be accepted 
                     as the same booking would be seen as non-modifiable and 
                     another table would be searched, when maybe, what you already have is fine.
+        - lock: if true, the bookings of the restaurant are locked (see lock_restaurant) before searching the free tables. 
+                If a table is returned the lock is held: the caller must save the booking and commit (or rollback),
+                otherwise the lock is already released.
 
+    The tables are requested to the restaurant microservice while the restaurant profile is requested,
+    so the cost is one round trip instead of two (and the lock is not held during the remote calls).
     """
 
+    tables = fetch_tables(restaurant_id) # the list of tables of the restaurant (in background)
+
     is_open, rest = restaurant_is_open(restaurant_id, booking_datetime) # check is the restaurant is open on that date
     if is_open is None: # connection error with the restaurant microservice
         return None
     if not is_open: 
         return -2
 
-    tables = get_tables(restaurant_id) # return the list of tables of the restaurant
-
+    tables = tables.result()
     if tables is None: # connection error with the restaurant microservice
         return None
-    if tables == []:
-        return -1
+
+    if lock:
+        with metrics.LOCK_LATENCY.time():
+            version = lock_restaurant(restaurant_id)
+        if version is None: # db error
+            return None
+        version -= 1 # the occupancy before the changes of this transaction
+    else:
+        version = restaurant_version(restaurant_id)
 
     delta = int(rest["occupation_time"])
-    starting_period = booking_datetime - datetime.timedelta(hours=delta)
-    ending_period = booking_datetime + datetime.timedelta(hours=delta)
+    starting_period = naive(booking_datetime) - datetime.timedelta(hours=delta)
+    ending_period = naive(booking_datetime) + datetime.timedelta(hours=delta)
+
+    start = time.perf_counter()
+    occupancy = get_occupancy(restaurant_id, version, starting_period)
+    if occupancy is not None: # the occupied tables are not searched in the db
+        table = occupancy.free_table(tables, number_of_people, starting_period, ending_period, excluded)
+        metrics.INDEX_SEARCH.observe(time.perf_counter() - start)
+        if lock and table == -1:
+            db.session.rollback() # release the lock
+        return table
 
     # the list of the tables occupied or booked in the same period as the booking
     occupied = db.session.query(Booking.table_id).select_from(Booking)\
@@ -230,14 +699,161 @@ def get_a_table(restaurant_id, number_of_people, booking_datetime, excluded=-1):
         .filter(Booking.booking_datetime < ending_period )\
         .filter(Booking.id != excluded)\
         .all()
-        
-    free_tables = [t for t in tables if ( ((t["id"],) not in occupied) and (t["capacity"] >= number_of_people) )] # returns the free table usable by this number of people
+    metrics.DATABASE_SEARCH.observe(time.perf_counter() - start)
+
+    table = free_table(tables, set(t for (t,) in occupied), number_of_people)
+    if lock and table == -1:
+        db.session.rollback() # release the lock
+    return table
+
+def free_table(tables, occupied, number_of_people):
+    """ Return the smaller table that is not occupied and can be used by number_of_people, otherwise -1
+
+    Parameters:
+        - tables: the tables of the restaurant (json)
+        - occupied: the set of the ids of the occupied tables
+        - number_of_people: the number of people for the booking
+    """
+    free_tables = [t for t in tables if ( (t["id"] not in occupied) and (t["capacity"] >= number_of_people) )] # returns the free table usable by this number of people
     free_tables.sort(key=lambda x:x["capacity"]) # order the tables from the smaller
 
     if free_tables == []: # no free tables
         return -1
     return free_tables[0]["id"] # return the smaller table that can be used
 
+def allocate_tables(bookings, lock=False):
+    """ Find a free table for each of the requested bookings (as get_a_table, but for many bookings at once)
+
+    Return a list with the result of each booking (in the same order): 
+    a free table, -1 if there are no free tables, -2 if the restaurant is closed 
+    or None if it is impossible to connect with the restaurant microservice.
+
+    The profile and the tables of each restaurant are requested once (all the restaurants concurrently),
+    the occupied tables of each restaurant are read with a single query
+    and a table given to a booking is considered occupied for the following ones.
+
+    Parameters:
+        - bookings: a list of (restaurant_id, number_of_people, booking_datetime)
+        - lock: if true, the bookings of all the restaurants are locked (as in get_a_table) after the remote calls.
+                The lock is held: the caller must save the bookings and commit (or rollback).
+    """
+    restaurant_ids = list(dict.fromkeys(b[0] for b in bookings))
+    restaurants = dict((r, fetch_restaurant(r)) for r in restaurant_ids)
+    tables = dict((r, fetch_tables(r)) for r in restaurant_ids)
+
+    results = [None] * len(bookings)
+    if lock:
+        for r in restaurant_ids: # wait for the remote calls before locking
+            restaurants[r].result()
+            tables[r].result()
+        for r in sorted(restaurant_ids): # always in the same order (no deadlocks between the requests)
+            if lock_restaurant(r) is None: # db error
+                return results
+    for r in restaurant_ids:
+        rest = restaurants[r].result()
+        rest_tables = tables[r].result()
+        if rest is None or rest_tables is None: # connection error with the restaurant microservice
+            continue
+
+        schedule = Schedule.of(rest)
+        requested = []
+        for i,b in enumerate(bookings):
+            if b[0] == r:
+                if schedule.is_open(b[2]):
+                    requested.append(i)
+                else:
+                    results[i] = -2
+        if requested == []:
+            continue
+
+        # the bookings (table, datetime) of the restaurant in the period covered by all the requested bookings
+        delta = datetime.timedelta(hours=int(rest["occupation_time"]))
+        starting_period = min(naive(bookings[i][2]) for i in requested) - delta
+        ending_period = max(naive(bookings[i][2]) for i in requested) + delta
+        booked = db.session.query(Booking.table_id, Booking.booking_datetime).select_from(Booking)\
+            .filter(Booking.restaurant_id == r)\
+            .filter(starting_period < Booking.booking_datetime)\
+            .filter(Booking.booking_datetime < ending_period )\
+            .all()
+        booked = [tuple(b) for b in booked]
+
+        for i in requested:
+            booking_datetime = naive(bookings[i][2])
+            occupied = set(t for t,d in booked if booking_datetime - delta < d < booking_datetime + delta)
+            results[i] = free_table(rest_tables, occupied, bookings[i][1])
+            if results[i] != -1:
+                booked.append((results[i], booking_datetime)) # occupied for the following bookings
+
+    return results
+
+def available_slots(restaurant_id, number_of_people, begin, end, step):
+    """ Return the datetimes from begin to end (every step) at which a booking for number_of_people can be made
+
+    A slot is available if it is in the future, the restaurant is open
+    and at least a table that can be used by number_of_people is free (as in get_a_table).
+
+    The profile and the tables of the restaurant are requested once (concurrently)
+    and the bookings of the whole period are read with a single query. 
+    Then, for each table, the slots and the bookings (both sorted) are swept together,
+    so the cost is linear in the number of slots plus the number of bookings.
+
+    Return None if it is impossible to connect with the restaurant microservice.
+
+    Parameters:
+        - begin, end: the period (datetimes)
+        - step: the time between two slots (timedelta)
+    """
+    tables = fetch_tables(restaurant_id)
+    rest = get_restaurant(restaurant_id)
+    tables = tables.result()
+    if rest is None or tables is None: # connection error with the restaurant microservice
+        return None
+
+    now = datetime.datetime.now(begin.tzinfo)
+    slots = []
+    slot = begin
+    while slot <= end:
+        if slot > now:
+            slots.append(slot)
+        slot += step
+    slots = [s for s,o in zip(slots, Schedule.of(rest).are_open(slots)) if o]
+
+    tables = [t for t in tables if t["capacity"] >= number_of_people]
+    if slots == [] or tables == []:
+        return []
+
+    delta = datetime.timedelta(hours=int(rest["occupation_time"]))
+    stored = slots if begin.tzinfo is None else [naive(s) for s in slots]
+    starts = [s - delta for s in stored] # the periods occupied by a booking in each slot
+    ends = [s + delta for s in stored]
+
+    booked = {} # table id -> sorted datetimes of its bookings in the period
+    q = db.session.query(Booking.table_id, Booking.booking_datetime).select_from(Booking)\
+        .filter(Booking.restaurant_id == restaurant_id)\
+        .filter(starts[0] < Booking.booking_datetime)\
+        .filter(Booking.booking_datetime < ends[-1])\
+        .order_by(Booking.booking_datetime)
+    for table_id, booking_datetime in q:
+        booked.setdefault(table_id, []).append(booking_datetime)
+
+    free = [False] * len(slots)
+    for table in tables:
+        bookings = booked.get(table["id"], [])
+        j = 0 # the first booking after the start of the slot
+        for i in range(len(slots)):
+            if free[i]:
+                continue
+            while j < len(bookings) and bookings[j] <= starts[i]:
+                j += 1
+            if j == len(bookings) or bookings[j] >= ends[i]: # no bookings in the period
+                free[i] = True
+
+    return [s for s,f in zip(slots, free) if f]
+
+def naive(booking_datetime):
+    """ Return the datetime as it is stored in the database (without the timezone) """
+    return booking_datetime.replace(tzinfo=None)
+
 def restaurant_is_open(restaurant_id, booking_datetime):
     """ Check if a restaurant is open in a given datetime
 
@@ -249,28 +865,11 @@ def restaurant_is_open(restaurant_id, booking_datetime):
     if rest is None: # error with the microservice
         return (None,None)
     else:
-        if (booking_datetime.weekday()+1) in rest["closed_days"]:
-            return (False,rest)
-        
-        now = datetime.datetime.now()
-
-        booking = now.replace( hour=booking_datetime.hour, minute=booking_datetime.minute, second=0, microsecond=0 )
-
-        if rest["first_opening_hour"] is not None and rest["first_closing_hour"] is not None:
-            opening = now.replace( hour=int(rest["first_opening_hour"]), minute=0, second=0, microsecond=0 )
-            closing = now.replace( hour=int(rest["first_closing_hour"]), minute=0, second=0, microsecond=0 )
-
-            if opening <= booking <= closing:
-                return (True,rest)
-
-        if rest["second_opening_hour"] is not None and rest["second_closing_hour"] is not None:
-            opening = now.replace( hour=int(rest["second_opening_hour"]), minute=0, second=0, microsecond=0 )
-            closing = now.replace( hour=int(rest["second_closing_hour"]), minute=0, second=0, microsecond=0 )
-
-            if opening <= booking <= closing:
-                return (True,rest)
+        return (is_open(rest, booking_datetime),rest)
 
-        return (False,rest)
+def is_open(rest, booking_datetime):
+    """ Check if a restaurant (json) is open in a given datetime (see bookings.schedule) """
+    return Schedule.of(rest).is_open(booking_datetime)
 
 
 def put_fake_data():
@@ -1,8 +1,11 @@
 from datetime import datetime
 
 import datetime
+import json
 import requests
 
+from urllib.parse import urljoin
+
 BOOKINGS_SERVICE = "http://localhost:8080/"
 TIMEOUT = 2
 
@@ -20,6 +23,24 @@ def _get(url):
     except:
         return None,None
 
+def _get_page(url):
+    """ Makes a get request with a timeout.
+
+    Returns the json object with the status code and the url of the next page (or None)
+    (or None, None, None in case of timeout).
+    """
+    try:
+        r = requests.get(url, timeout=TIMEOUT)
+        next_page = r.links.get("next",{}).get("url")
+        if next_page is not None:
+            next_page = urljoin(BOOKINGS_SERVICE, next_page)
+        try:
+            return r.json(), r.status_code, next_page
+        except:
+            return None, r.status_code, next_page
+    except:
+        return None,None,None
+
 def _post(url,json):
     """ Makes a post request with a timeout.
 
@@ -63,7 +84,7 @@ def _delete(url):
         return None,None
 
 
-def get_bookings(user=None, rest=None, table=None, begin=None, end=None, begin_entrance=None, end_entrance=None):
+def _bookings_url(user=None, rest=None, table=None, begin=None, end=None, begin_entrance=None, end_entrance=None, limit=None, after_id=None, fields=None):
     url = BOOKINGS_SERVICE+"bookings?"
 
     if user is not None:
@@ -87,7 +108,47 @@ def get_bookings(user=None, rest=None, table=None, begin=None, end=None, begin_e
     if end_entrance is not None:
         url += "end_entrance="+str(end_entrance)+"&"
 
-    return _get(url)
+    if limit is not None:
+        url += "limit="+str(limit)+"&"
+
+    if after_id is not None:
+        url += "after_id="+str(after_id)+"&"
+
+    if fields is not None:
+        url += "fields="+",".join(fields)+"&"
+
+    return url
+
+def get_bookings(user=None, rest=None, table=None, begin=None, end=None, begin_entrance=None, end_entrance=None, limit=None, after_id=None, fields=None):
+    return _get(_bookings_url(user, rest, table, begin, end, begin_entrance, end_entrance, limit, after_id, fields))
+
+def iter_bookings(user=None, rest=None, table=None, begin=None, end=None, begin_entrance=None, end_entrance=None, page_size=100, fields=None):
+    """ Iterates over all the bookings that match the filters, one page at a time.
+
+    Yields the bookings, stops at the last page 
+    (raises an exception if a page cannot be read).
+    """
+    url = _bookings_url(user, rest, table, begin, end, begin_entrance, end_entrance, page_size, None, fields)
+    while url is not None:
+        bookings, status_code, url = _get_page(url)
+        if status_code != 200:
+            raise RuntimeError("Impossible to get the bookings: "+str(status_code)+" "+str(bookings))
+        for b in bookings:
+            yield b
+
+def stream_bookings(user=None, rest=None, table=None, begin=None, end=None, begin_entrance=None, end_entrance=None, fields=None):
+    """ Iterates over all the bookings that match the filters while they are received (newline delimited json).
+
+    Yields the bookings without keeping them in memory 
+    (raises an exception if they cannot be read).
+    """
+    url = _bookings_url(user, rest, table, begin, end, begin_entrance, end_entrance, None, None, fields)
+    with requests.get(url, headers={"Accept":"application/x-ndjson"}, stream=True, timeout=TIMEOUT) as r:
+        if r.status_code != 200:
+            raise RuntimeError("Impossible to get the bookings: "+str(r.status_code)+" "+r.text)
+        for line in r.iter_lines():
+            if line:
+                yield json.loads(line)
 
 def get_a_booking(id):
     return _get(BOOKINGS_SERVICE+"bookings/"+str(id))
@@ -102,6 +163,17 @@ def new_booking(user_id, rest_id, number_of_people, booking_datetime):
 
     return _post(BOOKINGS_SERVICE+"bookings",booking)
 
+def new_bookings(bookings):
+    """ Makes many bookings at once (a list of dict with user_id, rest_id, number_of_people and booking_datetime) """
+    bookings = [{
+        "user_id":b["user_id"],
+        "restaurant_id":b["rest_id"],
+        "number_of_people":b["number_of_people"],
+        "booking_datetime":b["booking_datetime"],
+    } for b in bookings]
+
+    return _post(BOOKINGS_SERVICE+"bookings/batch",bookings)
+
 def edit_booking(booking_id, number_of_people=None, booking_datetime=None, entrance=False):
     booking = {
     }
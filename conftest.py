@@ -0,0 +1,21 @@
+import contextlib
+
+import pytest
+
+from bookings.statements import recording
+
+@pytest.fixture
+def query_budget(request):
+    """ A context manager failing the test if its block runs more statements on the database than a budget
+
+        with self.query_budget(2): # in a unittest.TestCase marked with @pytest.mark.usefixtures("query_budget")
+            client.get('/bookings/1')
+    """
+    @contextlib.contextmanager
+    def budget(statements):
+        with recording() as run:
+            yield run
+        assert len(run) <= statements, "%d statements, the budget is %d:\n%s" % (len(run), statements, "\n".join(run))
+    if request.instance is not None:
+        request.instance.query_budget = budget
+    return budget
@@ -4,12 +4,28 @@ case "$1" in
     "unittests-report")
         pytest --cov=bookings --cov-report term-missing --cov-report html --html=report.html
         ;;
+    "benchmarks")
+        pytest benchmarks/bench_micro.py --benchmark-autosave
+        shift
+        python3 benchmarks/suite.py "$@"
+        ;;
+    "fake-data")
+        shift
+        python3 -m bookings.fake_data "$@"
+        ;;
     "unittests")
         pytest --cov=bookings
         ;;
+    "docker-unittests-postgres")
+        # the unit tests in docker, on a PostgreSQL database (see docker-compose.test.yml)
+        docker compose -f docker-compose.test.yml build unittests && docker compose -f docker-compose.test.yml run --rm unittests
+        status=$?
+        docker compose -f docker-compose.test.yml down
+        exit $status
+        ;;
     "setup")
         pip3 install -r requirements.txt
-        pip3 install pytest pytest-cov
+        pip3 install pytest pytest-cov pytest-benchmark
         pip3 install pytest-html
         ;;
     "docker-build")
@@ -24,6 +40,10 @@ case "$1" in
         fi
         ;;
     *)
-        python3 bookings/app.py "$1"
+        # the metrics of all the server processes are collected here (emptied at every start)
+        export PROMETHEUS_MULTIPROC_DIR="${PROMETHEUS_MULTIPROC_DIR:-/tmp/bookings_metrics}"
+        rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+        mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+        exec python3 bookings/app.py "$1"
         ;;
 esac
\ No newline at end of file